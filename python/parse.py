@@ -14,6 +14,7 @@ sys.path.insert(0,os.path.abspath(os.path.join(__file__,'../src')))
 #END RELEASE
 from html5lib import html5parser, liberalxmlparser, sanitizer
 from html5lib.tokenizer import HTMLTokenizer
+from html5lib.tabletokenizer import TableDrivenTokenizer
 from html5lib import treebuilders, serializer, treewalkers
 from html5lib import constants
 
@@ -49,6 +50,8 @@ def parse():
 
     if opts.sanitize:
         tokenizer = sanitizer.HTMLSanitizer
+    elif opts.tabletokenizer:
+        tokenizer = TableDrivenTokenizer
     else:
         tokenizer = HTMLTokenizer
 
@@ -196,6 +199,10 @@ def getOptParser():
     parser.add_option("", "--sanitize", action="store_true", default=False,
                       dest="sanitize", help="sanitize")
 
+    parser.add_option("", "--table-tokenizer", action="store_true",
+                      default=False, dest="tabletokenizer",
+                      help="use the table driven tokenizer")
+
     parser.add_option("", "--liberal-xml-parser", action="store_true", default=False,
                       dest="liberalxml", help="parse with liberal xml parser")
 
@@ -0,0 +1,103 @@
+"""Limits on the resources parsing a document may use.
+
+A ParseBudget given to HTMLParser stops parsing a document when it takes too
+long, makes the tree too deep or too big, has an element with too many
+attributes or has too many tokens. The parser then returns the tree built so
+far and sets its budgetExceeded attribute to the name of the limit, one of
+"time", "depth", "nodes", "attributes" or "tokens". It is None for documents
+parsed in full.
+
+The checks are made as the parser goes, so they need to be cheap: tokens are
+counted by the parser's main loop, which only calls checkTokens every
+checkInterval tokens to look at the time, and elements are checked by the
+tree builder as they are inserted.
+"""
+
+import sys
+import time
+
+from constants import BudgetExceeded
+
+# The limit used for each resource that isn't limited, so that the checks
+# don't have to look for None
+unlimited = sys.maxint
+
+class ParseBudget(object):
+    def __init__(self, maxTime=None, maxDepth=None, maxNodes=None,
+                 maxAttributes=None, maxTokens=None, checkInterval=64):
+        """
+        maxTime - the most seconds of wall time to spend on a document
+
+        maxDepth - the most elements that may be open, i.e. the deepest
+        an element may be nested
+
+        maxNodes - the most elements and comments in the tree. Text is not
+        counted, as adjacent text is joined into one node
+
+        maxAttributes - the most attributes an element may have
+
+        maxTokens - the most tokens the parser may take from the tokenizer,
+        parse errors included
+
+        checkInterval - the number of tokens between looks at the time
+
+        Limits that are None are not applied.
+        """
+        self.maxTime = maxTime
+        self.maxDepth = self.limit(maxDepth)
+        self.maxNodes = self.limit(maxNodes)
+        self.maxAttributes = self.limit(maxAttributes)
+        self.maxTokens = self.limit(maxTokens)
+        self.checkInterval = checkInterval
+        self.deadline = None
+        self.reset()
+
+    def limit(self, value):
+        if value is None:
+            return unlimited
+        return value
+
+    def start(self):
+        """Start on a new document"""
+        if self.maxTime is not None:
+            self.deadline = time.time() + self.maxTime
+        self.reset()
+
+    def reset(self):
+        """Start the counts again, e.g. for a document that is being parsed
+        again from the start in a different encoding. The time limit still
+        runs from start()"""
+        self.tokens = 0
+        self.nodes = 0
+        self.nextCheck = self.nextTokenCheck()
+
+    def nextTokenCheck(self):
+        if self.maxTokens == unlimited:
+            return self.tokens + self.checkInterval
+        return min(self.tokens + self.checkInterval, self.maxTokens + 1)
+
+    def checkTokens(self):
+        """Called by the parser when the token count reaches nextCheck"""
+        if self.tokens > self.maxTokens:
+            raise BudgetExceeded("tokens")
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded("time")
+        self.nextCheck = self.nextTokenCheck()
+
+    def checkElement(self, depth, attributes):
+        """Called by the tree builder before it inserts an element, with the
+        number of elements that will then be open and the attributes"""
+        self.nodes += 1
+        if self.nodes > self.maxNodes:
+            raise BudgetExceeded("nodes")
+        if depth > self.maxDepth:
+            raise BudgetExceeded("depth")
+        if len(attributes) > self.maxAttributes:
+            raise BudgetExceeded("attributes")
+
+    def checkNode(self, count=1):
+        """Called for other nodes: comments, before they are inserted, and
+        copies of elements, once the adoption agency algorithm is done"""
+        self.nodes += count
+        if self.nodes > self.maxNodes:
+            raise BudgetExceeded("nodes")
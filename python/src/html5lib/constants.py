@@ -1102,3 +1102,18 @@ class DataLossWarning(UserWarning):
 
 class ReparseException(Exception):
     pass
+
+class BudgetExceeded(Exception):
+    """Raised when a document goes over one of the limits of a
+    budget.ParseBudget; the argument is the name of the limit"""
+    pass
+
+class ParsingStopped(Exception):
+    """Raised when the stop condition given to the parser for a document
+    is met"""
+    pass
+
+class NeedMoreData(Exception):
+    """Raised by an incremental input stream that has run out of the data fed
+    to it so far but has not been closed yet"""
+    pass
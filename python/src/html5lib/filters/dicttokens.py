@@ -0,0 +1,13 @@
+import _base
+from html5lib.tokens import dictToken
+
+class Filter(_base.Filter):
+    """Turn the tuple tokens emitted in compact mode back into dicts, so that
+    a compact token stream can be passed on to filters and serializers that
+    expect dict tokens. Dict tokens are passed through untouched."""
+
+    def __iter__(self):
+        for token in _base.Filter.__iter__(self):
+            if token.__class__ is tuple:
+                token = dictToken(token)
+            yield token
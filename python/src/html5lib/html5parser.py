@@ -18,7 +18,10 @@ from constants import contentModelFlags, spaceCharacters, asciiUpper2Lower
 from constants import scopingElements, formattingElements, specialElements
 from constants import headingElements, tableInsertModeElements
 from constants import cdataElements, rcdataElements, voidElements
-from constants import tokenTypes, ReparseException
+from constants import tokenTypes, ReparseException, BudgetExceeded
+from constants import ParsingStopped
+
+specialOrScopingElements = specialElements | scopingElements
 
 def parse(doc, treebuilder="simpletree", encoding=None):
     tb = treebuilders.getTreeBuilder(treebuilder)
@@ -30,7 +33,9 @@ class HTMLParser(object):
         malformed) HTML"""
 
     def __init__(self, tree = simpletree.TreeBuilder,
-                 tokenizer = tokenizer.HTMLTokenizer, strict = False):
+                 tokenizer = tokenizer.HTMLTokenizer, strict = False,
+                 compactTokens = False, chunkSize = None,
+                 charsetDetector = None, budget = None):
         """
         strict - raise an exception when a parse error is encountered
 
@@ -41,15 +46,59 @@ class HTMLParser(object):
         tokenizer - a class that provides a stream of tokens to the treebuilder.
         This may be replaced for e.g. a sanitizer which converts some tags to
         text
+
+        compactTokens - have the tokenizer emit tuples rather than dicts (see
+        html5lib.tokens), which is cheaper. The tokenizer class must accept a
+        compactTokens argument; this bypasses normalizeToken
+
+        chunkSize - the number of bytes of the input to decode at a time, or
+        "adaptive"; see HTMLInputStream. The tokenizer class must accept a
+        chunkSize argument
+
+        charsetDetector - a callable to guess the encoding of documents that
+        don't say what it is with, rather than chardet, such as an
+        inputstream.CharsetDetector. It is used when useChardet is True; a
+        callable can be passed as useChardet for a single document too
+
+        budget - a budget.ParseBudget limiting the time, tree depth, number of
+        nodes, attributes per element and tokens for each document. Parsing
+        stops at the first limit exceeded; the tree built so far is returned
+        and budgetExceeded says which limit it was
         """
 
         # Raise an exception on the first error encountered
         self.strict = strict
+        self.compactTokens = compactTokens
+        self.chunkSize = chunkSize
+        self.charsetDetector = charsetDetector
+        self.budget = budget
 
         self.tree = tree()
+        self.tree.budget = budget
         self.tokenizer_class = tokenizer
         self.errors = []
 
+        # The tokenizer of the last document, and the arguments it was created
+        # with other than those for the input stream
+        self.tokenizer = None
+        self.tokenizerArgs = None
+
+        # Input stream of a document being parsed with feed()
+        self.pushStream = None
+
+        # Number of times the last document was parsed again from the start
+        # because a meta element changed its encoding
+        self.reparses = 0
+
+        # The name of the limit of the budget that stopped the last document
+        # being parsed, or None if it was parsed to the end
+        self.budgetExceeded = None
+
+        # The stop condition of the document being parsed (see parse), and
+        # whether it stopped the last document being parsed
+        self.stop = None
+        self.stopped = False
+
         # "quirks" / "limited-quirks" / "no-quirks"
         self.compatMode = "no quirks"
 
@@ -79,24 +128,69 @@ class HTMLParser(object):
         }
 
     def _parse(self, stream, innerHTML=False, container="div",
-               encoding=None, parseMeta=True, useChardet=True, **kwargs):
+               encoding=None, parseMeta=True, useChardet=True, stopAfter=None,
+               **kwargs):
 
         self.innerHTMLMode = innerHTML
         self.container = container
-        self.tokenizer = self.tokenizer_class(stream, encoding=encoding,
-                                              parseMeta=parseMeta,
-                                              useChardet=useChardet, **kwargs)
+        self.pushStream = None
+        self.budgetExceeded = None
+        self.stopped = False
+        self.tokenizer = self.createTokenizer(stream, encoding, parseMeta,
+                                              useChardet, **kwargs)
+        self.reparses = 0
         self.reset()
+        self.stop = self.stopCondition(stopAfter)
+        if self.budget is not None:
+            self.budget.start()
 
         while True:
             try:
                 self.mainLoop()
                 break
             except ReparseException, e:
-                self.reset()
+                self.reparse()
+            except BudgetExceeded, e:
+                self.budgetExceeded = e.args[0]
+                break
+            except ParsingStopped:
+                self.stopped = True
+                break
+
+    def createTokenizer(self, stream, encoding=None, parseMeta=True,
+                        useChardet=True, **kwargs):
+        """Return a tokenizer for a new document. The tokenizer of the last
+        document is reset and used again if it has a reset method and the
+        same tokenizer class and arguments apply"""
+        if self.compactTokens:
+            kwargs["compactTokens"] = True
+        if self.chunkSize is not None:
+            kwargs["chunkSize"] = self.chunkSize
+        if useChardet is True and self.charsetDetector is not None:
+            useChardet = self.charsetDetector
+        tokenizer = self.tokenizer
+        if (tokenizer is not None and
+            tokenizer.__class__ is self.tokenizer_class and
+            hasattr(tokenizer, "reset") and kwargs == self.tokenizerArgs):
+            tokenizer.reset(stream, encoding, parseMeta, useChardet)
+        else:
+            tokenizer = self.tokenizer_class(stream, encoding=encoding,
+                                             parseMeta=parseMeta,
+                                             useChardet=useChardet, **kwargs)
+            self.tokenizerArgs = kwargs
+        return tokenizer
+
+    def stopCondition(self, stopAfter):
+        """The callable that says when to stop parsing a document, for the
+        stopAfter argument of parse"""
+        if stopAfter is None or callable(stopAfter):
+            return stopAfter
+        return StopAfterPhase(self, stopAfter)
 
     def reset(self):
         self.tree.reset()
+        for phase in self.phases.itervalues():
+            phase.reset()
         self.firstStartTag = False
         self.errors = []
         self.compatMode = "no quirks"
@@ -127,6 +221,17 @@ class HTMLParser(object):
         self.beforeRCDataPhase = None
         
     def mainLoop(self):
+        if self.compactTokens:
+            self.compactMainLoop()
+        else:
+            self.dictMainLoop()
+
+        # When the loop finishes it's EOF, unless the document is being fed
+        # to us and the data so far has run out
+        if self.pushStream is None or self.pushStream.closed:
+            self.phase.processEOF()
+
+    def dictMainLoop(self):
         (CharactersToken, 
          SpaceCharactersToken, 
          StartTagToken,
@@ -138,8 +243,14 @@ class HTMLParser(object):
                           tokenTypes["EndTag"],
                           tokenTypes["Comment"],
                           tokenTypes["Doctype"])
+        budget = self.budget
+        stop = self.stop
 
         for token in self.normalizedTokens():
+            if budget is not None:
+                budget.tokens += 1
+                if budget.tokens >= budget.nextCheck:
+                    budget.checkTokens()
             type = token["type"]
             if type == CharactersToken:
                 self.phase.processCharacters(token["data"])
@@ -156,27 +267,192 @@ class HTMLParser(object):
                 token["systemId"], token["correct"])
             else:
                 self.parseError(token["data"], token.get("datavars", {}))
+            if stop is not None and stop(self):
+                raise ParsingStopped
+
+    def compactMainLoop(self):
+        """Version of mainLoop for tuple tokens, which also takes care of
+        what normalizeToken does for dict tokens"""
+        (CharactersToken,
+         SpaceCharactersToken,
+         StartTagToken,
+         EmptyTagToken,
+         EndTagToken,
+         CommentToken,
+         DoctypeToken) = (tokenTypes["Characters"],
+                          tokenTypes["SpaceCharacters"],
+                          tokenTypes["StartTag"],
+                          tokenTypes["EmptyTag"],
+                          tokenTypes["EndTag"],
+                          tokenTypes["Comment"],
+                          tokenTypes["Doctype"])
+        budget = self.budget
+        stop = self.stop
 
-        # When the loop finishes it's EOF
-        self.phase.processEOF()
+        for token in self.tokenizer:
+            if budget is not None:
+                budget.tokens += 1
+                if budget.tokens >= budget.nextCheck:
+                    budget.checkTokens()
+            type = token[0]
+            if type == CharactersToken:
+                self.phase.processCharacters(token[1])
+            elif type == SpaceCharactersToken:
+                self.phase.processSpaceCharacters(token[1])
+            elif type == StartTagToken:
+                self.phase.processStartTag(token[1], dict(token[2][::-1]))
+            elif type == EndTagToken:
+                self.phase.processEndTag(token[1])
+            elif type == EmptyTagToken:
+                if token[1] not in voidElements:
+                    self.parseError("incorrectly-placed-solidus")
+                self.phase.processStartTag(token[1], dict(token[2][::-1]))
+            elif type == CommentToken:
+                self.phase.processComment(token[1])
+            elif type == DoctypeToken:
+                self.phase.processDoctype(*token[1:])
+            else:
+                self.parseError(token[1], token[2] or {})
+            if stop is not None and stop(self):
+                raise ParsingStopped
 
     def normalizedTokens(self):
         for token in self.tokenizer:
             yield self.normalizeToken(token)
 
-    def parse(self, stream, encoding=None, parseMeta=True, useChardet=True):
+    def parse(self, stream, encoding=None, parseMeta=True, useChardet=True,
+              stopAfter=None):
         """Parse a HTML document into a well-formed tree
 
-        stream - a filelike object or string containing the HTML to be parsed
+        stream - a filelike object, file descriptor or string containing the
+        HTML to be parsed. Regular files are memory mapped
 
         The optional encoding parameter must be a string that indicates
         the encoding.  If specified, that encoding will be used,
         regardless of any BOM or later declaration (such as in a meta
         element)
+
+        useChardet - guess the encoding if neither a BOM nor a meta element
+        gives it, with the parser's charsetDetector or chardet. A callable
+        taking a sample of the document's bytes can be given instead, e.g.
+        the detector from inputstream.CharsetDetector.forOrigin for the site
+        the document is from
+
+        stopAfter - stop parsing the document early, leaving the rest of it
+        unread. Either the name of one of the phases before the body,
+        "initial", "beforeHtml", "beforeHead", "inHead" or "afterHead", to
+        stop once the parser has gone past that phase (e.g. "afterHead" for
+        the whole head, including the elements that belong in it but come
+        after its end tag), or a callable, which is called with the parser
+        after each token and stops it when it returns true. The tree built
+        so far is returned and stopped is set
+
+        The parser can be used for any number of documents, one after the
+        other; each starts from a clean state. See also parseMany
         """
-        self._parse(stream, innerHTML=False, encoding=encoding)
+        self._parse(stream, innerHTML=False, encoding=encoding,
+                    parseMeta=parseMeta, useChardet=useChardet,
+                    stopAfter=stopAfter)
         return self.tree.getDocument()
+
+    def parseMany(self, documents, encoding=None, parseMeta=True,
+                  useChardet=True, container=None, stopAfter=None):
+        """Parse each of a sequence of documents in turn, yielding the trees
+        one at a time. The parser's phases and tokenizer are reused for all of
+        them, which makes this the cheapest way to parse many small documents.
+        While a tree is being looked at, self.errors holds the errors found in
+        that document
+
+        documents - an iterable of documents, each of which can be anything
+        parse accepts
+
+        container - if given, parse the documents as fragments of an element
+        with this name, as parseFragment does; stopAfter doesn't apply to
+        them
+
+        The other arguments are as for parse and apply to every document
+        """
+        for document in documents:
+            if container is None:
+                yield self.parse(document, encoding, parseMeta, useChardet,
+                                 stopAfter)
+            else:
+                yield self.parseFragment(document, container, encoding,
+                                         parseMeta, useChardet)
     
+    def feed(self, data, encoding=None, stopAfter=None):
+        """Parse the next piece of a document that arrives a piece at a time,
+        e.g. from the network. The tree is built as far as the data fed so
+        far allows; call close() after the last piece to get the document.
+
+        data - a string or unicode object. Unicode and byte strings cannot be
+        mixed in one document. Pieces may end anywhere, even inside a tag,
+        entity, CR LF pair or multibyte character
+
+        The optional encoding parameter is only looked at on the first
+        call. If specified, that encoding will be used, regardless of any BOM
+        or later declaration (such as in a meta element)
+
+        stopAfter - as for parse, and also only looked at on the first call.
+        Once parsing has stopped the pieces fed are ignored, so stopped can
+        be checked to stop fetching them
+        """
+        if self.pushStream is None:
+            self.pushStream = inputstream.HTMLPushInputStream(
+                encoding, chardet=self.charsetDetector or True)
+            self.innerHTMLMode = False
+            self.container = "div"
+            self.budgetExceeded = None
+            self.stopped = False
+            self.tokenizer = self.createTokenizer(self.pushStream)
+            self.reparses = 0
+            self.reset()
+            self.stop = self.stopCondition(stopAfter)
+            if self.budget is not None:
+                self.budget.start()
+        # Once the budget is exceeded or the stop condition is met the rest
+        # of the document is ignored
+        if self.budgetExceeded is not None or self.stopped:
+            return
+        self.pushStream.feed(data)
+        self.parseFedData()
+
+    def close(self):
+        """Finish parsing a document given to feed() and return it"""
+        if self.pushStream is None:
+            self.feed("")
+        self.pushStream.close()
+        self.parseFedData()
+        self.pushStream = None
+        return self.tree.getDocument()
+
+    def parseFedData(self):
+        if self.budgetExceeded is not None or self.stopped:
+            return
+        while True:
+            try:
+                self.mainLoop()
+                break
+            except ReparseException, e:
+                self.reparse()
+            except BudgetExceeded, e:
+                self.budgetExceeded = e.args[0]
+                break
+            except ParsingStopped:
+                self.stopped = True
+                break
+
+    def reparse(self):
+        """Start again on a document whose input stream has gone back to the
+        start to decode it in another encoding. The stream only does so when
+        the text already read would be different in the new encoding"""
+        self.reparses += 1
+        if hasattr(self.tokenizer, "reset"):
+            self.tokenizer.reset(self.tokenizer.stream)
+        self.reset()
+        if self.budget is not None:
+            self.budget.reset()
+
     def parseFragment(self, stream, container="div", encoding=None,
                       parseMeta=False, useChardet=True):
         """Parse a HTML fragment into a well-formed tree fragment
@@ -184,14 +460,16 @@ class HTMLParser(object):
         container - name of the element we're setting the innerHTML property
         if set to None, default to 'div'
 
-        stream - a filelike object or string containing the HTML to be parsed
+        stream - a filelike object, file descriptor or string containing the
+        HTML to be parsed. Regular files are memory mapped
 
         The optional encoding parameter must be a string that indicates
         the encoding.  If specified, that encoding will be used,
         regardless of any BOM or later declaration (such as in a meta
         element)
         """
-        self._parse(stream, True, container=container, encoding=encoding)
+        self._parse(stream, True, container=container, encoding=encoding,
+                    parseMeta=parseMeta, useChardet=useChardet)
         return self.tree.getFragment()
 
     def parseError(self, errorcode="XXX-undefined-error", datavars={}):
@@ -278,6 +556,56 @@ class HTMLParser(object):
 
         self.phase = self.phases["inCDataRCData"]
 
+class StopAfterPhase(object):
+    """Stop condition that is true once the parser has gone past one of the
+    phases before the body. The text of title, style and script elements
+    doesn't count as leaving the head"""
+
+    phaseOrder = ("initial", "beforeHtml", "beforeHead", "inHead",
+                  "afterHead")
+
+    def __init__(self, parser, phase):
+        if phase not in self.phaseOrder:
+            raise ValueError("Parsing can't stop after the %s phase" % phase)
+        names = self.phaseOrder[:list(self.phaseOrder).index(phase) + 1]
+        names += ("inCDataRCData",)
+        self.phases = frozenset([parser.phases[name] for name in names])
+
+    def __call__(self, parser):
+        return parser.phase not in self.phases
+
+class PhaseType(type):
+    """Metaclass of the phases. The start and end tag handlers of a phase are
+    listed in its startTagMethods and endTagMethods attributes, as (tag names,
+    method name) pairs. When the class is created they are turned into the
+    startTagHandler and endTagHandler tables, which map each tag name to the
+    function itself, with startTagOther and endTagOther as the defaults. This
+    happens once per class rather than for every parser, and subclasses get
+    tables of their own, so that they can override any of the methods.
+
+    The tables are keyed by unicode tag names, like the ones the tokenizer
+    emits, so that a lookup doesn't have to compare unicode to a byte string.
+    """
+
+    def __init__(cls, name, bases, dict):
+        type.__init__(cls, name, bases, dict)
+        for kind in ("startTag", "endTag"):
+            methods = getattr(cls, kind + "Methods", None)
+            if methods is None:
+                continue
+            items = []
+            for names, methodName in methods:
+                if isinstance(names, basestring):
+                    names = unicode(names)
+                else:
+                    names = tuple([unicode(item) for item in names])
+                items.append((names, getattr(cls, methodName).im_func))
+            handler = utils.MethodDispatcher(items)
+            default = getattr(cls, kind + "Other", None)
+            if default is not None:
+                handler.default = default.im_func
+            setattr(cls, kind + "Handler", handler)
+
 class Phase(object):
     """Base class for helper object that implements each phase of processing
     """
@@ -292,10 +620,17 @@ class Phase(object):
     # * EndTag
     #   - endTag* methods
 
+    __metaclass__ = PhaseType
+
     def __init__(self, parser, tree):
         self.parser = parser
         self.tree = tree
 
+    def reset(self):
+        """Forget any state kept from the last document. Called for every
+        phase whenever the parser starts on a document"""
+        pass
+
     def processEOF(self):
         raise NotImplementedError
 
@@ -311,7 +646,7 @@ class Phase(object):
         self.tree.insertText(data)
 
     def processStartTag(self, name, attributes):
-        self.startTagHandler[name](name, attributes)
+        self.startTagHandler[name](self, name, attributes)
 
     def startTagHtml(self, name, attributes):
         if self.parser.firstStartTag == False and name == "html":
@@ -324,7 +659,7 @@ class Phase(object):
         self.parser.firstStartTag = False
 
     def processEndTag(self, name):
-        self.endTagHandler[name](name)
+        self.endTagHandler[name](self, name)
 
 class InitialPhase(Phase):
     # This phase deals with error handling as well which is currently not
@@ -502,19 +837,14 @@ class BeforeHtmlPhase(Phase):
 
 
 class BeforeHeadPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("head", self.startTagHead)
-        ])
-        self.startTagHandler.default = self.startTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("head", "startTagHead")
+    ]
 
-        self.endTagHandler = utils.MethodDispatcher([
-            (("head", "br"), self.endTagImplyHead)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    endTagMethods = [
+        (("head", "br"), "endTagImplyHead")
+    ]
 
     def processEOF(self):
         self.startTagHead("head", {})
@@ -545,26 +875,21 @@ class BeforeHeadPhase(Phase):
           {"name": name})
 
 class InHeadPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler =  utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("title", self.startTagTitle),
-            (("noscript", "noframes", "style"), self.startTagNoScriptNoFramesStyle),
-            ("script", self.startTagScript),
-            (("base", "link", "command", "eventsource"), 
-             self.startTagBaseLinkCommandEventsource),
-            ("meta", self.startTagMeta),
-            ("head", self.startTagHead)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self. endTagHandler = utils.MethodDispatcher([
-            ("head", self.endTagHead),
-            ("br", self.endTagBr)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("title", "startTagTitle"),
+        (("noscript", "noframes", "style"), "startTagNoScriptNoFramesStyle"),
+        ("script", "startTagScript"),
+        (("base", "link", "command", "eventsource"), 
+         "startTagBaseLinkCommandEventsource"),
+        ("meta", "startTagMeta"),
+        ("head", "startTagHead")
+    ]
+
+    endTagMethods = [
+        ("head", "endTagHead"),
+        ("br", "endTagBr")
+    ]
 
     # helper
     def appendToHead(self, element):
@@ -647,20 +972,16 @@ class InHeadPhase(Phase):
 # class InHeadNoScriptPhase(Phase):
 
 class AfterHeadPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("body", "startTagBody"),
+        ("frameset", "startTagFrameset"),
+        (("base", "link", "meta", "noframes", "script", "style", "title"),
+          "startTagFromHead"),
+        ("head", "startTagHead")
+    ]
 
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("body", self.startTagBody),
-            ("frameset", self.startTagFrameset),
-            (("base", "link", "meta", "noframes", "script", "style", "title"),
-              self.startTagFromHead),
-            ("head", self.startTagHead)
-        ])
-        self.startTagHandler.default = self.startTagOther
-        self.endTagHandler = utils.MethodDispatcher([("br", self.endTagBr)])
-        self.endTagHandler.default = self.endTagOther
+    endTagMethods = [("br", "endTagBr")]
 
     def processEOF(self):
         self.anythingElse()
@@ -711,69 +1032,71 @@ class AfterHeadPhase(Phase):
 class InBodyPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-body
     # the crazy mode
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        (("base", "link", "meta", "script", "style", "title"),
+          "startTagProcessInHead"),
+        ("body", "startTagBody"),
+        (("address", "article", "aside", "blockquote", "center", "datagrid",
+          "details", "dialog", "dir", "div", "dl", "fieldset", "figure",
+          "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "listing",
+          "menu", "nav", "ol", "p", "pre", "section", "ul"),
+          "startTagCloseP"),
+        ("form", "startTagForm"),
+        (("li", "dd", "dt"), "startTagListItem"),
+        ("plaintext","startTagPlaintext"),
+        (headingElements, "startTagHeading"),
+        ("a", "startTagA"),
+        (("b", "big", "em", "font", "i", "s", "small", "strike", "strong",
+          "tt", "u"),"startTagFormatting"),
+        ("nobr", "startTagNobr"),
+        ("button", "startTagButton"),
+        (("applet", "marquee", "object"), "startTagAppletMarqueeObject"),
+        ("xmp", "startTagXmp"),
+        ("table", "startTagTable"),
+        (("area", "basefont", "bgsound", "br", "embed", "img", "param",
+          "spacer", "wbr"), "startTagVoidFormatting"),
+        ("hr", "startTagHr"),
+        ("image", "startTagImage"),
+        ("input", "startTagInput"),
+        ("isindex", "startTagIsIndex"),
+        ("textarea", "startTagTextarea"),
+        (("iframe", "noembed", "noframes", "noscript"), "startTagCdata"),
+        ("select", "startTagSelect"),
+        (("rp", "rt"), "startTagRpRt"),
+        (("option", "optgroup"), "startTagOpt"),
+        (("caption", "col", "colgroup", "frame", "frameset", "head",
+          "tbody", "td", "tfoot", "th", "thead",
+          "tr"), "startTagMisplaced"),
+        (("event-source", "command"), "startTagNew")
+    ]
+
+    endTagMethods = [
+        ("body","endTagBody"),
+        ("html","endTagHtml"),
+        (("address", "article", "aside", "blockquote", "center", "datagrid",
+          "details", "dialog", "dir", "div", "dl", "fieldset", "figure",
+          "footer", "header", "listing", "menu", "nav", "ol", "pre", "section",
+          "ul"), "endTagBlock"),
+        ("form", "endTagForm"),
+        ("p","endTagP"),
+        (("dd", "dt", "li"), "endTagListItem"),
+        (headingElements, "endTagHeading"),
+        (("a", "b", "big", "em", "font", "i", "nobr", "s", "small",
+          "strike", "strong", "tt", "u"), "endTagFormatting"),
+        (("applet", "button", "marquee", "object"), "endTagAppletButtonMarqueeObject"),
+        ("br", "endTagBr"),
+    ]
+
     def __init__(self, parser, tree):
         Phase.__init__(self, parser, tree)
 
         #Keep a ref to this for special handling of whitespace in <pre>
         self.processSpaceCharactersNonPre = self.processSpaceCharacters
 
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            (("base", "link", "meta", "script", "style", "title"),
-              self.startTagProcessInHead),
-            ("body", self.startTagBody),
-            (("address", "article", "aside", "blockquote", "center", "datagrid",
-              "details", "dialog", "dir", "div", "dl", "fieldset", "figure",
-              "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "listing",
-              "menu", "nav", "ol", "p", "pre", "section", "ul"),
-              self.startTagCloseP),
-            ("form", self.startTagForm),
-            (("li", "dd", "dt"), self.startTagListItem),
-            ("plaintext",self.startTagPlaintext),
-            (headingElements, self.startTagHeading),
-            ("a", self.startTagA),
-            (("b", "big", "em", "font", "i", "s", "small", "strike", "strong",
-              "tt", "u"),self.startTagFormatting),
-            ("nobr", self.startTagNobr),
-            ("button", self.startTagButton),
-            (("applet", "marquee", "object"), self.startTagAppletMarqueeObject),
-            ("xmp", self.startTagXmp),
-            ("table", self.startTagTable),
-            (("area", "basefont", "bgsound", "br", "embed", "img", "param",
-              "spacer", "wbr"), self.startTagVoidFormatting),
-            ("hr", self.startTagHr),
-            ("image", self.startTagImage),
-            ("input", self.startTagInput),
-            ("isindex", self.startTagIsIndex),
-            ("textarea", self.startTagTextarea),
-            (("iframe", "noembed", "noframes", "noscript"), self.startTagCdata),
-            ("select", self.startTagSelect),
-            (("rp", "rt"), self.startTagRpRt),
-            (("option", "optgroup"), self.startTagOpt),
-            (("caption", "col", "colgroup", "frame", "frameset", "head",
-              "tbody", "td", "tfoot", "th", "thead",
-              "tr"), self.startTagMisplaced),
-            (("event-source", "command"), self.startTagNew)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("body",self.endTagBody),
-            ("html",self.endTagHtml),
-            (("address", "article", "aside", "blockquote", "center", "datagrid",
-              "details", "dialog", "dir", "div", "dl", "fieldset", "figure",
-              "footer", "header", "listing", "menu", "nav", "ol", "pre", "section",
-              "ul"), self.endTagBlock),
-            ("form", self.endTagForm),
-            ("p",self.endTagP),
-            (("dd", "dt", "li"), self.endTagListItem),
-            (headingElements, self.endTagHeading),
-            (("a", "b", "big", "em", "font", "i", "nobr", "s", "small",
-              "strike", "strong", "tt", "u"), self.endTagFormatting),
-            (("applet", "button", "marquee", "object"), self.endTagAppletButtonMarqueeObject),
-            ("br", self.endTagBr),
-            ])
-        self.endTagHandler.default = self.endTagOther
+    def reset(self):
+        # A document may end straight after a <pre>
+        self.processSpaceCharacters = self.processSpaceCharactersNonPre
 
     # helper
     def addFormattingElement(self, name, attributes):
@@ -867,7 +1190,7 @@ class InBodyPhase(Phase):
 
             # Phrasing elements are all non special, non scoping, non
             # formatting elements
-            if (node.name in (specialElements | scopingElements)
+            if (node.name in specialOrScopingElements
               and node.name not in ("address", "div")):
                 break
         # Always insert an <li> element.
@@ -1149,41 +1472,44 @@ class InBodyPhase(Phase):
         """
         # http://www.whatwg.org/specs/web-apps/current-work/#adoptionAgency
         # XXX Better parseError messages appreciated.
-        while True:
+        openElements = self.tree.openElements
+        activeFormattingElements = self.tree.activeFormattingElements
+        # As in the specification the outer loop runs at most eight times, so
+        # that no amount of misnested markup makes one end tag expensive
+        for outerLoopCounter in xrange(8):
             # Step 1 paragraph 1
             afeElement = self.tree.elementInActiveFormattingElements(name)
-            if not afeElement or (afeElement in self.tree.openElements and
+            if afeElement:
+                afeIndex = openElements.indexOf(afeElement)
+            if not afeElement or (afeIndex != -1 and
               not self.tree.elementInScope(afeElement.name)):
                 self.parser.parseError("adoption-agency-1.1", {"name": name})
                 return
 
             # Step 1 paragraph 2
-            elif afeElement not in self.tree.openElements:
+            elif afeIndex == -1:
                 self.parser.parseError("adoption-agency-1.2", {"name": name})
-                self.tree.activeFormattingElements.remove(afeElement)
+                activeFormattingElements.remove(afeElement)
                 return
 
             # Step 1 paragraph 3
-            if afeElement != self.tree.openElements[-1]:
+            if afeElement != openElements[-1]:
                 self.parser.parseError("adoption-agency-1.3", {"name": name})
 
             # Step 2
             # Start of the adoption agency algorithm proper
-            afeIndex = self.tree.openElements.index(afeElement)
             furthestBlock = None
-            for element in self.tree.openElements[afeIndex:]:
-                if element.name in specialElements | scopingElements:
-                    furthestBlock = element
+            for fbIndex in xrange(afeIndex, len(openElements)):
+                if openElements[fbIndex].name in specialOrScopingElements:
+                    furthestBlock = openElements[fbIndex]
                     break
 
             # Step 3
             if furthestBlock is None:
-                element = self.tree.openElements.pop()
-                while element != afeElement:
-                    element = self.tree.openElements.pop()
-                self.tree.activeFormattingElements.remove(element)
+                del openElements[afeIndex:]
+                activeFormattingElements.remove(afeElement)
                 return
-            commonAncestor = self.tree.openElements[afeIndex-1]
+            commonAncestor = openElements[afeIndex-1]
 
             # Step 5
             if furthestBlock.parent:
@@ -1194,37 +1520,46 @@ class InBodyPhase(Phase):
             # nodes in step 12. We have to ensure that we reinsert nodes after
             # the node before the active formatting element. Note the bookmark
             # can move in step 7.4
-            bookmark = self.tree.activeFormattingElements.index(afeElement)
+            bookmark = activeFormattingElements.index(afeElement)
 
             # Step 7
-            lastNode = node = furthestBlock
+            # Walk down the stack from the furthest block to the formatting
+            # element. The elements that stay open between them are collected
+            # in kept, top first, and the stack is changed in one go in step 13
+            lastNode = furthestBlock
+            kept = []
+            clones = 1
+            nodeIndex = fbIndex - 1
+            innerLoopCounter = 0
             while True:
-                # AT replace this with a function and recursion?
+                innerLoopCounter += 1
                 # Node is element before node in open elements
-                node = self.tree.openElements[
-                    self.tree.openElements.index(node)-1]
-                while node not in self.tree.activeFormattingElements:
-                    tmpNode = node
-                    node = self.tree.openElements[
-                        self.tree.openElements.index(node)-1]
-                    self.tree.openElements.remove(tmpNode)
+                node = openElements[nodeIndex]
+                nodeIndex -= 1
                 # Step 7.3
                 if node == afeElement:
                     break
+                # Past the third element, formatting elements are dropped
+                # as well, as in the specification
+                if (innerLoopCounter > 3 and
+                    node in activeFormattingElements):
+                    activeFormattingElements.remove(node)
+                # Elements that aren't formatting elements are dropped from
+                # the stack
+                if node not in activeFormattingElements:
+                    continue
                 # Step 7.4
                 if lastNode == furthestBlock:
-                    bookmark = self.tree.activeFormattingElements.\
-                      index(node) + 1
+                    bookmark = activeFormattingElements.index(node) + 1
                 # Step 7.5
-                cite = node.parent
                 if node.hasContent():
                     clone = node.cloneNode()
+                    clones += 1
                     # Replace node with clone
-                    self.tree.activeFormattingElements[
-                      self.tree.activeFormattingElements.index(node)] = clone
-                    self.tree.openElements[
-                      self.tree.openElements.index(node)] = clone
+                    activeFormattingElements[
+                      activeFormattingElements.index(node)] = clone
                     node = clone
+                kept.append(node)
                 # Step 7.6
                 # Remove lastNode from its parents, if any
                 if lastNode.parent:
@@ -1249,13 +1584,20 @@ class InBodyPhase(Phase):
             furthestBlock.appendChild(clone)
 
             # Step 12
-            self.tree.activeFormattingElements.remove(afeElement)
-            self.tree.activeFormattingElements.insert(bookmark, clone)
+            activeFormattingElements.remove(afeElement)
+            activeFormattingElements.insert(bookmark, clone)
 
             # Step 13
-            self.tree.openElements.remove(afeElement)
-            self.tree.openElements.insert(
-              self.tree.openElements.index(furthestBlock) + 1, clone)
+            # Together with the elements dropped in step 7, this replaces the
+            # formatting element with the clone just above the furthest block
+            kept.reverse()
+            kept.extend([furthestBlock, clone])
+            openElements[afeIndex:fbIndex + 1] = kept
+
+            # The clones are only counted against the parser's budget now
+            # that the tree is whole again
+            if self.tree.budget is not None:
+                self.tree.budget.checkNode(clones)
 
     def endTagAppletButtonMarqueeObject(self, name):
         if self.tree.elementInScope(name):
@@ -1286,18 +1628,14 @@ class InBodyPhase(Phase):
                     pass
                 break
             else:
-                if node.name in specialElements | scopingElements:
+                if node.name in specialOrScopingElements:
                     self.parser.parseError("unexpected-end-tag", {"name": name})
                     break
 
 class InCDataRCDataPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-        self.startTagHandler = utils.MethodDispatcher([])
-        self.startTagHandler.default = self.startTagOther
-        self.endTagHandler = utils.MethodDispatcher([
-                ("script", self.endTagScript)])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = []
+
+    endTagMethods = [("script", "endTagScript")]
 
     def processCharacters(self, data):
         self.tree.insertText(data)
@@ -1325,27 +1663,23 @@ class InCDataRCDataPhase(Phase):
 
 class InTablePhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-table
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("caption", self.startTagCaption),
-            ("colgroup", self.startTagColgroup),
-            ("col", self.startTagCol),
-            (("tbody", "tfoot", "thead"), self.startTagRowGroup),
-            (("td", "th", "tr"), self.startTagImplyTbody),
-            ("table", self.startTagTable),
-            (("style", "script"), self.startTagStyleScript),
-            ("input", self.startTagInput)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("table", self.endTagTable),
-            (("body", "caption", "col", "colgroup", "html", "tbody", "td",
-              "tfoot", "th", "thead", "tr"), self.endTagIgnore)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("caption", "startTagCaption"),
+        ("colgroup", "startTagColgroup"),
+        ("col", "startTagCol"),
+        (("tbody", "tfoot", "thead"), "startTagRowGroup"),
+        (("td", "th", "tr"), "startTagImplyTbody"),
+        ("table", "startTagTable"),
+        (("style", "script"), "startTagStyleScript"),
+        ("input", "startTagInput")
+    ]
+
+    endTagMethods = [
+        ("table", "endTagTable"),
+        (("body", "caption", "col", "colgroup", "html", "tbody", "td",
+          "tfoot", "th", "thead", "tr"), "endTagIgnore")
+    ]
 
     # helper methods
     def clearStackToTableContext(self):
@@ -1474,23 +1808,18 @@ class InTablePhase(Phase):
 
 class InCaptionPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-caption
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            (("caption", "col", "colgroup", "tbody", "td", "tfoot", "th",
-              "thead", "tr"), self.startTagTableElement)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("caption", self.endTagCaption),
-            ("table", self.endTagTable),
-            (("body", "col", "colgroup", "html", "tbody", "td", "tfoot", "th",
-              "thead", "tr"), self.endTagIgnore)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        (("caption", "col", "colgroup", "tbody", "td", "tfoot", "th",
+          "thead", "tr"), "startTagTableElement")
+    ]
+
+    endTagMethods = [
+        ("caption", "endTagCaption"),
+        ("table", "endTagTable"),
+        (("body", "col", "colgroup", "html", "tbody", "td", "tfoot", "th",
+          "thead", "tr"), "endTagIgnore")
+    ]
 
     def ignoreEndTagCaption(self):
         return not self.tree.elementInScope("caption", True)
@@ -1547,20 +1876,15 @@ class InCaptionPhase(Phase):
 class InColumnGroupPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-column
 
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("col", self.startTagCol)
-        ])
-        self.startTagHandler.default = self.startTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("col", "startTagCol")
+    ]
 
-        self.endTagHandler = utils.MethodDispatcher([
-            ("colgroup", self.endTagColgroup),
-            ("col", self.endTagCol)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    endTagMethods = [
+        ("colgroup", "endTagColgroup"),
+        ("col", "endTagCol")
+    ]
 
     def ignoreEndTagColgroup(self):
         return self.tree.openElements[-1].name == "html"
@@ -1612,24 +1936,20 @@ class InColumnGroupPhase(Phase):
 
 class InTableBodyPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-table0
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("tr", self.startTagTr),
-            (("td", "th"), self.startTagTableCell),
-            (("caption", "col", "colgroup", "tbody", "tfoot", "thead"),
-             self.startTagTableOther)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            (("tbody", "tfoot", "thead"), self.endTagTableRowGroup),
-            ("table", self.endTagTable),
-            (("body", "caption", "col", "colgroup", "html", "td", "th",
-              "tr"), self.endTagIgnore)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("tr", "startTagTr"),
+        (("td", "th"), "startTagTableCell"),
+        (("caption", "col", "colgroup", "tbody", "tfoot", "thead"),
+         "startTagTableOther")
+    ]
+
+    endTagMethods = [
+        (("tbody", "tfoot", "thead"), "endTagTableRowGroup"),
+        ("table", "endTagTable"),
+        (("body", "caption", "col", "colgroup", "html", "td", "th",
+          "tr"), "endTagIgnore")
+    ]
 
     # helper methods
     def clearStackToTableBodyContext(self):
@@ -1706,24 +2026,20 @@ class InTableBodyPhase(Phase):
 
 class InRowPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-row
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            (("td", "th"), self.startTagTableCell),
-            (("caption", "col", "colgroup", "tbody", "tfoot", "thead",
-              "tr"), self.startTagTableOther)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("tr", self.endTagTr),
-            ("table", self.endTagTable),
-            (("tbody", "tfoot", "thead"), self.endTagTableRowGroup),
-            (("body", "caption", "col", "colgroup", "html", "td", "th"),
-              self.endTagIgnore)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        (("td", "th"), "startTagTableCell"),
+        (("caption", "col", "colgroup", "tbody", "tfoot", "thead",
+          "tr"), "startTagTableOther")
+    ]
+
+    endTagMethods = [
+        ("tr", "endTagTr"),
+        ("table", "endTagTable"),
+        (("tbody", "tfoot", "thead"), "endTagTableRowGroup"),
+        (("body", "caption", "col", "colgroup", "html", "td", "th"),
+          "endTagIgnore")
+    ]
 
     # helper methods (XXX unify this with other table helper methods)
     def clearStackToTableRowContext(self):
@@ -1796,21 +2112,17 @@ class InRowPhase(Phase):
 
 class InCellPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-cell
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            (("caption", "col", "colgroup", "tbody", "td", "tfoot", "th",
-              "thead", "tr"), self.startTagTableOther)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            (("td", "th"), self.endTagTableCell),
-            (("body", "caption", "col", "colgroup", "html"), self.endTagIgnore),
-            (("table", "tbody", "tfoot", "thead", "tr"), self.endTagImply)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        (("caption", "col", "colgroup", "tbody", "td", "tfoot", "th",
+          "thead", "tr"), "startTagTableOther")
+    ]
+
+    endTagMethods = [
+        (("td", "th"), "endTagTableCell"),
+        (("body", "caption", "col", "colgroup", "html"), "endTagIgnore"),
+        (("table", "tbody", "tfoot", "thead", "tr"), "endTagImply")
+    ]
 
     # helper
     def closeCell(self):
@@ -1837,10 +2149,6 @@ class InCellPhase(Phase):
 
     def startTagOther(self, name, attributes):
         self.parser.phases["inBody"].processStartTag(name, attributes)
-        # Optimize this for subsequent invocations. Can't do this initially
-        # because self.phases doesn't really exist at that point.
-        self.startTagHandler.default =\
-          self.parser.phases["inBody"].processStartTag
 
     def endTagTableCell(self, name):
         if self.tree.elementInScope(name, True):
@@ -1872,32 +2180,24 @@ class InCellPhase(Phase):
 
     def endTagOther(self, name):
         self.parser.phases["inBody"].processEndTag(name)
-        # Optimize this for subsequent invocations. Can't do this initially
-        # because self.phases doesn't really exist at that point.
-        self.endTagHandler.default = self.parser.phases["inBody"].processEndTag
 
 
 class InSelectPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("option", self.startTagOption),
-            ("optgroup", self.startTagOptgroup),
-            ("select", self.startTagSelect),
-            ("input", self.startTagInput)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("option", self.endTagOption),
-            ("optgroup", self.endTagOptgroup),
-            ("select", self.endTagSelect),
-            (("caption", "table", "tbody", "tfoot", "thead", "tr", "td",
-              "th"), self.endTagTableElements)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("option", "startTagOption"),
+        ("optgroup", "startTagOptgroup"),
+        ("select", "startTagSelect"),
+        ("input", "startTagInput")
+    ]
+
+    endTagMethods = [
+        ("option", "endTagOption"),
+        ("optgroup", "endTagOptgroup"),
+        ("select", "endTagSelect"),
+        (("caption", "table", "tbody", "tfoot", "thead", "tr", "td",
+          "th"), "endTagTableElements")
+    ]
 
     # http://www.whatwg.org/specs/web-apps/current-work/#in-select
     def processEOF(self):
@@ -1978,18 +2278,13 @@ class InSelectPhase(Phase):
 
 
 class InSelectInTablePhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
+    startTagMethods = [
+        (("caption", "table", "tbody", "tfoot", "thead", "tr", "td", "th"), "startTagTable")
+    ]
 
-        self.startTagHandler = utils.MethodDispatcher([
-            (("caption", "table", "tbody", "tfoot", "thead", "tr", "td", "th"), self.startTagTable)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            (("caption", "table", "tbody", "tfoot", "thead", "tr", "td", "th"), self.endTagTable)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    endTagMethods = [
+        (("caption", "table", "tbody", "tfoot", "thead", "tr", "td", "th"), "endTagTable")
+    ]
 
     def processEOF(self):
         self.parser.phases["inSelect"].processEOF()
@@ -2016,16 +2311,9 @@ class InSelectInTablePhase(Phase):
 
 
 class AfterBodyPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
+    startTagMethods = [("html", "startTagHtml")]
 
-        self.startTagHandler = utils.MethodDispatcher([
-                ("html", self.startTagHtml)
-                ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([("html", self.endTagHtml)])
-        self.endTagHandler.default = self.endTagOther
+    endTagMethods = [("html", "endTagHtml")]
 
     def processEOF(self):
         #Stop parsing
@@ -2064,22 +2352,17 @@ class AfterBodyPhase(Phase):
 
 class InFramesetPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#in-frameset
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("frameset", self.startTagFrameset),
-            ("frame", self.startTagFrame),
-            ("noframes", self.startTagNoframes)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("frameset", self.endTagFrameset),
-            ("noframes", self.endTagNoframes)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("frameset", "startTagFrameset"),
+        ("frame", "startTagFrame"),
+        ("noframes", "startTagNoframes")
+    ]
+
+    endTagMethods = [
+        ("frameset", "endTagFrameset"),
+        ("noframes", "endTagNoframes")
+    ]
 
     def processEOF(self):
         if self.tree.openElements[-1].name != "html":
@@ -2126,19 +2409,14 @@ class InFramesetPhase(Phase):
 
 class AfterFramesetPhase(Phase):
     # http://www.whatwg.org/specs/web-apps/current-work/#after3
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("noframes", "startTagNoframes")
+    ]
 
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("noframes", self.startTagNoframes)
-        ])
-        self.startTagHandler.default = self.startTagOther
-
-        self.endTagHandler = utils.MethodDispatcher([
-            ("html", self.endTagHtml)
-        ])
-        self.endTagHandler.default = self.endTagOther
+    endTagMethods = [
+        ("html", "endTagHtml")
+    ]
 
     def processEOF(self):
         #Stop parsing
@@ -2163,13 +2441,9 @@ class AfterFramesetPhase(Phase):
 
 
 class AfterAfterBodyPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml)
-        ])
-        self.startTagHandler.default = self.startTagOther
+    startTagMethods = [
+        ("html", "startTagHtml")
+    ]
 
     def processEOF(self):
         pass
@@ -2201,14 +2475,10 @@ class AfterAfterBodyPhase(Phase):
         self.parser.phase.processEndTag(name)
 
 class AfterAfterFramesetPhase(Phase):
-    def __init__(self, parser, tree):
-        Phase.__init__(self, parser, tree)
-
-        self.startTagHandler = utils.MethodDispatcher([
-            ("html", self.startTagHtml),
-            ("noframes", self.startTagNoFrames)
-        ])
-        self.startTagHandler.default = self.startTagOther
+    startTagMethods = [
+        ("html", "startTagHtml"),
+        ("noframes", "startTagNoFrames")
+    ]
 
     def processEOF(self):
         pass
@@ -1,10 +1,25 @@
 import codecs
 import re
+import string
 import types
 import sys
+import os
+import stat
+from array import array
+from bisect import bisect_left
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+try:
+    from _multibytecodec import MultibyteIncrementalDecoder
+except ImportError:
+    MultibyteIncrementalDecoder = ()
 
 from constants import EOF, spaceCharacters, asciiLetters, asciiUppercase
-from constants import encodings, ReparseException
+from constants import encodings, ReparseException, NeedMoreData
 
 #Non-unicode versions of constants for use in the pre-parser
 spaceCharactersBytes = [str(item) for item in spaceCharacters]
@@ -13,10 +28,38 @@ asciiUppercaseBytes = [str(item) for item in asciiUppercase]
 
 invalid_unicode_re = re.compile(u"[\u0001-\u0008\u000B\u000E-\u001F\u007F-\u009F\uD800-\uDFFF\uFDD0-\uFDEF\uFFFE\uFFFF\U0001FFFE\U0001FFFF\U0002FFFE\U0002FFFF\U0003FFFE\U0003FFFF\U0004FFFE\U0004FFFF\U0005FFFE\U0005FFFF\U0006FFFE\U0006FFFF\U0007FFFE\U0007FFFF\U0008FFFE\U0008FFFF\U0009FFFE\U0009FFFF\U000AFFFE\U000AFFFF\U000BFFFE\U000BFFFF\U000CFFFE\U000CFFFF\U000DFFFE\U000DFFFF\U000EFFFE\U000EFFFF\U000FFFFE\U000FFFFF\U0010FFFE\U0010FFFF]")
 
+# Characters normalizeText has to do something about: null characters, CRs,
+# the characters in the BMP that invalid_unicode_re matches and any character
+# outside the BMP. invalid_unicode_re itself is slow to search with, because
+# of the characters outside the BMP in it, and is only used for text that
+# has some of those
+special_chars_re = re.compile(u"[\u0000-\u0008\u000B\u000D-\u001F\u007F-\u009F\uD800-\uDFFF\uFDD0-\uFDEF\uFFFE\uFFFF]")
+char_errors_bmp_re = re.compile(u"[\u0000-\u0008\u000B\u000E-\u001F\u007F-\u009F\uD800-\uDFFF\uFDD0-\uFDEF\uFFFE\uFFFF]")
+char_errors_re = re.compile(u"\u0000|" + invalid_unicode_re.pattern)
+if sys.maxunicode > 0xFFFF:
+    non_bmp_re = re.compile(u"[\U00010000-\U0010FFFF]")
+    special_chars_re = re.compile(special_chars_re.pattern[:-1] +
+                                  u"\U00010000-\U0010FFFF]")
+else:
+    # Narrow build; characters outside the BMP are surrogate pairs, which
+    # the expressions for the BMP match already
+    non_bmp_re = None
+
 ascii_punctuation_re = re.compile(ur"[\u0009-\u000D\u0020-\u002F\u003A-\u0040\u005B-\u0060\u007B-\u007E]")
 
 # Cache for charsUntil()
 charsUntilRegEx = {}
+
+# For EncodingPrescanner
+asciiLowerBytes = string.maketrans(string.ascii_uppercase,
+                                   string.ascii_lowercase)
+spaceBytes = "".join(spaceCharactersBytes)
+spaces_re = re.compile("[%s]*" % spaceBytes)
+space_re = re.compile("[%s]" % spaceBytes)
+attrStart_re = re.compile("[%s/]*" % spaceBytes)
+attrName_re = re.compile("[^%s/<>=]*" % spaceBytes)
+attrValue_re = re.compile("[^%s<>]*" % spaceBytes)
+tagNameEnd_re = re.compile("[%s<>]" % spaceBytes)
         
 class BufferedStream:
     """Buffering for streams that do not have buffering of their own
@@ -38,11 +81,13 @@ class BufferedStream:
         return pos
 
     def seek(self, pos):
-        assert pos < self._bufferedBytes()
+        assert pos <= self._bufferedBytes()
+        if not self.buffer:
+            return
         offset = pos
         i = 0
         while len(self.buffer[i]) < offset:
-            offset -= pos
+            offset -= len(self.buffer[i])
             i += 1
         self.position = [i, offset]
 
@@ -94,6 +139,91 @@ class BufferedStream:
         
 
 
+class MappedFile:
+    """Read only file object for a regular file that is memory mapped, so
+    that reading it does not copy it through a file buffer.
+
+    Only a window of the file is mapped at a time, and the window is moved
+    along as the file is read, so that the pages of a huge file that have
+    already been read do not stay mapped into the process.
+    """
+
+    windowSize = 1 << 24
+
+    def __init__(self, fd, size):
+        # The descriptor is needed to map each window; keep a copy of our own
+        # so that it can be closed without disturbing the caller's
+        self.fd = os.dup(fd)
+        self.size = size
+        self.pos = 0
+        self.window = None
+        self.windowStart = 0
+        self.windowEnd = 0
+        # Windows must start at a multiple of this
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.windowSize -= self.windowSize % granularity
+        self.granularity = granularity
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        self.pos = max(pos, 0)
+
+    def read(self, size=-1):
+        end = self.size
+        if size >= 0:
+            end = min(self.pos + size, end)
+        rv = []
+        while self.pos < end:
+            if not self.windowStart <= self.pos < self.windowEnd:
+                self.mapWindow(self.pos)
+            stop = min(end, self.windowEnd)
+            rv.append(self.window[self.pos - self.windowStart:
+                                  stop - self.windowStart])
+            self.pos = stop
+        return "".join(rv)
+
+    def mapWindow(self, pos):
+        if self.window is not None:
+            self.window.close()
+        start = pos - pos % self.granularity
+        length = min(self.windowSize, self.size - start)
+        self.window = mmap.mmap(self.fd, length, access=mmap.ACCESS_READ,
+                                offset=start)
+        self.windowStart = start
+        self.windowEnd = start + length
+
+    def close(self):
+        if self.window is not None:
+            self.window.close()
+            self.window = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __del__(self):
+        self.close()
+
+def mapFile(fd):
+    """Return a MappedFile for the file with descriptor fd, or None if it
+    cannot be memory mapped, e.g. for pipes, sockets and empty files"""
+    if mmap is None:
+        return None
+    try:
+        info = os.fstat(fd)
+        if not stat.S_ISREG(info.st_mode) or not info.st_size:
+            return None
+        rv = MappedFile(fd, info.st_size)
+        rv.mapWindow(0)
+    except (EnvironmentError, ValueError, mmap.error):
+        return None
+    return rv
+
 class HTMLInputStream:
     """Provides a unicode stream of characters to the HTMLTokenizer.
 
@@ -103,14 +233,17 @@ class HTMLInputStream:
     """
 
     _defaultChunkSize = 10240
+    # The largest chunks read with chunkSize="adaptive"
+    _maxChunkSize = 1 << 20
 
-    def __init__(self, source, encoding=None, parseMeta=True, chardet=True):
+    def __init__(self, source, encoding=None, parseMeta=True, chardet=True,
+                 chunkSize=None):
         """Initialises the HTMLInputStream.
 
         HTMLInputStream(source, [encoding]) -> Normalized stream from source
         for use by html5lib.
 
-        source can be either a file-object, local filename or a string.
+        source can be either a file-object, file descriptor or a string.
 
         The optional encoding parameter must be a string that indicates
         the encoding.  If specified, that encoding will be used,
@@ -119,22 +252,49 @@ class HTMLInputStream:
         
         parseMeta - Look for a <meta> element containing encoding information
 
+        chardet - guess the encoding if there is no BOM or <meta> element to
+        say what it is. This can be True, to use chardet if it is installed,
+        or a callable taking a sample of the first bytes of the document and
+        returning the name of an encoding or None, such as a CharsetDetector.
+        The size of the sample is the callable's sampleSize attribute, if it
+        has one, or numBytesChardet
+
+        chunkSize - the number of bytes to read and decode at a time. The
+        default is _defaultChunkSize. With "adaptive" the first chunk is that
+        size and each one after it twice the size of the last, up to
+        _maxChunkSize, so that large documents are read in a few large
+        chunks. Unicode input is always used as a single chunk
+
         """
+        if chunkSize == "adaptive":
+            self.adaptiveChunkSize = True
+            chunkSize = None
+        else:
+            self.adaptiveChunkSize = False
+        self.initialChunkSize = chunkSize or self._defaultChunkSize
+
         # List of where new lines occur
         self.newLines = [0]
 
         self.charEncoding = (codecName(encoding), "certain")
 
-        # Raw Stream - for unicode objects this will encode to utf-8 and set
-        #              self.charEncoding as appropriate
-        self.rawStream = self.openStream(source)
+        # Unicode objects are already decoded, so they are used as the text
+        # of the document directly rather than through a raw stream; see
+        # reset()
+        if isinstance(source, unicode):
+            self.unicodeSource = source
+            self.rawStream = None
+            self.charEncoding = ("utf-8", "certain")
+        else:
+            self.unicodeSource = None
+            self.rawStream = self.openStream(source)
 
         # Encoding Information
         #Number of bytes to use when looking for a meta element with
         #encoding information
         self.numBytesMeta = 512
         #Number of bytes to use when using detecting encoding using chardet
-        self.numBytesChardet = 100
+        self.numBytesChardet = CharsetDetector.sampleSize
         #Encoding to use if no other information can be found
         self.defaultEncoding = "windows-1252"
         
@@ -145,33 +305,72 @@ class HTMLInputStream:
         self.reset()
 
     def reset(self):
-        self.dataStream = codecs.getreader(self.charEncoding[0])(self.rawStream,
-                                                                 'replace')
-
         self.chunk = u""
         self.chunkSize = 0
         self.chunkOffset = 0
         self.errors = []
 
-        # Remember the current position in the document
-        self.positionLine = 1
-        self.positionCol = 0
-        # Remember the length of the last line, so unget("\n") can restore
-        # positionCol. (Only one character can be ungot at once, so we only
-        # need to remember the single last line.)
+        # The position in the document is not kept up to date as characters
+        # are read; position() works it out from the position of the start
+        # of the chunk when it is needed
+        self.chunkStart = (1, 0)
+        # Offsets of the newlines in the chunk, for position(); see
+        # positionAt()
+        self.chunkNewLines = None
+        # The length of the line before the chunk, if the chunk starts a line,
+        # so that unget("\n") can move the start of the chunk back
         self.lastLineLength = None
         
         #Flag to indicate we may have a CR LF broken across a data chunk
         self._lastChunkEndsWithCR = False
 
+        # Number of characters normalized so far
+        self.textOffset = 0
+
+        # Where the current chunk was read from, while the encoding is
+        # tentative; see readChunk()
+        self.chunkBytesStart = 0
+        self.chunkTextStart = 0
+        self.chunkAfterCR = False
+        self.chunkErrors = []
+
+        # Number of bytes to read for the next chunk
+        self.readSize = self.initialChunkSize
+
+        if self.unicodeSource is None:
+            self.dataStream = codecs.getreader(self.charEncoding[0])(
+                self.rawStream, 'replace')
+        else:
+            # The whole of unicode input is a single chunk, normalized in
+            # one go. Without null characters or CRs that is the source
+            # object itself, so no copy is made
+            self.dataStream = None
+            if self.unicodeSource:
+                self.chunk = self.normalizeText(self.unicodeSource)
+                self.chunkSize = len(self.chunk)
+
     def openStream(self, source):
         """Produces a file object from source.
 
-        source can be either a file object, local filename or a string.
+        source can be either a file object, a file descriptor or a string.
 
+        Regular files, whether given as a file object or a descriptor, are
+        memory mapped rather than read through the file object, so that large
+        files are never read into memory as a whole.
         """
+        if isinstance(source, (int, long)):
+            stream = mapFile(source)
+            if stream is not None:
+                return stream
+            # Not a regular file, so it may well not be seekable either
+            return BufferedStream(os.fdopen(os.dup(source), "rb"))
         # Already a file object
-        if hasattr(source, 'read'):
+        elif hasattr(source, 'read'):
+            if isinstance(source, file) and source is not sys.stdin:
+                stream = mapFile(source.fileno())
+                if stream is not None:
+                    stream.seek(source.tell())
+                    return stream
             stream = source
         else:
             # Otherwise treat source as a string and convert to a file object
@@ -198,24 +397,21 @@ class HTMLInputStream:
         if encoding is None and parseMeta:
             encoding = self.detectEncodingMeta()
             confidence = "tentative"
-        #Guess with chardet, if avaliable
+        #Guess from a sample of the document, with chardet by default
         if encoding is None and chardet:
             confidence = "tentative"
-            try:
-                from chardet.universaldetector import UniversalDetector
-                buffers = []
-                detector = UniversalDetector()
-                while not detector.done:
-                    buffer = self.rawStream.read(self.numBytesChardet)
-                    if not buffer:
-                        break
-                    buffers.append(buffer)
-                    detector.feed(buffer)
-                detector.close()
-                encoding = detector.result['encoding']
-                self.rawStream.seek(0)
-            except ImportError:
-                pass
+            if chardet is True:
+                chardet = defaultCharsetDetector
+            sample = self.rawStream.read(getattr(chardet, "sampleSize",
+                                                 self.numBytesChardet))
+            self.rawStream.seek(0)
+            encoding = codecName(chardet(sample))
+            # A sample that is all ASCII, such as a long script at the start
+            # of the document, says nothing about the bytes after it, which
+            # the ascii codec would replace. The default encoding decodes
+            # ASCII the same way
+            if encoding == "ascii":
+                encoding = None
         # If all else fails use the default encoding
         if encoding is None:
             confidence="tentative"
@@ -230,19 +426,91 @@ class HTMLInputStream:
         return encoding, confidence
 
     def changeEncoding(self, newEncoding):
+        """Change to the encoding given by a meta element. If the text read
+        so far would be different in the new encoding the stream goes back to
+        the start of the document and ReparseException is raised"""
         newEncoding = codecName(newEncoding)
         if newEncoding in ("utf-16", "utf-16-be", "utf-16-le"):
             newEncoding = "utf-8"
         if newEncoding is None:
             return
         elif newEncoding == self.charEncoding[0]:
-            self.charEncoding = (self.charEncoding[0], "certian")
+            self.charEncoding = (self.charEncoding[0], "certain")
+        elif self.switchEncoding(newEncoding):
+            self.charEncoding = (newEncoding, "certain")
         else:
+            oldEncoding = self.charEncoding[0]
+            self.charEncoding = (newEncoding, "certain")
             self.rawStream.seek(0)
             self.reset()
-            self.charEncoding = (newEncoding, "certian")
-            raise ReparseException, "Encoding changed from %s to %s"%(self.charEncoding[0], newEncoding)
-            
+            raise ReparseException, "Encoding changed from %s to %s"%(oldEncoding, newEncoding)
+
+    def switchEncoding(self, newEncoding):
+        """Carry on in newEncoding without going back to the start of the
+        document, which can be done when the text read so far is the same in
+        both encodings, as it usually is when it is all ASCII. The current
+        chunk is decoded again from its start and the characters after the
+        current position replaced. Returns whether the switch was made"""
+        # The readers of the multibyte codecs keep the bytes of a partly read
+        # character to themselves, so where decoding has got to in the raw
+        # stream isn't known for those
+        if (self.dataStream is None or
+            not hasattr(self.dataStream, "bytebuffer")):
+            return False
+        position = self.rawStream.tell()
+        chunkBytesStart = self.chunkBytesStart
+        self.rawStream.seek(0)
+        before = self.rawStream.read(chunkBytesStart)
+        if not self.decodesAlike(before, newEncoding):
+            self.rawStream.seek(position)
+            return False
+
+        reader = codecs.getreader(newEncoding)(self.rawStream, 'replace')
+        data = reader.read(max(position - chunkBytesStart, 1))
+        chunk = self.chunk
+        offset = self.chunkOffset
+        # The characters unget() put in front of the chunk
+        ungotten = len(chunk) - (self.textOffset - self.chunkTextStart)
+
+        state = (self.textOffset, self._lastChunkEndsWithCR, self.errors)
+        self.textOffset = self.chunkTextStart
+        self._lastChunkEndsWithCR = self.chunkAfterCR
+        self.errors = []
+        newChunk = chunk[:ungotten]
+        if data:
+            newChunk += self.normalizeText(data)
+        # Errors in the chunk have been reported when it was read. Those
+        # before the current position are for the same text either way, but
+        # if there are any after it the document is reparsed to get them right
+        end = self.chunkTextStart - ungotten + offset
+        if (newChunk[:offset] != chunk[:offset] or
+            self.errorsFrom(self.chunkErrors, end) or
+            self.errorsFrom(self.errors, end)):
+            self.textOffset, self._lastChunkEndsWithCR, self.errors = state
+            self.rawStream.seek(position)
+            return False
+        self.errors = state[2]
+
+        self.dataStream = reader
+        self.chunk = newChunk
+        self.chunkSize = len(newChunk)
+        self.chunkNewLines = None
+        return True
+
+    def errorsFrom(self, errors, offset):
+        """Whether any of errors, as recorded by findCharErrors, are for
+        characters at or after offset"""
+        for code, offsets in errors:
+            if offsets[-1] >= offset:
+                return True
+        return False
+
+    def decodesAlike(self, data, newEncoding):
+        """Whether the bytes in data decode to the same text in newEncoding
+        as in the current encoding"""
+        return (data.decode(self.charEncoding[0], 'replace') ==
+                data.decode(newEncoding, 'replace'))
+
     def detectBOM(self):
         """Attempts to detect at BOM at the start of the stream. If
         an encoding can be determined from the BOM return the name of the
@@ -277,7 +545,7 @@ class HTMLInputStream:
         """Report the encoding declared by the meta element
         """
         buffer = self.rawStream.read(self.numBytesMeta)
-        parser = EncodingParser(buffer)
+        parser = EncodingPrescanner(buffer)
         self.rawStream.seek(0)
         encoding = parser.getEncoding()
         
@@ -286,33 +554,52 @@ class HTMLInputStream:
 
         return encoding
 
-    def updatePosition(self, chars):
-        # Update the position attributes to correspond to some sequence of
-        # read characters
-
-        # Find the last newline character
-        idx = chars.rfind(u"\n")
-        if idx == -1:
-            # No newlines in chars
-            self.positionCol += len(chars)
-        else:
-            # Find the last-but-one newline character
-            idx2 = chars.rfind(u"\n", 0, idx)
-            if idx2 == -1:
-                # Only one newline in chars
-                self.positionLine += 1
-                self.lastLineLength = self.positionCol + idx
-                self.positionCol = len(chars) - (idx + 1)
-            else:
-                # At least two newlines in chars
-                newlines = chars.count(u"\n")
-                self.positionLine += newlines
-                self.lastLineLength = idx - (idx2 + 1)
-                self.positionCol = len(chars) - (idx + 1)
-
     def position(self):
         """Returns (line, col) of the current position in the stream."""
-        return (self.positionLine, self.positionCol)
+        return self.positionAt(self.chunkOffset)
+
+    def positionAt(self, offset):
+        """Returns (line, col) of the character at offset in the chunk"""
+        line, col = self.chunkStart
+        newLines = self.chunkNewLines
+        if newLines is None:
+            # Positions are usually asked for because of a parse error, and
+            # there may be many more to come in this chunk, so make an index
+            # of the newlines in it to look them up in
+            newLines = self.chunkNewLines = array("l")
+            find = self.chunk.find
+            i = find(u"\n")
+            while i != -1:
+                newLines.append(i)
+                i = find(u"\n", i + 1)
+        # Number of newlines before offset
+        lines = bisect_left(newLines, offset)
+        if lines:
+            return (line + lines, offset - newLines[lines - 1] - 1)
+        return (line, col + offset)
+
+    def startChunk(self, offset):
+        """Record the position of the character at offset in the current
+        chunk as that of the start of the chunk about to replace it"""
+        line, col = self.chunkStart
+        if offset:
+            chunk = self.chunk
+            # Counting is a lot quicker than indexing the whole chunk
+            lines = chunk.count(u"\n", 0, offset)
+            if lines:
+                lastNewLine = chunk.rfind(u"\n", 0, offset)
+                if lastNewLine == offset - 1:
+                    if lines > 1:
+                        self.lastLineLength = (lastNewLine -
+                            chunk.rfind(u"\n", 0, lastNewLine) - 1)
+                    else:
+                        self.lastLineLength = col + lastNewLine
+                line += lines
+                col = offset - lastNewLine - 1
+            else:
+                col += offset
+            self.chunkStart = (line, col)
+        self.chunkNewLines = None
 
     def char(self):
         """ Read one character from the stream or queue if available. Return
@@ -326,47 +613,103 @@ class HTMLInputStream:
         char = self.chunk[self.chunkOffset]
         self.chunkOffset += 1
 
-        # Update the position attributes
-        if char == u"\n":
-            self.lastLineLength = self.positionCol
-            self.positionCol = 0
-            self.positionLine += 1
-        elif char is not EOF:
-            self.positionCol += 1
-
         return char
 
-    def readChunk(self, chunkSize=_defaultChunkSize):
+    def readChunk(self, chunkSize=None):
+        self.startChunk(self.chunkSize)
         self.chunk = u""
         self.chunkSize = 0
         self.chunkOffset = 0
 
-        data = self.dataStream.read(chunkSize)
-
-        if not data:
+        if self.dataStream is None:
+            # Unicode input, which was read in full by reset()
             return False
-        #Replace null characters
-        for i in xrange(data.count(u"\u0000")):
-            self.errors.append("null-character")
-        for i in xrange(len(invalid_unicode_re.findall(data))):
-            self.errors.append("invalid-codepoint")
 
-        data = data.replace(u"\u0000", u"\ufffd")
-        #Check for CR LF broken across chunks
-        if (self._lastChunkEndsWithCR and data[0] == u"\n"):
-            data = data[1:]
-            # Stop if the chunk is now empty
+        if chunkSize is None:
+            chunkSize = self.readSize
+            if self.adaptiveChunkSize and chunkSize < self._maxChunkSize:
+                self.readSize = min(chunkSize * 2, self._maxChunkSize)
+        tentative = self.charEncoding[1] != "certain"
+        if tentative:
+            # Where the chunk starts, in case a meta element changes the
+            # encoding before the end of it; see switchEncoding()
+            undecoded = getattr(self.dataStream, "bytebuffer", "")
+            self.chunkBytesStart = self.rawStream.tell() - len(undecoded)
+            self.chunkTextStart = self.textOffset
+            self.chunkAfterCR = self._lastChunkEndsWithCR
+            numErrors = len(self.errors)
+        while True:
+            data = self.dataStream.read(chunkSize)
             if not data:
                 return False
-        self._lastChunkEndsWithCR = data[-1] == u"\r"
-        data = data.replace(u"\r\n", u"\n")
-        data = data.replace(u"\r", u"\n")
+            data = self.normalizeText(data)
+            # The chunk is only empty now if all it held was the LF of a
+            # CR LF pair split across chunks, which is not the end of the
+            # input
+            if data:
+                break
 
         self.chunk = data
         self.chunkSize = len(data)
+        if tentative:
+            self.chunkErrors = self.errors[numErrors:]
 
         return True
 
+    def normalizeText(self, data):
+        """Replace null characters and newlines in a piece of newly decoded
+        text, recording errors for null characters and invalid codepoints.
+        Pieces must be passed in document order so that CR LF pairs split
+        across them are handled and the offsets of errors are right"""
+        #Check for CR LF broken across chunks
+        if (self._lastChunkEndsWithCR and data[0] == u"\n"):
+            data = data[1:]
+            if not data:
+                return data
+        self._lastChunkEndsWithCR = data[-1] == u"\r"
+
+        # For most text a single search shows there is nothing to do
+        if special_chars_re.search(data) is not None:
+            if u"\r" in data:
+                data = data.replace(u"\r\n", u"\n")
+                data = data.replace(u"\r", u"\n")
+            self.findCharErrors(data)
+            if u"\u0000" in data:
+                data = data.replace(u"\u0000", u"\ufffd")
+        self.textOffset += len(data)
+        return data
+
+    def findCharErrors(self, data):
+        """Record the null characters and invalid codepoints in a piece of
+        normalized text. Rather than an entry per character, self.errors gets
+        an entry per error code: the code and an array of the offsets of the
+        characters from the start of the normalized document"""
+        if non_bmp_re is not None and non_bmp_re.search(data):
+            errors_re = char_errors_re
+        else:
+            errors_re = char_errors_bmp_re
+        nulls = array("l")
+        invalid = array("l")
+        textOffset = self.textOffset
+        for match in errors_re.finditer(data):
+            if match.group() == u"\u0000":
+                nulls.append(textOffset + match.start())
+            else:
+                invalid.append(textOffset + match.start())
+        if nulls:
+            self.errors.append(("null-character", nulls))
+        if invalid:
+            self.errors.append(("invalid-codepoint", invalid))
+
+    def popErrors(self):
+        """Return the codes of the errors recorded since the last call, one
+        for each occurrence, and forget them"""
+        rv = []
+        for code, offsets in self.errors:
+            rv.extend([code] * len(offsets))
+        self.errors = []
+        return rv
+
     def charsUntil(self, characters, opposite = False):
         """ Returns a string of characters from the stream up to but not
         including any character in 'characters' or EOF. 'characters' must be
@@ -409,9 +752,7 @@ class HTMLInputStream:
                 # Reached EOF
                 break
 
-        r = u"".join(rv)
-        self.updatePosition(r)
-        return r
+        return u"".join(rv)
 
     def unget(self, char):
         # Only one character is allowed to be ungotten at once - it must
@@ -426,19 +767,225 @@ class HTMLInputStream:
                 # chunk:
                 self.chunk = char + self.chunk
                 self.chunkSize += 1
+                # The chunk now starts one character earlier
+                line, col = self.chunkStart
+                if char == u"\n":
+                    assert line > 1
+                    assert self.lastLineLength is not None
+                    self.chunkStart = (line - 1, self.lastLineLength)
+                    self.lastLineLength = None
+                else:
+                    self.chunkStart = (line, col - 1)
+                self.chunkNewLines = None
             else:
                 self.chunkOffset -= 1
                 assert self.chunk[self.chunkOffset] == char
 
-            # Update the position attributes
-            if char == u"\n":
-                assert self.positionLine >= 1
-                assert self.lastLineLength is not None
-                self.positionLine -= 1
-                self.positionCol = self.lastLineLength
-                self.lastLineLength = None
+class HTMLPushInputStream(HTMLInputStream):
+    """An HTMLInputStream that is given the document piece by piece.
+
+    Data is passed in with feed() as it arrives and close() is called after
+    the last piece. When the tokenizer asks for more characters than have
+    been fed so far NeedMoreData is raised; the tokenizer then goes back to
+    the position saved with mark(), by calling rewind(), and tries again once
+    more data has been fed. Only the text from the mark onwards is kept.
+
+    Undecoded bytes are kept as well while the encoding is only tentative,
+    so the document can be reparsed if a meta element changes it. Passing an
+    encoding, or feeding unicode, avoids this. At most maxRawDataSize bytes
+    are kept: once more have been fed the encoding is taken to be certain,
+    the bytes are dropped and later meta elements are ignored.
+    """
+
+    # The most undecoded bytes kept for reparsing
+    maxRawDataSize = 1 << 20
+
+    def __init__(self, encoding=None, parseMeta=True, chardet=True,
+                 maxRawDataSize=None):
+        self.newLines = [0]
+
+        self.charEncoding = (codecName(encoding), "certain")
+        self.parseMeta = parseMeta
+        self.chardet = chardet
+
+        self.numBytesMeta = 512
+        self.numBytesChardet = CharsetDetector.sampleSize
+        self.defaultEncoding = "windows-1252"
+        if maxRawDataSize is not None:
+            self.maxRawDataSize = maxRawDataSize
+
+        # Bytes fed so far, for encoding detection and reparsing
+        self.rawData = []
+        self.rawDataSize = 0
+        self.decoder = None
+        self.closed = False
+
+        self.reset()
+
+    def reset(self):
+        self.chunk = u""
+        self.chunkSize = 0
+        self.chunkOffset = 0
+        self.errors = []
+
+        self.chunkStart = (1, 0)
+        self.chunkNewLines = None
+        self.lastLineLength = None
+
+        self._lastChunkEndsWithCR = False
+        self.textOffset = 0
+
+        # Normalized text that has been fed but not read into the chunk yet
+        self.pendingText = []
+        # Saved position to go back to; see mark()
+        self.markOffset = 0
+
+        if self.decoder:
+            # Decode everything again, e.g. with a new encoding
+            self.startDecoding()
+
+    def feed(self, data):
+        """Add the next piece of the document, either bytes or unicode"""
+        assert not self.closed
+        if isinstance(data, unicode):
+            if self.decoder or self.rawData:
+                raise TypeError("Cannot mix bytes and unicode input")
+            if self.decoder is None:
+                self.charEncoding = ("utf-8", "certain")
+                self.decoder = False
+            self.addText(data)
+        else:
+            if self.decoder is False:
+                raise TypeError("Cannot mix bytes and unicode input")
+            if self.decoder is None or self.charEncoding[1] != "certain":
+                self.rawData.append(data)
+                self.rawDataSize += len(data)
+            if self.decoder is None:
+                if (self.charEncoding[0] is not None or
+                    self.rawDataSize >= self.numBytesMeta):
+                    self.startDecoding()
             else:
-                self.positionCol -= 1
+                self.addText(self.decoder.decode(data))
+            if (self.charEncoding[1] == "tentative" and
+                self.rawDataSize > self.maxRawDataSize):
+                # Too much to keep for a reparse; stay with the encoding
+                self.charEncoding = (self.charEncoding[0], "certain")
+                self.rawData = []
+                self.rawDataSize = 0
+
+    def close(self):
+        """Signal that the whole document has been fed"""
+        if self.decoder is None:
+            self.startDecoding()
+        if self.decoder:
+            self.addText(self.decoder.decode("", True))
+        self.closed = True
+
+    def startDecoding(self):
+        # Detect the encoding, if necessary, from the bytes fed so far and
+        # decode them
+        self.rawStream = self.openStream("".join(self.rawData))
+        if self.charEncoding[0] is None:
+            self.charEncoding = self.detectEncoding(self.parseMeta,
+                                                    self.chardet)
+        if self.charEncoding[1] == "certain":
+            self.rawData = []
+            self.rawDataSize = 0
+        self.decoder = codecs.getincrementaldecoder(self.charEncoding[0])(
+            'replace')
+        self.addText(self.decoder.decode(self.rawStream.read(), self.closed))
+        self.rawStream = None
+
+    def addText(self, data):
+        if data:
+            data = self.normalizeText(data)
+            if data:
+                self.pendingText.append(data)
+
+    def changeEncoding(self, newEncoding):
+        newEncoding = codecName(newEncoding)
+        if newEncoding in ("utf-16", "utf-16-be", "utf-16-le"):
+            newEncoding = "utf-8"
+        if newEncoding is None:
+            return
+        elif newEncoding == self.charEncoding[0]:
+            self.charEncoding = (self.charEncoding[0], "certain")
+            self.rawData = []
+            self.rawDataSize = 0
+        elif self.switchEncoding(newEncoding):
+            self.charEncoding = (newEncoding, "certain")
+            self.rawData = []
+            self.rawDataSize = 0
+        else:
+            oldEncoding = self.charEncoding[0]
+            self.charEncoding = (newEncoding, "certain")
+            self.reset()
+            raise ReparseException, "Encoding changed from %s to %s"%(oldEncoding, newEncoding)
+
+    def switchEncoding(self, newEncoding):
+        decoder = self.decoder
+        if isinstance(decoder, codecs.BufferedIncrementalDecoder):
+            undecoded = decoder.buffer
+        elif (isinstance(decoder, codecs.IncrementalDecoder) and
+              not isinstance(decoder, MultibyteIncrementalDecoder)):
+            # Single byte codecs, which decode every byte straight away
+            undecoded = ""
+        else:
+            return False
+        data = "".join(self.rawData)
+        decodedEnd = len(data) - len(undecoded)
+        if not self.decodesAlike(data[:decodedEnd], newEncoding):
+            return False
+        self.decoder = codecs.getincrementaldecoder(newEncoding)('replace')
+        self.addText(self.decoder.decode(data[decodedEnd:], self.closed))
+        return True
+
+    def mark(self):
+        """Remember the current position, forgetting any earlier text"""
+        self.markOffset = self.chunkOffset
+
+    def rewind(self):
+        """Go back to the position saved by the last call to mark()"""
+        self.chunkOffset = self.markOffset
+
+    def textRun(self, characters):
+        """Like charsUntil, but returns what it can instead of waiting for
+        more data. A run that reaches the end of the data fed so far is cut
+        after its last space character, and the rest is left to be read again
+        with the next piece, so that a leading space character is never split
+        off from the middle of a run of text"""
+        self.mark()
+        # Make readChunk report the end of the data fed so far as EOF
+        closed = self.closed
+        self.closed = True
+        try:
+            chars = self.charsUntil(characters)
+        finally:
+            self.closed = closed
+        if (not closed and self.chunkOffset == self.chunkSize and
+            not self.pendingText):
+            cut = max([chars.rfind(c) for c in spaceCharacters]) + 1
+            self.rewind()
+            chars = chars[:cut]
+            self.chunkOffset += cut
+        return chars
+
+    def readChunk(self, chunkSize=None):
+        # The current chunk has been used up; start a new one holding the
+        # text from the mark onwards followed by the text fed since
+        if not self.pendingText:
+            self.chunkOffset = self.chunkSize
+            if self.closed:
+                return False
+            raise NeedMoreData
+        self.startChunk(self.markOffset)
+        keep = self.chunk[self.markOffset:]
+        self.chunk = keep + u"".join(self.pendingText)
+        self.pendingText = []
+        self.chunkSize = len(self.chunk)
+        self.chunkOffset = len(keep)
+        self.markOffset = 0
+        return True
 
 class EncodingBytes(str):
     """String-like object with an assosiated position and various extra methods
@@ -711,6 +1258,230 @@ class ContentAttrParser(object):
         except StopIteration:
             return None
 
+class EncodingPrescanner(object):
+    """Finds the encoding given by a meta element in the same way as
+    EncodingParser, but a run of bytes at a time, with str.find and regular
+    expressions, rather than a byte at a time"""
+
+    def __init__(self, data):
+        """data - the bytes to look for a meta element in"""
+        # EncodingParser lowercases the names and values of attributes, and
+        # compares the start of tags in lowercase
+        self.data = data.translate(asciiLowerBytes)
+
+    def getEncoding(self):
+        data = self.data
+        if "<meta" not in data:
+            # Only meta elements give an encoding
+            return None
+        find = data.find
+        startswith = data.startswith
+        # Each step leaves position on the last byte it has dealt with and
+        # the next one starts at the next "<". Running off the end of the
+        # data in the middle of a step ends the search
+        position = find("<")
+        try:
+            while position != -1:
+                if startswith("<!--", position):
+                    position = self.jumpTo("-->", position + 4) + 2
+                elif startswith("<meta", position):
+                    position += 5
+                    if data[position] in spaceBytes:
+                        position, encoding = self.handleMeta(position)
+                        if encoding is not None:
+                            return encoding
+                elif startswith("</", position):
+                    if data[position + 3] in asciiLettersBytes:
+                        position = self.handleTag(position + 3)
+                    else:
+                        position = self.jumpTo(">", position + 2)
+                elif startswith("<!", position) or startswith("<?", position):
+                    position = self.jumpTo(">", position + 2)
+                elif data[position + 1] in asciiLettersBytes:
+                    position = self.handleTag(position + 1)
+                else:
+                    position += 1
+                position = find("<", position + 1)
+        except (IndexError, StopIteration):
+            pass
+        return None
+
+    def jumpTo(self, bytes, position):
+        """Return the position of the next occurrence of bytes"""
+        position = self.data.find(bytes, position)
+        if position == -1:
+            raise StopIteration
+        return position
+
+    def handleMeta(self, position):
+        """Look through the attributes of a meta element for an encoding.
+        Returns the position the attributes end at and the encoding or None"""
+        while True:
+            position, attr = self.getAttribute(position)
+            if attr is None:
+                return position, None
+            name, value = attr
+            if name == "charset":
+                codec = codecName(value)
+            elif name == "content":
+                codec = codecName(self.getContentCharset(value))
+            else:
+                continue
+            if codec is not None:
+                return position, codec
+
+    def handleTag(self, position):
+        """Skip over a tag whose name starts at position"""
+        position = tagNameEnd_re.search(self.data, position)
+        if position is None:
+            raise StopIteration
+        position = position.start()
+        if self.data[position] == "<":
+            return position - 1
+        attr = True
+        while attr is not None:
+            position, attr = self.getAttribute(position)
+        return position
+
+    def getAttribute(self, position):
+        """Return the position after the next attribute and its name and
+        value, or the position of the end of the tag and None"""
+        data = self.data
+        position = attrStart_re.match(data, position).end()
+        byte = data[position]
+        if byte == "<":
+            return position - 1, None
+        elif byte == ">":
+            return position, None
+        start = position
+        position = attrName_re.match(data, position + 1).end()
+        name = data[start:position]
+        byte = data[position]
+        if byte in "/<>":
+            return position, (name, "")
+        elif byte != "=":
+            position = spaces_re.match(data, position).end()
+            if data[position] != "=":
+                return position - 1, (name, "")
+        position = spaces_re.match(data, position + 1).end()
+        byte = data[position]
+        if byte == '"' or byte == "'":
+            end = self.jumpTo(byte, position + 1)
+            return end + 1, (name, data[position + 1:end])
+        elif byte == "<" or byte == ">":
+            return position, (name, "")
+        end = attrValue_re.match(data, position + 1).end()
+        if end == len(data):
+            raise StopIteration
+        return end, (name, data[position:end])
+
+    def getContentCharset(self, value):
+        """Return the charset given in the value of a content attribute, as
+        ContentAttrParser finds it, or None"""
+        position = value.find(";")
+        if position == -1:
+            return None
+        position = value.find("charset", position)
+        if position == -1:
+            return None
+        position = spaces_re.match(value, position + 7).end()
+        if value[position:position + 1] != "=":
+            return None
+        position = spaces_re.match(value, position + 1).end()
+        quote = value[position:position + 1]
+        if quote == '"' or quote == "'":
+            end = value.find(quote, position + 1)
+            if end == -1:
+                return None
+            return value[position + 1:end]
+        elif not quote:
+            return None
+        end = space_re.search(value, position)
+        if end is None:
+            return value[position:]
+        return value[position:end.start()]
+
+class CharsetDetector(object):
+    """Guesses the encoding of a document that doesn't say what it is from a
+    sample of its first bytes, with chardet if it is installed. Instances are
+    called with the sample and return the name of an encoding or None; they
+    can be given to HTMLInputStream, or to HTMLParser as charsetDetector, in
+    place of chardet's usual way of working through the whole document.
+    Override detect() to use some other way of guessing.
+
+    The documents from one origin, such as a web site, are usually all in
+    the same encoding. forOrigin() gives a detector that only guesses for
+    the first document from an origin and uses that guess for the rest.
+    """
+
+    # The most bytes to look at
+    sampleSize = 8192
+    # The most origins to remember guesses for
+    maxOrigins = 1000
+
+    def __init__(self, sampleSize=None, maxOrigins=None):
+        if sampleSize is not None:
+            self.sampleSize = sampleSize
+        if maxOrigins is not None:
+            self.maxOrigins = maxOrigins
+        self.origins = {}
+
+    def __call__(self, sample):
+        return self.detect(sample[:self.sampleSize])
+
+    def detect(self, sample):
+        """Return the encoding of sample, or None if it can't be told"""
+        detector = chardetDetector()
+        if detector is None:
+            return None
+        detector.feed(sample)
+        detector.close()
+        return detector.result['encoding']
+
+    def forOrigin(self, origin):
+        """Return a detector for documents from origin, any hashable object
+        identifying where they come from"""
+        return OriginCharsetDetector(self, origin)
+
+class OriginCharsetDetector(object):
+    """The detector CharsetDetector.forOrigin returns"""
+
+    def __init__(self, detector, origin):
+        self.detector = detector
+        self.origin = origin
+        self.sampleSize = detector.sampleSize
+
+    def __call__(self, sample):
+        origins = self.detector.origins
+        try:
+            return origins[self.origin]
+        except KeyError:
+            pass
+        encoding = self.detector(sample)
+        if len(origins) >= self.detector.maxOrigins:
+            origins.clear()
+        origins[self.origin] = encoding
+        return encoding
+
+# chardet's UniversalDetector class, once it has been looked for, or None if
+# chardet isn't installed
+UniversalDetector = False
+
+def chardetDetector():
+    """Return a new chardet UniversalDetector, or None if chardet isn't
+    installed. Looking for it is only done once, as failing to import a
+    module is slow"""
+    global UniversalDetector
+    if UniversalDetector is False:
+        try:
+            from chardet.universaldetector import UniversalDetector
+        except ImportError:
+            UniversalDetector = None
+    if UniversalDetector is None:
+        return None
+    return UniversalDetector()
+
+defaultCharsetDetector = CharsetDetector()
 
 def codecName(encoding):
     """Return the python codec name corresponding to an encoding or None if the
@@ -128,12 +128,8 @@ class XmlRootPhase(html5parser.Phase):
 class XmlElementPhase(html5parser.Phase):
     """ Generic handling for all XML elements """
 
-    def __init__(self, *args, **kwargs):
-        html5parser.Phase.__init__(self, *args, **kwargs)
-        self.startTagHandler = html5parser.utils.MethodDispatcher([])
-        self.startTagHandler.default = self.startTagOther
-        self.endTagHandler = html5parser.utils.MethodDispatcher([])
-        self.endTagHandler.default = self.endTagOther
+    startTagMethods = []
+    endTagMethods = []
 
     def startTagOther(self, name, attributes):
         element = self.tree.createElement(name, attributes)
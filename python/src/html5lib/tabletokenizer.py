@@ -0,0 +1,824 @@
+"""Table driven variant of the HTML tokenizer
+
+TableDrivenTokenizer produces exactly the same token stream as
+tokenizer.HTMLTokenizer but represents the tokenizer states as small
+integers rather than bound methods. For most states the work to do for a
+character is found by looking the character up in a per-state table
+mapping character classes to handler functions, so the main loop is a list
+index, a stream read and a dict lookup per character.
+
+It can be used in place of the reference tokenizer:
+
+p = html5lib.HTMLParser(tokenizer=tabletokenizer.TableDrivenTokenizer)
+"""
+
+try:
+    frozenset
+except NameError:
+    # Import from the sets module for python 2.3
+    from sets import Set as set
+    from sets import ImmutableSet as frozenset
+try:
+    from collections import deque
+except ImportError:
+    from utils import deque
+
+from constants import spaceCharacters, asciiLetters, asciiUpper2Lower
+from constants import contentModelFlags, tokenTypes, EOF
+from tokenizer import HTMLTokenizer
+from tokens import compactToken
+from utils import MethodDispatcher
+
+PCDATA = contentModelFlags["PCDATA"]
+
+ParseErrorToken = tokenTypes["ParseError"]
+CharactersToken = tokenTypes["Characters"]
+
+stateNames = (
+    "data",
+    "entityData",
+    "tagOpen",
+    "closeTagOpen",
+    "tagName",
+    "beforeAttributeName",
+    "attributeName",
+    "afterAttributeName",
+    "beforeAttributeValue",
+    "attributeValueDoubleQuoted",
+    "attributeValueSingleQuoted",
+    "attributeValueUnQuoted",
+    "afterAttributeValue",
+    "bogusComment",
+    "bogusCommentContinuation",
+    "markupDeclarationOpen",
+    "commentStart",
+    "commentStartDash",
+    "comment",
+    "commentEndDash",
+    "commentEnd",
+    "doctype",
+    "beforeDoctypeName",
+    "doctypeName",
+    "afterDoctypeName",
+    "beforeDoctypePublicIdentifier",
+    "doctypePublicIdentifierDoubleQuoted",
+    "doctypePublicIdentifierSingleQuoted",
+    "afterDoctypePublicIdentifier",
+    "beforeDoctypeSystemIdentifier",
+    "doctypeSystemIdentifierDoubleQuoted",
+    "doctypeSystemIdentifierSingleQuoted",
+    "afterDoctypeSystemIdentifier",
+    "bogusDoctype"
+)
+
+(DATA,
+ ENTITY_DATA,
+ TAG_OPEN,
+ CLOSE_TAG_OPEN,
+ TAG_NAME,
+ BEFORE_ATTRIBUTE_NAME,
+ ATTRIBUTE_NAME,
+ AFTER_ATTRIBUTE_NAME,
+ BEFORE_ATTRIBUTE_VALUE,
+ ATTRIBUTE_VALUE_DOUBLE_QUOTED,
+ ATTRIBUTE_VALUE_SINGLE_QUOTED,
+ ATTRIBUTE_VALUE_UNQUOTED,
+ AFTER_ATTRIBUTE_VALUE,
+ BOGUS_COMMENT,
+ BOGUS_COMMENT_CONTINUATION,
+ MARKUP_DECLARATION_OPEN,
+ COMMENT_START,
+ COMMENT_START_DASH,
+ COMMENT,
+ COMMENT_END_DASH,
+ COMMENT_END,
+ DOCTYPE,
+ BEFORE_DOCTYPE_NAME,
+ DOCTYPE_NAME,
+ AFTER_DOCTYPE_NAME,
+ BEFORE_DOCTYPE_PUBLIC_IDENTIFIER,
+ DOCTYPE_PUBLIC_IDENTIFIER_DOUBLE_QUOTED,
+ DOCTYPE_PUBLIC_IDENTIFIER_SINGLE_QUOTED,
+ AFTER_DOCTYPE_PUBLIC_IDENTIFIER,
+ BEFORE_DOCTYPE_SYSTEM_IDENTIFIER,
+ DOCTYPE_SYSTEM_IDENTIFIER_DOUBLE_QUOTED,
+ DOCTYPE_SYSTEM_IDENTIFIER_SINGLE_QUOTED,
+ AFTER_DOCTYPE_SYSTEM_IDENTIFIER,
+ BOGUS_DOCTYPE) = range(len(stateNames))
+
+unquotedAttributeValueStopChars = (frozenset(("&", ">", "<", "=", "'", '"')) |
+                                   spaceCharacters)
+
+def characterTable(items, default):
+    """Build the character class table for a state. items is a list of
+    (characters, handler) pairs where characters is a single character (or
+    EOF) or a set of characters"""
+    table = MethodDispatcher(items)
+    table.default = default
+    return table
+
+# Generic handlers shared between states
+
+def ignore(self, data):
+    return True
+
+def switchTo(state):
+    """Return a handler that just moves to a new state"""
+    def handler(self, data):
+        self.state = state
+        return True
+    return handler
+
+def parseError(errorCode, state):
+    """Return a handler that reports a parse error and moves to a new state"""
+    def handler(self, data):
+        self.tokenQueue.append({"type": ParseErrorToken, "data": errorCode})
+        self.state = state
+        return True
+    return handler
+
+def emitTag(self, data):
+    self.emitCurrentToken()
+    return True
+
+def emitTagWithError(errorCode):
+    def handler(self, data):
+        self.tokenQueue.append({"type": ParseErrorToken, "data": errorCode})
+        self.emitCurrentToken()
+        return True
+    return handler
+
+def emitToken(self, data):
+    self.tokenQueue.append(self.currentToken)
+    self.state = DATA
+    return True
+
+def emitTokenWithError(errorCode):
+    def handler(self, data):
+        self.tokenQueue.append({"type": ParseErrorToken, "data": errorCode})
+        self.tokenQueue.append(self.currentToken)
+        self.state = DATA
+        return True
+    return handler
+
+def emitIncorrectDoctype(errorCode):
+    def handler(self, data):
+        self.tokenQueue.append({"type": ParseErrorToken, "data": errorCode})
+        self.currentToken["correct"] = False
+        self.tokenQueue.append(self.currentToken)
+        self.state = DATA
+        return True
+    return handler
+
+def bogusDoctype(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "unexpected-char-in-doctype"})
+    self.currentToken["correct"] = False
+    self.state = BOGUS_DOCTYPE
+    return True
+
+def solidusInTag(self, data):
+    if not self.processSolidusInTag():
+        self.state = BEFORE_ATTRIBUTE_NAME
+    return True
+
+def skipSpaces(self, data):
+    self.stream.charsUntil(spaceCharacters, True)
+    return True
+
+def startAttribute(self, data):
+    self.currentToken["data"].append([data, ""])
+    self.state = ATTRIBUTE_NAME
+    return True
+
+def startAttributeWithError(errorCode):
+    def handler(self, data):
+        self.tokenQueue.append({"type": ParseErrorToken, "data": errorCode})
+        self.currentToken["data"].append([data, ""])
+        self.state = ATTRIBUTE_NAME
+        return True
+    return handler
+
+# Tag open state (only used in the PCDATA content model)
+
+def tagOpenStartTag(self, data):
+    self.currentToken = {"type": tokenTypes["StartTag"], "name": data,
+                         "data": []}
+    self.state = TAG_NAME
+    return True
+
+def tagOpenRightBracket(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "expected-tag-name-but-got-right-bracket"})
+    self.tokenQueue.append({"type": CharactersToken, "data": u"<>"})
+    self.state = DATA
+    return True
+
+def tagOpenQuestionMark(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "expected-tag-name-but-got-question-mark"})
+    self.stream.unget(data)
+    self.state = BOGUS_COMMENT
+    return True
+
+def tagOpenOther(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "expected-tag-name"})
+    self.tokenQueue.append({"type": CharactersToken, "data": u"<"})
+    self.stream.unget(data)
+    self.state = DATA
+    return True
+
+tagOpenTable = characterTable([
+    (u"!", switchTo(MARKUP_DECLARATION_OPEN)),
+    (u"/", switchTo(CLOSE_TAG_OPEN)),
+    (asciiLetters, tagOpenStartTag),
+    (u">", tagOpenRightBracket),
+    (u"?", tagOpenQuestionMark)
+], tagOpenOther)
+
+def tagOpenState(self):
+    data = self.stream.char()
+    if self.contentModelFlag == PCDATA:
+        return tagOpenTable.get(data, tagOpenOther)(self, data)
+    # We know the content model flag is set to either RCDATA or CDATA
+    # now because this state can never be entered with the PLAINTEXT
+    # flag.
+    if data == u"/":
+        self.state = CLOSE_TAG_OPEN
+    else:
+        self.tokenQueue.append({"type": CharactersToken, "data": u"<"})
+        self.stream.unget(data)
+        self.state = DATA
+    return True
+
+# Tag name state
+
+def tagNameAppend(self, data):
+    self.currentToken["name"] += data
+    return True
+
+tagNameTable = characterTable([
+    (spaceCharacters, switchTo(BEFORE_ATTRIBUTE_NAME)),
+    (u">", emitTag),
+    (EOF, emitTagWithError("eof-in-tag-name")),
+    (u"/", solidusInTag)
+], tagNameAppend)
+
+# Before attribute name state
+
+def beforeAttributeNameSolidus(self, data):
+    self.processSolidusInTag()
+    return True
+
+beforeAttributeNameTable = characterTable([
+    (spaceCharacters, skipSpaces),
+    (asciiLetters, startAttribute),
+    (u">", emitTag),
+    (u"/", beforeAttributeNameSolidus),
+    ((u"'", u'"', u"="),
+     startAttributeWithError("invalid-character-in-attribute-name")),
+    (EOF, emitTagWithError("expected-attribute-name-but-got-eof"))
+], startAttribute)
+
+# Attribute name state
+
+def leaveAttributeName(self, emitToken=False):
+    # Attributes are not dropped at this stage. That happens when the
+    # start tag token is emitted so values can still be safely appended
+    # to attributes, but we do want to report the parse error in time.
+    attributes = self.currentToken["data"]
+    if self.lowercaseAttrName:
+        attributes[-1][0] = attributes[-1][0].translate(asciiUpper2Lower)
+    for name, value in attributes[:-1]:
+        if attributes[-1][0] == name:
+            self.tokenQueue.append({"type": ParseErrorToken, "data":
+              "duplicate-attribute"})
+            break
+    if emitToken:
+        self.emitCurrentToken()
+    return True
+
+def attributeNameEquals(self, data):
+    self.state = BEFORE_ATTRIBUTE_VALUE
+    return leaveAttributeName(self)
+
+def attributeNameLetters(self, data):
+    self.currentToken["data"][-1][0] += data +\
+      self.stream.charsUntil(asciiLetters, True)
+    return True
+
+def attributeNameRightBracket(self, data):
+    return leaveAttributeName(self, True)
+
+def attributeNameSpace(self, data):
+    self.state = AFTER_ATTRIBUTE_NAME
+    return leaveAttributeName(self)
+
+def attributeNameSolidus(self, data):
+    if not self.processSolidusInTag():
+        self.state = BEFORE_ATTRIBUTE_NAME
+    return leaveAttributeName(self)
+
+def attributeNameQuote(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "invalid-character-in-attribute-name"})
+    self.currentToken["data"][-1][0] += data
+    return True
+
+def attributeNameEOF(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "eof-in-attribute-name"})
+    self.state = DATA
+    return leaveAttributeName(self, True)
+
+def attributeNameAppend(self, data):
+    self.currentToken["data"][-1][0] += data
+    return True
+
+attributeNameTable = characterTable([
+    (u"=", attributeNameEquals),
+    (asciiLetters, attributeNameLetters),
+    (u">", attributeNameRightBracket),
+    (spaceCharacters, attributeNameSpace),
+    (u"/", attributeNameSolidus),
+    ((u"'", u'"'), attributeNameQuote),
+    (EOF, attributeNameEOF)
+], attributeNameAppend)
+
+# After attribute name state
+
+afterAttributeNameTable = characterTable([
+    (spaceCharacters, skipSpaces),
+    (u"=", switchTo(BEFORE_ATTRIBUTE_VALUE)),
+    (u">", emitTag),
+    (asciiLetters, startAttribute),
+    (u"/", solidusInTag),
+    ((u"'", u'"'),
+     startAttributeWithError("invalid-character-after-attribute-name")),
+    (EOF, emitTagWithError("expected-end-of-tag-but-got-eof"))
+], startAttribute)
+
+# Before attribute value state
+
+def beforeAttributeValueAmpersand(self, data):
+    self.state = ATTRIBUTE_VALUE_UNQUOTED
+    self.stream.unget(data)
+    return True
+
+def beforeAttributeValueEquals(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "equals-in-unquoted-attribute-value"})
+    self.currentToken["data"][-1][1] += data
+    self.state = ATTRIBUTE_VALUE_UNQUOTED
+    return True
+
+def beforeAttributeValueOther(self, data):
+    self.currentToken["data"][-1][1] += data
+    self.state = ATTRIBUTE_VALUE_UNQUOTED
+    return True
+
+beforeAttributeValueTable = characterTable([
+    (spaceCharacters, skipSpaces),
+    (u"\"", switchTo(ATTRIBUTE_VALUE_DOUBLE_QUOTED)),
+    (u"&", beforeAttributeValueAmpersand),
+    (u"'", switchTo(ATTRIBUTE_VALUE_SINGLE_QUOTED)),
+    (u">", emitTagWithError("expected-attribute-value-but-got-right-bracket")),
+    (u"=", beforeAttributeValueEquals),
+    (EOF, emitTagWithError("expected-attribute-value-but-got-eof"))
+], beforeAttributeValueOther)
+
+# Attribute value (double quoted) state
+
+def attributeValueDoubleQuotedEntity(self, data):
+    self.processEntityInAttribute(u'"')
+    return True
+
+def attributeValueDoubleQuotedAppend(self, data):
+    self.currentToken["data"][-1][1] += data +\
+      self.stream.charsUntil(("\"", u"&"))
+    return True
+
+attributeValueDoubleQuotedTable = characterTable([
+    (u"\"", switchTo(AFTER_ATTRIBUTE_VALUE)),
+    (u"&", attributeValueDoubleQuotedEntity),
+    (EOF, emitTagWithError("eof-in-attribute-value-double-quote"))
+], attributeValueDoubleQuotedAppend)
+
+# Attribute value (single quoted) state
+
+def attributeValueSingleQuotedEntity(self, data):
+    self.processEntityInAttribute(u"'")
+    return True
+
+def attributeValueSingleQuotedAppend(self, data):
+    self.currentToken["data"][-1][1] += data +\
+      self.stream.charsUntil(("'", u"&"))
+    return True
+
+attributeValueSingleQuotedTable = characterTable([
+    (u"'", switchTo(AFTER_ATTRIBUTE_VALUE)),
+    (u"&", attributeValueSingleQuotedEntity),
+    (EOF, emitTagWithError("eof-in-attribute-value-single-quote"))
+], attributeValueSingleQuotedAppend)
+
+# Attribute value (unquoted) state
+
+def attributeValueUnQuotedEntity(self, data):
+    self.processEntityInAttribute(None)
+    return True
+
+def attributeValueUnQuotedInvalid(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "unexpected-character-in-unquoted-attribute-value"})
+    self.currentToken["data"][-1][1] += data
+    return True
+
+def attributeValueUnQuotedAppend(self, data):
+    self.currentToken["data"][-1][1] += data +\
+      self.stream.charsUntil(unquotedAttributeValueStopChars)
+    return True
+
+attributeValueUnQuotedTable = characterTable([
+    (spaceCharacters, switchTo(BEFORE_ATTRIBUTE_NAME)),
+    (u"&", attributeValueUnQuotedEntity),
+    (u">", emitTag),
+    ((u'"', u"'", u"="), attributeValueUnQuotedInvalid),
+    (EOF, emitTagWithError("eof-in-attribute-value-no-quotes"))
+], attributeValueUnQuotedAppend)
+
+# After attribute value state
+
+def afterAttributeValueEOF(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "unexpected-EOF-after-attribute-value"})
+    self.emitCurrentToken()
+    self.stream.unget(data)
+    self.state = DATA
+    return True
+
+def afterAttributeValueOther(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "unexpected-character-after-attribute-value"})
+    self.stream.unget(data)
+    self.state = BEFORE_ATTRIBUTE_NAME
+    return True
+
+afterAttributeValueTable = characterTable([
+    (spaceCharacters, switchTo(BEFORE_ATTRIBUTE_NAME)),
+    (u">", emitTag),
+    (u"/", solidusInTag),
+    (EOF, afterAttributeValueEOF)
+], afterAttributeValueOther)
+
+# Comment states
+
+def commentStartOther(self, data):
+    self.currentToken["data"] += data + self.stream.charsUntil(u"-")
+    self.state = COMMENT
+    return True
+
+commentStartTable = characterTable([
+    (u"-", switchTo(COMMENT_START_DASH)),
+    (u">", emitTokenWithError("incorrect-comment")),
+    (EOF, emitTokenWithError("eof-in-comment"))
+], commentStartOther)
+
+def commentStartDashOther(self, data):
+    self.currentToken["data"] += "-" + data + self.stream.charsUntil(u"-")
+    self.state = COMMENT
+    return True
+
+commentStartDashTable = characterTable([
+    (u"-", switchTo(COMMENT_END)),
+    (u">", emitTokenWithError("incorrect-comment")),
+    (EOF, emitTokenWithError("eof-in-comment"))
+], commentStartDashOther)
+
+def commentAppend(self, data):
+    self.currentToken["data"] += data + self.stream.charsUntil(u"-")
+    return True
+
+commentTable = characterTable([
+    (u"-", switchTo(COMMENT_END_DASH)),
+    (EOF, emitTokenWithError("eof-in-comment"))
+], commentAppend)
+
+def commentEndDashOther(self, data):
+    self.currentToken["data"] += u"-" + data + self.stream.charsUntil(u"-")
+    # Consume the next character which is either a "-" or an EOF as
+    # well so if there's a "-" directly after the "-" we go nicely to
+    # the "comment end state" without emitting a ParseError() there.
+    self.stream.char()
+    return True
+
+commentEndDashTable = characterTable([
+    (u"-", switchTo(COMMENT_END)),
+    (EOF, emitTokenWithError("eof-in-comment-end-dash"))
+], commentEndDashOther)
+
+def commentEndDash(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+     "unexpected-dash-after-double-dash-in-comment"})
+    self.currentToken["data"] += data
+    return True
+
+def commentEndOther(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "unexpected-char-in-comment"})
+    self.currentToken["data"] += u"--" + data
+    self.state = COMMENT
+    return True
+
+commentEndTable = characterTable([
+    (u">", emitToken),
+    (u"-", commentEndDash),
+    (EOF, emitTokenWithError("eof-in-comment-double-dash"))
+], commentEndOther)
+
+# Doctype states
+
+def doctypeOther(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "need-space-after-doctype"})
+    self.stream.unget(data)
+    self.state = BEFORE_DOCTYPE_NAME
+    return True
+
+doctypeTable = characterTable([
+    (spaceCharacters, switchTo(BEFORE_DOCTYPE_NAME))
+], doctypeOther)
+
+def beforeDoctypeNameOther(self, data):
+    self.currentToken["name"] = data
+    self.state = DOCTYPE_NAME
+    return True
+
+beforeDoctypeNameTable = characterTable([
+    (spaceCharacters, ignore),
+    (u">", emitIncorrectDoctype("expected-doctype-name-but-got-right-bracket")),
+    (EOF, emitIncorrectDoctype("expected-doctype-name-but-got-eof"))
+], beforeDoctypeNameOther)
+
+def doctypeNameSpace(self, data):
+    self.currentToken["name"] = self.currentToken["name"].translate(asciiUpper2Lower)
+    self.state = AFTER_DOCTYPE_NAME
+    return True
+
+def doctypeNameRightBracket(self, data):
+    self.currentToken["name"] = self.currentToken["name"].translate(asciiUpper2Lower)
+    self.tokenQueue.append(self.currentToken)
+    self.state = DATA
+    return True
+
+def doctypeNameEOF(self, data):
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "eof-in-doctype-name"})
+    self.currentToken["correct"] = False
+    self.currentToken["name"] = self.currentToken["name"].translate(asciiUpper2Lower)
+    self.tokenQueue.append(self.currentToken)
+    self.state = DATA
+    return True
+
+def doctypeNameAppend(self, data):
+    self.currentToken["name"] += data
+    return True
+
+doctypeNameTable = characterTable([
+    (spaceCharacters, doctypeNameSpace),
+    (u">", doctypeNameRightBracket),
+    (EOF, doctypeNameEOF)
+], doctypeNameAppend)
+
+def afterDoctypeNameEOF(self, data):
+    self.currentToken["correct"] = False
+    self.stream.unget(data)
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+      "eof-in-doctype"})
+    self.tokenQueue.append(self.currentToken)
+    self.state = DATA
+    return True
+
+def afterDoctypeNameKeyword(expectedChars, state):
+    """Return a handler that matches the rest of the PUBLIC or SYSTEM
+    keyword case-insensitively"""
+    def handler(self, data):
+        matched = True
+        for expected in expectedChars:
+            data = self.stream.char()
+            if data not in expected:
+                matched = False
+                break
+        if matched:
+            self.state = state
+            return True
+        return afterDoctypeNameOther(self, data)
+    return handler
+
+def afterDoctypeNameOther(self, data):
+    # All the characters read before the current 'data' will be
+    # [a-zA-Z], so they're garbage in the bogus doctype and can be
+    # discarded; only the latest character might be '>' or EOF
+    # and needs to be ungetted
+    self.stream.unget(data)
+    self.tokenQueue.append({"type": ParseErrorToken, "data":
+        "expected-space-or-right-bracket-in-doctype", "datavars":
+        {"data": data}})
+    self.currentToken["correct"] = False
+    self.state = BOGUS_DOCTYPE
+    return True
+
+afterDoctypeNameTable = characterTable([
+    (spaceCharacters, ignore),
+    (u">", emitToken),
+    (EOF, afterDoctypeNameEOF),
+    ((u"p", u"P"), afterDoctypeNameKeyword(
+        ((u"u", u"U"), (u"b", u"B"), (u"l", u"L"), (u"i", u"I"), (u"c", u"C")),
+        BEFORE_DOCTYPE_PUBLIC_IDENTIFIER)),
+    ((u"s", u"S"), afterDoctypeNameKeyword(
+        ((u"y", u"Y"), (u"s", u"S"), (u"t", u"T"), (u"e", u"E"), (u"m", u"M")),
+        BEFORE_DOCTYPE_SYSTEM_IDENTIFIER))
+], afterDoctypeNameOther)
+
+def startIdentifier(key, state):
+    """Return a handler that starts a public or system identifier"""
+    def handler(self, data):
+        self.currentToken[key] = u""
+        self.state = state
+        return True
+    return handler
+
+def identifierAppend(key):
+    def handler(self, data):
+        self.currentToken[key] += data
+        return True
+    return handler
+
+beforeDoctypePublicIdentifierTable = characterTable([
+    (spaceCharacters, ignore),
+    (u"\"", startIdentifier("publicId", DOCTYPE_PUBLIC_IDENTIFIER_DOUBLE_QUOTED)),
+    (u"'", startIdentifier("publicId", DOCTYPE_PUBLIC_IDENTIFIER_SINGLE_QUOTED)),
+    (u">", emitIncorrectDoctype("unexpected-end-of-doctype")),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], bogusDoctype)
+
+doctypePublicIdentifierDoubleQuotedTable = characterTable([
+    (u"\"", switchTo(AFTER_DOCTYPE_PUBLIC_IDENTIFIER)),
+    (u">", emitIncorrectDoctype("unexpected-end-of-doctype")),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], identifierAppend("publicId"))
+
+doctypePublicIdentifierSingleQuotedTable = characterTable([
+    (u"'", switchTo(AFTER_DOCTYPE_PUBLIC_IDENTIFIER)),
+    (u">", emitIncorrectDoctype("unexpected-end-of-doctype")),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], identifierAppend("publicId"))
+
+afterDoctypePublicIdentifierTable = characterTable([
+    (spaceCharacters, ignore),
+    (u"\"", startIdentifier("systemId", DOCTYPE_SYSTEM_IDENTIFIER_DOUBLE_QUOTED)),
+    (u"'", startIdentifier("systemId", DOCTYPE_SYSTEM_IDENTIFIER_SINGLE_QUOTED)),
+    (u">", emitToken),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], bogusDoctype)
+
+beforeDoctypeSystemIdentifierTable = characterTable([
+    (spaceCharacters, ignore),
+    (u"\"", startIdentifier("systemId", DOCTYPE_SYSTEM_IDENTIFIER_DOUBLE_QUOTED)),
+    (u"'", startIdentifier("systemId", DOCTYPE_SYSTEM_IDENTIFIER_SINGLE_QUOTED)),
+    (u">", emitIncorrectDoctype("unexpected-char-in-doctype")),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], bogusDoctype)
+
+doctypeSystemIdentifierDoubleQuotedTable = characterTable([
+    (u"\"", switchTo(AFTER_DOCTYPE_SYSTEM_IDENTIFIER)),
+    (u">", emitIncorrectDoctype("unexpected-end-of-doctype")),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], identifierAppend("systemId"))
+
+doctypeSystemIdentifierSingleQuotedTable = characterTable([
+    (u"'", switchTo(AFTER_DOCTYPE_SYSTEM_IDENTIFIER)),
+    (u">", emitIncorrectDoctype("unexpected-end-of-doctype")),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], identifierAppend("systemId"))
+
+afterDoctypeSystemIdentifierTable = characterTable([
+    (spaceCharacters, ignore),
+    (u">", emitToken),
+    (EOF, emitIncorrectDoctype("eof-in-doctype"))
+], parseError("unexpected-char-in-doctype", BOGUS_DOCTYPE))
+
+def bogusDoctypeEOF(self, data):
+    self.stream.unget(data)
+    self.tokenQueue.append(self.currentToken)
+    self.state = DATA
+    return True
+
+bogusDoctypeTable = characterTable([
+    (u">", emitToken),
+    (EOF, bogusDoctypeEOF)
+], ignore)
+
+# The state table, indexed by state number. Each entry is a pair of
+# (character table, None) for states that consume one character and act on
+# its class, or (None, function) for states that do their own reading from
+# the stream. The latter reuse the reference implementations.
+stateTable = [None] * len(stateNames)
+stateTable[DATA] = (None, HTMLTokenizer.dataState.im_func)
+stateTable[ENTITY_DATA] = (None, HTMLTokenizer.entityDataState.im_func)
+stateTable[TAG_OPEN] = (None, tagOpenState)
+stateTable[CLOSE_TAG_OPEN] = (None, HTMLTokenizer.closeTagOpenState.im_func)
+stateTable[TAG_NAME] = (tagNameTable, None)
+stateTable[BEFORE_ATTRIBUTE_NAME] = (beforeAttributeNameTable, None)
+stateTable[ATTRIBUTE_NAME] = (attributeNameTable, None)
+stateTable[AFTER_ATTRIBUTE_NAME] = (afterAttributeNameTable, None)
+stateTable[BEFORE_ATTRIBUTE_VALUE] = (beforeAttributeValueTable, None)
+stateTable[ATTRIBUTE_VALUE_DOUBLE_QUOTED] = (attributeValueDoubleQuotedTable,
+                                             None)
+stateTable[ATTRIBUTE_VALUE_SINGLE_QUOTED] = (attributeValueSingleQuotedTable,
+                                             None)
+stateTable[ATTRIBUTE_VALUE_UNQUOTED] = (attributeValueUnQuotedTable, None)
+stateTable[AFTER_ATTRIBUTE_VALUE] = (afterAttributeValueTable, None)
+stateTable[BOGUS_COMMENT] = (None, HTMLTokenizer.bogusCommentState.im_func)
+stateTable[BOGUS_COMMENT_CONTINUATION] = (None,
+    HTMLTokenizer.bogusCommentContinuationState.im_func)
+stateTable[MARKUP_DECLARATION_OPEN] = (None,
+    HTMLTokenizer.markupDeclarationOpenState.im_func)
+stateTable[COMMENT_START] = (commentStartTable, None)
+stateTable[COMMENT_START_DASH] = (commentStartDashTable, None)
+stateTable[COMMENT] = (commentTable, None)
+stateTable[COMMENT_END_DASH] = (commentEndDashTable, None)
+stateTable[COMMENT_END] = (commentEndTable, None)
+stateTable[DOCTYPE] = (doctypeTable, None)
+stateTable[BEFORE_DOCTYPE_NAME] = (beforeDoctypeNameTable, None)
+stateTable[DOCTYPE_NAME] = (doctypeNameTable, None)
+stateTable[AFTER_DOCTYPE_NAME] = (afterDoctypeNameTable, None)
+stateTable[BEFORE_DOCTYPE_PUBLIC_IDENTIFIER] = (
+    beforeDoctypePublicIdentifierTable, None)
+stateTable[DOCTYPE_PUBLIC_IDENTIFIER_DOUBLE_QUOTED] = (
+    doctypePublicIdentifierDoubleQuotedTable, None)
+stateTable[DOCTYPE_PUBLIC_IDENTIFIER_SINGLE_QUOTED] = (
+    doctypePublicIdentifierSingleQuotedTable, None)
+stateTable[AFTER_DOCTYPE_PUBLIC_IDENTIFIER] = (
+    afterDoctypePublicIdentifierTable, None)
+stateTable[BEFORE_DOCTYPE_SYSTEM_IDENTIFIER] = (
+    beforeDoctypeSystemIdentifierTable, None)
+stateTable[DOCTYPE_SYSTEM_IDENTIFIER_DOUBLE_QUOTED] = (
+    doctypeSystemIdentifierDoubleQuotedTable, None)
+stateTable[DOCTYPE_SYSTEM_IDENTIFIER_SINGLE_QUOTED] = (
+    doctypeSystemIdentifierSingleQuotedTable, None)
+stateTable[AFTER_DOCTYPE_SYSTEM_IDENTIFIER] = (
+    afterDoctypeSystemIdentifierTable, None)
+stateTable[BOGUS_DOCTYPE] = (bogusDoctypeTable, None)
+
+class TableDrivenTokenizer(HTMLTokenizer):
+    """Tokenizer producing the same tokens as HTMLTokenizer using integer
+    states and precomputed per-state character tables.
+
+    * self.state
+      Holds the number of the current state
+
+    * self.states
+      Maps state names to state numbers, so the helper methods inherited
+      from HTMLTokenizer can still refer to states by name.
+    """
+
+    def __init__(self, *args, **kwargs):
+        HTMLTokenizer.__init__(self, *args, **kwargs)
+        self.states = dict(zip(stateNames, range(len(stateNames))))
+        self.state = DATA
+
+    def pullTokens(self):
+        self.tokenQueue = deque([])
+        stream = self.stream
+        tokenQueue = self.tokenQueue
+        compactTokens = self.compactTokens
+        states = stateTable
+        while True:
+            table, function = states[self.state]
+            if table is None:
+                if not function(self):
+                    break
+            else:
+                data = stream.char()
+                if not table.get(data, table.default)(self, data):
+                    break
+            if tokenQueue or stream.errors:
+                if stream.errors:
+                    for error in stream.popErrors():
+                        if compactTokens:
+                            yield (ParseErrorToken, error, None)
+                        else:
+                            yield {"type": ParseErrorToken, "data": error}
+                while tokenQueue:
+                    token = tokenQueue.popleft()
+                    if compactTokens and token.__class__ is dict:
+                        token = compactToken(token)
+                    yield token
+
+    def processState(self):
+        table, function = stateTable[self.state]
+        if table is None:
+            return function(self)
+        data = self.stream.char()
+        return table.get(data, table.default)(self, data)
@@ -13,14 +13,36 @@ from constants import contentModelFlags, spaceCharacters
 from constants import entitiesWindows1252, entities
 from constants import asciiLowercase, asciiLetters, asciiUpper2Lower
 from constants import digits, hexDigits, EOF
-from constants import tokenTypes
+from constants import tokenTypes, NeedMoreData
 
-from inputstream import HTMLInputStream
+from inputstream import HTMLInputStream, HTMLPushInputStream
+from tokens import compactToken
 
-# Group entities by their first character, for faster lookups
-entitiesByFirstChar = {}
-for e in entities:
-    entitiesByFirstChar.setdefault(e[0], []).append(e)
+# Every prefix of every entity name. Together with the entities dict itself
+# this works as a flattened trie: consumeEntity can tell in one lookup per
+# character whether the text read so far could still become an entity name,
+# and whether it already is one
+entityPrefixes = frozenset([e[:i] for e in entities
+                            for i in xrange(1, len(e) + 1)])
+
+# Content model flags used by the data state, looked up once here rather than
+# on every call
+PCDATA = contentModelFlags["PCDATA"]
+RCDATA = contentModelFlags["RCDATA"]
+CDATA = contentModelFlags["CDATA"]
+
+# Characters that end a run of text in the data state. In PCDATA only "&" and
+# "<" are interesting; in (R)CDATA which characters matter depends on whether
+# we are inside an escaped <!-- --> section
+dataStopChars = frozenset((u"&", u"<"))
+rcdataStopChars = frozenset((u"&", u"<", u"-"))
+cdataStopChars = frozenset((u"<", u"-"))
+escapedStopChars = frozenset((u">",))
+
+spaceCharactersString = u"".join(spaceCharacters)
+
+CharactersToken = tokenTypes["Characters"]
+SpaceCharactersToken = tokenTypes["SpaceCharacters"]
 
 class HTMLTokenizer:
     """ This class takes care of tokenizing HTML.
@@ -41,8 +63,11 @@ class HTMLTokenizer:
     # XXX need to fix documentation
 
     def __init__(self, stream, encoding=None, parseMeta=True, useChardet=True,
-                 lowercaseElementName=True, lowercaseAttrName=True):
-        self.stream = HTMLInputStream(stream, encoding, parseMeta, useChardet)
+                 lowercaseElementName=True, lowercaseAttrName=True,
+                 compactTokens=False, chunkSize=None):
+        # Emit tuples rather than dicts; see the tokens module
+        self.compactTokens = compactTokens
+        self.chunkSize = chunkSize
         
         #Perform case conversions?
         self.lowercaseElementName = lowercaseElementName
@@ -85,6 +110,17 @@ class HTMLTokenizer:
             "bogusDoctype":self.bogusDoctypeState
         }
 
+        self.reset(stream, encoding, parseMeta, useChardet)
+
+    def reset(self, stream, encoding=None, parseMeta=True, useChardet=True):
+        """Start on a new document, so that one tokenizer can be used for
+        many. The arguments are as for the constructor"""
+        if isinstance(stream, HTMLInputStream):
+            self.stream = stream
+        else:
+            self.stream = HTMLInputStream(stream, encoding, parseMeta,
+                                          useChardet, self.chunkSize)
+
         # Setup the initial tokenizer state
         self.contentModelFlag = contentModelFlags["PCDATA"]
         self.escapeFlag = False
@@ -100,15 +136,91 @@ class HTMLTokenizer:
         We do our usually processing through the states and when we have a token
         to return we yield the token which pauses processing until the next token
         is requested.
+
+        In compact mode the most common tokens are queued as tuples already;
+        the others are converted on the way out.
         """
+        if isinstance(self.stream, HTMLPushInputStream):
+            return self.pushTokens()
+        return self.pullTokens()
+
+    def pullTokens(self):
         self.tokenQueue = deque([])
+        compactTokens = self.compactTokens
         # Start processing. When EOF is reached self.state will return False
         # instead of True and the loop will terminate.
         while self.state():
-            while self.stream.errors:
-                yield {"type": tokenTypes["ParseError"], "data": self.stream.errors.pop(0)}
+            if self.stream.errors:
+                for error in self.stream.popErrors():
+                    if compactTokens:
+                        yield (tokenTypes["ParseError"], error, None)
+                    else:
+                        yield {"type": tokenTypes["ParseError"], "data": error}
             while self.tokenQueue:
-                yield self.tokenQueue.popleft()
+                token = self.tokenQueue.popleft()
+                if compactTokens and token.__class__ is dict:
+                    token = compactToken(token)
+                yield token
+
+    def pushTokens(self):
+        """Version of __iter__ for input that is fed to an HTMLPushInputStream
+        a piece at a time. Stops when the data fed so far runs out; iterate
+        again after feeding more.
+
+        Tokens are only passed on when the tokenizer gets back to the data
+        state, as no token is partly consumed there. The stream position and
+        the tokenizer state are saved at that point and restored when the
+        stream runs out, so that the interrupted token is started again from
+        scratch with the new data.
+        """
+        self.tokenQueue = deque([])
+        stream = self.stream
+        compactTokens = self.compactTokens
+        dataState = self.states["data"]
+        processState = self.processState
+        while True:
+            if self.state == dataState:
+                while self.tokenQueue:
+                    token = self.tokenQueue.popleft()
+                    if compactTokens and token.__class__ is dict:
+                        token = compactToken(token)
+                    yield token
+                if self.contentModelFlag == PCDATA:
+                    # Pass on the text fed so far now rather than holding it
+                    # back, and scanning it again, until the next "<" or "&"
+                    chars = stream.textRun(dataStopChars)
+                    if chars:
+                        self.emitCharacters(chars)
+                        continue
+                stream.mark()
+                saved = (self.state, self.contentModelFlag, self.escapeFlag,
+                         self.lastFourChars[:], self.currentToken)
+            try:
+                more = processState()
+            except NeedMoreData:
+                stream.rewind()
+                (self.state, self.contentModelFlag, self.escapeFlag,
+                 self.lastFourChars, self.currentToken) = saved
+                self.lastFourChars = self.lastFourChars[:]
+                return
+            if stream.errors:
+                for error in stream.popErrors():
+                    if compactTokens:
+                        yield (tokenTypes["ParseError"], error, None)
+                    else:
+                        yield {"type": tokenTypes["ParseError"],
+                               "data": error}
+            if not more:
+                break
+        while self.tokenQueue:
+            token = self.tokenQueue.popleft()
+            if compactTokens and token.__class__ is dict:
+                token = compactToken(token)
+            yield token
+
+    def processState(self):
+        """Run the current state once; returns False at EOF"""
+        return self.state()
 
     # Below are various helper functions the tokenizer states use worked out.
     def processSolidusInTag(self):
@@ -242,28 +354,19 @@ class HTMLTokenizer:
             # At this point in the process might have named entity. Entities
             # are stored in the global variable "entities".
             #
-            # Consume characters and compare to these to a substring of the
-            # entity names in the list until the substring no longer matches.
-            filteredEntityList = entitiesByFirstChar.get(charStack[0], [])
-
-            def entitiesStartingWith(name):
-                return [e for e in filteredEntityList if e.startswith(name)]
-
-            while charStack[-1] is not EOF and\
-              entitiesStartingWith("".join(charStack)):
-                charStack.append(self.stream.char())
-
-            # At this point we have a string that starts with some characters
-            # that may match an entity
+            # Consume characters for as long as they are a prefix of some
+            # entity name, remembering the longest complete name seen so far
+            # to take care of &noti for instance.
             entityName = None
-
-            # Try to find the longest entity the string will match to take care
-            # of &noti for instance.
-            for entityLength in xrange(len(charStack)-1, 1, -1):
-                possibleEntityName = "".join(charStack[:entityLength])
-                if possibleEntityName in entities:
-                    entityName = possibleEntityName
+            name = u""
+            while charStack[-1] is not EOF:
+                name += charStack[-1]
+                if name not in entityPrefixes:
                     break
+                if name in entities:
+                    entityName = name
+                    entityLength = len(charStack)
+                charStack.append(self.stream.char())
 
             if entityName is not None:
                 if entityName[-1] != ";":
@@ -286,6 +389,8 @@ class HTMLTokenizer:
 
         if fromAttribute:
             self.currentToken["data"][-1][1] += output
+        elif self.compactTokens:
+            self.tokenQueue.append((CharactersToken, output))
         else:
             self.tokenQueue.append({"type": tokenTypes["Characters"], "data": output})
 
@@ -308,43 +413,74 @@ class HTMLTokenizer:
             if token["type"] == tokenTypes["EndTag"] and token["data"]:
                self.tokenQueue.append({"type":tokenTypes["ParseError"],
                                        "data":"attributes-in-end-tag"})
+            if self.compactTokens:
+                token = (token["type"], token["name"], token["data"])
         self.tokenQueue.append(token)
         self.state = self.states["data"]
 
 
     # Below are the various tokenizer states worked out.
 
+    def emitCharacters(self, chars):
+        """Emit a run of text, splitting any leading whitespace off into a
+        separate SpaceCharacters token as the tree construction stage
+        treats it specially.
+        """
+        data = chars.lstrip(spaceCharactersString)
+        if self.compactTokens:
+            if len(data) != len(chars):
+                self.tokenQueue.append((SpaceCharactersToken,
+                                        chars[:len(chars) - len(data)]))
+            if data:
+                self.tokenQueue.append((CharactersToken, data))
+        else:
+            if len(data) != len(chars):
+                self.tokenQueue.append({"type": SpaceCharactersToken,
+                  "data": chars[:len(chars) - len(data)]})
+            if data:
+                self.tokenQueue.append({"type": CharactersToken,
+                  "data": data})
+
     def dataState(self):
-        
+        if self.contentModelFlag == PCDATA:
+            # Fast path for the common case. Scan straight to the next "&" or
+            # "<", emit everything before it as a single run of text and then
+            # act on that character without going back through the state
+            # dispatch.
+            chars = self.stream.charsUntil(dataStopChars)
+            if chars:
+                self.emitCharacters(chars)
+            data = self.stream.char()
+            if data == u"&":
+                self.consumeEntity()
+            elif data == u"<":
+                self.state = self.states["tagOpen"]
+            elif data is EOF:
+                # Tokenization ends once any pending text has been emitted
+                return bool(chars)
+            return True
+
         data = self.stream.char()
 
         # Keep a charbuffer to handle the escapeFlag
-        if (self.contentModelFlag in
-            (contentModelFlags["CDATA"], contentModelFlags["RCDATA"])):
+        if self.contentModelFlag in (CDATA, RCDATA):
             if len(self.lastFourChars) == 4:
                 self.lastFourChars.pop(0)
             self.lastFourChars.append(data)
 
         # The rest of the logic
-        if (data == "&" and self.contentModelFlag in
-            (contentModelFlags["PCDATA"], contentModelFlags["RCDATA"]) and 
+        if (data == "&" and self.contentModelFlag == RCDATA and
             not self.escapeFlag):
             self.state = self.states["entityData"]
-        elif (data == "-" and self.contentModelFlag in
-              (contentModelFlags["CDATA"], contentModelFlags["RCDATA"]) and 
+        elif (data == "-" and self.contentModelFlag in (CDATA, RCDATA) and
               not self.escapeFlag and "".join(self.lastFourChars) == "<!--"):
             self.escapeFlag = True
             self.tokenQueue.append({"type": tokenTypes["Characters"], 
                                     "data":data})
-        elif (data == "<" and (self.contentModelFlag == 
-                               contentModelFlags["PCDATA"]
-                               or (self.contentModelFlag in
-                                   (contentModelFlags["CDATA"],
-                                    contentModelFlags["RCDATA"]) and
-                                   self.escapeFlag == False))):
+        elif (data == "<" and self.contentModelFlag in (CDATA, RCDATA) and
+              self.escapeFlag == False):
             self.state = self.states["tagOpen"]
-        elif (data == ">" and self.contentModelFlag in
-              (contentModelFlags["CDATA"], contentModelFlags["RCDATA"]) and
+        elif (data == ">" and self.contentModelFlag in (CDATA, RCDATA) and
               self.escapeFlag and "".join(self.lastFourChars)[1:] == "-->"):
             self.escapeFlag = False
             self.tokenQueue.append({"type": tokenTypes["Characters"], "data":data})
@@ -361,13 +497,20 @@ class HTMLTokenizer:
             # have already been appended to lastFourChars and will have broken
             # any <!-- or --> sequences
         else:
-            if (self.contentModelFlag in
-                (contentModelFlags["CDATA"], contentModelFlags["RCDATA"])):
-                chars = self.stream.charsUntil((u"&", u"<", u">", u"-"))
+            if self.contentModelFlag in (CDATA, RCDATA):
+                # Only stop at the characters that can change what happens
+                # next; everything else is part of the same run of text
+                if self.escapeFlag:
+                    stopChars = escapedStopChars
+                elif self.contentModelFlag == RCDATA:
+                    stopChars = rcdataStopChars
+                else:
+                    stopChars = cdataStopChars
+                chars = self.stream.charsUntil(stopChars)
                 self.lastFourChars += chars[-4:]
                 self.lastFourChars = self.lastFourChars[-4:]
             else:
-                chars = self.stream.charsUntil((u"&", u"<"))
+                chars = self.stream.charsUntil(dataStopChars)
             self.tokenQueue.append({"type": tokenTypes["Characters"], "data": 
               data + chars})
         return True
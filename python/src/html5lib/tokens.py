@@ -0,0 +1,47 @@
+"""Compact token representation.
+
+By default the tokenizer and the tree walkers emit every token as a dict,
+e.g. {"type": tokenTypes["StartTag"], "name": u"p", "data": [[u"id", u"x"]]}.
+With compactTokens=True they emit plain tuples instead: the first item is the
+token type and the remaining items are the values the dict would have held,
+in the order given by tokenFields below, e.g.
+
+(tokenTypes["StartTag"], u"p", [[u"id", u"x"]])
+
+Tuples are several times cheaper to build than dicts and are indexed rather
+than looked up by key. HTMLParser understands them natively; code written for
+dict tokens can be fed through dictToken (or the dicttokens filter) instead.
+"""
+
+from constants import tokenTypes
+
+# Token fields, other than the type, in tuple order. Tokens from the tokenizer
+# have a numeric type from tokenTypes, tokens from the tree walkers have the
+# type name itself, so both are accepted as keys
+tokenFields = {
+    "Doctype": ("name", "publicId", "systemId", "correct"),
+    "Characters": ("data",),
+    "SpaceCharacters": ("data",),
+    "StartTag": ("name", "data"),
+    "EndTag": ("name", "data"),
+    "EmptyTag": ("name", "data"),
+    "Comment": ("data",),
+    "ParseError": ("data", "datavars"),
+    "SerializeError": ("data",),
+}
+for name, type in tokenTypes.iteritems():
+    tokenFields[type] = tokenFields[name]
+del name, type
+
+def compactToken(token):
+    """Convert a dict token to its tuple form. Missing fields become None"""
+    type = token["type"]
+    return (type,) + tuple([token.get(field) for field in tokenFields[type]])
+
+def dictToken(token):
+    """Convert a tuple token to the equivalent dict token"""
+    rv = {"type": token[0]}
+    for field, value in zip(tokenFields[token[0]], token[1:]):
+        if value is not None or field != "datavars":
+            rv[field] = value
+    return rv
@@ -36,10 +36,13 @@ def getTreeBuilder(treeType, implementation=None, **kwargs):
     """Get a TreeBuilder class for various types of tree with built-in support
     
     treeType - the name of the tree type required (case-insensitive). Supported
-               values are "simpletree", "dom", "etree" and "beautifulsoup"
+               values are "simpletree", "compact", "dom", "etree" and
+               "beautifulsoup"
                
                "simpletree" - a built-in DOM-ish tree type with support for some
                               more pythonic idioms.
+                "compact" - a built-in tree stored as parallel arrays, for
+                            keeping many documents in memory.
                 "dom" - A generic builder for DOM implementations, defaulting to
                         a xml.dom.minidom based implementation for the sake of
                         backwards compatibility (as releases up until 0.10 had a
@@ -47,9 +50,18 @@ def getTreeBuilder(treeType, implementation=None, **kwargs):
                 "etree" - A generic builder for tree implementations exposing an
                           elementtree-like interface (known to work with
                           ElementTree, cElementTree and lxml.etree).
+                "etree_native" - Builds the same trees as "etree" without
+                                 keeping a Node object for every element,
+                                 which is faster and uses less memory (for
+                                 ElementTree and cElementTree).
+                "events" - Emits the events of the document as it is parsed,
+                           rather than building a tree; see the events
+                           module. A handler and compactTokens can be given
+                           as keyword arguments
                 "beautifulsoup" - Beautiful soup (if installed)
                
-    implementation - (Currently applies to the "etree" and "dom" tree types). A
+    implementation - (Currently applies to the "etree", "etree_native" and
+                      "dom" tree types). A
                       module implementing the tree type e.g.
                       xml.etree.ElementTree or lxml.etree."""
     
@@ -66,6 +78,15 @@ def getTreeBuilder(treeType, implementation=None, **kwargs):
         elif treeType == "simpletree":
             import simpletree
             treeBuilderCache[treeType] = simpletree.TreeBuilder
+        elif treeType == "compact":
+            import compact
+            treeBuilderCache[treeType] = compact.TreeBuilder
+        elif treeType == "events":
+            import events
+            if kwargs:
+                # XXX: NEVER cache builders for a particular handler
+                return events.getTreeBuilder(**kwargs)
+            treeBuilderCache[treeType] = events.TreeBuilder
         elif treeType == "beautifulsoup":
             import soup
             treeBuilderCache[treeType] = soup.TreeBuilder
@@ -76,4 +97,10 @@ def getTreeBuilder(treeType, implementation=None, **kwargs):
             import etree
             # XXX: NEVER cache here, caching is done in the etree submodule
             return etree.getETreeModule(implementation, **kwargs).TreeBuilder
+        elif treeType == "etree_native":
+            import etree_native
+            # XXX: NEVER cache here, caching is done in the etree_native
+            # submodule
+            return etree_native.getETreeModule(implementation,
+                                               **kwargs).TreeBuilder
     return treeBuilderCache.get(treeType)
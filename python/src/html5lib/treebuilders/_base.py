@@ -11,10 +11,264 @@ except NameError:
 # from "leaking" into tables, buttons, object elements, and marquees.
 Marker = None
 
+# Elements that end the scope of elementInScope; only the first two for the
+# table variant
+tableScopingElements = frozenset(("html", "table"))
+
+class NodeList(list):
+    """A list of nodes that keeps track of where its nodes are.
+
+    Besides the nodes themselves this keeps the position of each node, looked
+    up by identity, so that membership tests and index are cheap, and, for
+    each tag name, the indexes of the nodes with that name. Any change to the
+    list updates the indexes from the lowest changed position upwards, so
+    append and pop cost nothing extra, and changes near the end of the list
+    cost little. Subclasses keep indexes of their own by extending
+    _indexFrom and _unindexFrom.
+
+    Markers may appear any number of times, but a node is expected to appear
+    at most once.
+    """
+
+    def __init__(self, nodes=()):
+        list.__init__(self, nodes)
+        # id(node) -> index of the node
+        self.positions = {}
+        # Tag name -> indexes of the nodes with that name, in order
+        self.nameIndexes = {}
+        self._indexFrom(0)
+
+    def _indexFrom(self, start):
+        """Add the nodes from start upwards to the indexes"""
+        positions = self.positions
+        nameIndexes = self.nameIndexes
+        for i in xrange(start, len(self)):
+            node = self[i]
+            # Keep the first position of a repeated item
+            positions.setdefault(id(node), i)
+            if node is Marker:
+                continue
+            name = node.name
+            try:
+                nameIndexes[name].append(i)
+            except KeyError:
+                nameIndexes[name] = [i]
+
+    def _unindexFrom(self, start):
+        """Remove the nodes from start upwards from the indexes"""
+        positions = self.positions
+        nameIndexes = self.nameIndexes
+        for i in xrange(len(self) - 1, start - 1, -1):
+            node = self[i]
+            if positions.get(id(node)) == i:
+                del positions[id(node)]
+            if node is Marker:
+                continue
+            name = node.name
+            indexes = nameIndexes[name]
+            indexes.pop()
+            if not indexes:
+                del nameIndexes[name]
+
+    def _start(self, i):
+        # The lowest index affected by a change at index or slice bound i
+        if i is None:
+            return 0
+        if i < 0:
+            i = max(i + len(self), 0)
+        return min(i, len(self))
+
+    def append(self, node):
+        list.append(self, node)
+        self._indexFrom(len(self) - 1)
+
+    def pop(self, i=-1):
+        node = self[i]
+        start = self._start(i)
+        self._unindexFrom(start)
+        list.__delitem__(self, i)
+        self._indexFrom(start)
+        return node
+
+    def insert(self, i, node):
+        start = self._start(i)
+        self._unindexFrom(start)
+        list.insert(self, i, node)
+        self._indexFrom(start)
+
+    def remove(self, node):
+        del self[self.index(node)]
+
+    def extend(self, nodes):
+        start = len(self)
+        list.extend(self, nodes)
+        self._indexFrom(start)
+
+    def __iadd__(self, nodes):
+        self.extend(nodes)
+        return self
+
+    def __setitem__(self, i, node):
+        if isinstance(i, slice):
+            if i.step is not None:
+                start = 0
+            else:
+                start = self._start(i.start)
+            self._unindexFrom(start)
+            list.__setitem__(self, i, node)
+            self._indexFrom(start)
+            return
+        old = self[i]
+        if (old is not Marker and node is not Marker and
+            old.name == node.name and id(node) not in self.positions):
+            # Replacing a node with one with the same name, as the adoption
+            # agency algorithm and the reconstruction of the active formatting
+            # elements do, only changes the position of the nodes
+            i = self._start(i)
+            if self.positions.get(id(old)) == i:
+                del self.positions[id(old)]
+            self.positions[id(node)] = i
+            list.__setitem__(self, i, node)
+        else:
+            start = self._start(i)
+            self._unindexFrom(start)
+            list.__setitem__(self, i, node)
+            self._indexFrom(start)
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            if i.step is not None:
+                start = 0
+            else:
+                start = self._start(i.start)
+        else:
+            # Raise IndexError before touching the indexes
+            self[i]
+            start = self._start(i)
+        self._unindexFrom(start)
+        list.__delitem__(self, i)
+        self._indexFrom(start)
+
+    # Python 2 uses these for simple slices rather than the item methods
+    def __setslice__(self, i, j, nodes):
+        self.__setitem__(slice(max(i, 0), max(j, 0)), nodes)
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(max(i, 0), max(j, 0)))
+
+    def reverse(self):
+        self._unindexFrom(0)
+        list.reverse(self)
+        self._indexFrom(0)
+
+    def sort(self, *args, **kwargs):
+        self._unindexFrom(0)
+        list.sort(self, *args, **kwargs)
+        self._indexFrom(0)
+
+    def __contains__(self, node):
+        return id(node) in self.positions
+
+    def index(self, node, *args):
+        if not args:
+            i = self.positions.get(id(node))
+            if i is not None:
+                return i
+        # Let list raise the ValueError
+        return list.index(self, node, *args)
+
+    def indexOf(self, node):
+        """The index of node in the list, or -1 if it isn't in it"""
+        return self.positions.get(id(node), -1)
+
+class ElementStack(NodeList):
+    """The stack of open elements.
+
+    On top of the indexes of NodeList this keeps the indexes of the
+    elements that end a scope, so that inScope doesn't have to walk the
+    stack.
+    """
+
+    def __init__(self, nodes=()):
+        # Indexes of the elements that end a scope, in order
+        self.scopeIndexes = []
+        # The same for the table variant of scope
+        self.tableScopeIndexes = []
+        NodeList.__init__(self, nodes)
+
+    def _indexFrom(self, start):
+        NodeList._indexFrom(self, start)
+        for i in xrange(start, len(self)):
+            name = self[i].name
+            if name in scopingElements:
+                self.scopeIndexes.append(i)
+                if name in tableScopingElements:
+                    self.tableScopeIndexes.append(i)
+
+    def _unindexFrom(self, start):
+        NodeList._unindexFrom(self, start)
+        while self.scopeIndexes and self.scopeIndexes[-1] >= start:
+            self.scopeIndexes.pop()
+        while self.tableScopeIndexes and self.tableScopeIndexes[-1] >= start:
+            self.tableScopeIndexes.pop()
+
+    def inScope(self, name, tableVariant=False):
+        """Whether there is an element with the given tag name in scope, or
+        in table scope if tableVariant is true"""
+        indexes = self.nameIndexes.get(name)
+        if not indexes:
+            return False
+        if tableVariant:
+            scopeIndexes = self.tableScopeIndexes
+        else:
+            scopeIndexes = self.scopeIndexes
+        # The element is in scope unless an element that ends the scope was
+        # opened after it
+        return not scopeIndexes or indexes[-1] >= scopeIndexes[-1]
+
+class ActiveFormattingElements(NodeList):
+    """The list of active formatting elements.
+
+    On top of the indexes of NodeList this keeps the indexes of the markers,
+    so that finding an element after the last marker doesn't have to walk
+    the list.
+    """
+
+    def __init__(self, nodes=()):
+        # Indexes of the markers, in order
+        self.markerIndexes = []
+        NodeList.__init__(self, nodes)
+
+    def _indexFrom(self, start):
+        NodeList._indexFrom(self, start)
+        for i in xrange(start, len(self)):
+            if self[i] is Marker:
+                self.markerIndexes.append(i)
+
+    def _unindexFrom(self, start):
+        NodeList._unindexFrom(self, start)
+        while self.markerIndexes and self.markerIndexes[-1] >= start:
+            self.markerIndexes.pop()
+
+    def lastAfterMarker(self, name):
+        """The last element with the given tag name that comes after the last
+        marker, or None if there isn't one"""
+        indexes = self.nameIndexes.get(name)
+        if not indexes:
+            return None
+        markerIndexes = self.markerIndexes
+        if markerIndexes and indexes[-1] < markerIndexes[-1]:
+            return None
+        return self[indexes[-1]]
+
 #XXX - TODO; make the default interface more ElementTree-like
 #            rather than DOM-like
 
 class Node(object):
+    # Subclasses without __slots__ of their own keep their attributes in a
+    # dictionary as usual; this only lets those with __slots__ do without
+    __slots__ = ()
+
     def __init__(self, name):
         """Node representing an item in the tree.
         name - The tag name associated with the node
@@ -112,12 +366,16 @@ class TreeBuilder(object):
     #Fragment class
     fragmentClass = None
 
+    #A budget.ParseBudget for the elements and comments inserted, set by the
+    #parser
+    budget = None
+
     def __init__(self):
         self.reset()
     
     def reset(self):
-        self.openElements = []
-        self.activeFormattingElements = []
+        self.openElements = ElementStack()
+        self.activeFormattingElements = ActiveFormattingElements()
 
         #XXX - rename these to headElement, formElement
         self.headPointer = None
@@ -128,23 +386,7 @@ class TreeBuilder(object):
         self.document = self.documentClass()
 
     def elementInScope(self, target, tableVariant=False):
-        # Exit early when possible.
-        if self.openElements[-1].name == target:
-            return True
-
-        # AT Use reverse instead of [::-1] when we can rely on Python 2.4
-        # AT How about while True and simply set node to [-1] and set it to
-        # [-2] at the end...
-        for node in self.openElements[::-1]:
-            if node.name == target:
-                return True
-            elif node.name == "table":
-                return False
-            elif not tableVariant and node.name in scopingElements:
-                return False
-            elif node.name == "html":
-                return False
-        assert False # We should never reach this point
+        return self.openElements.inScope(target, tableVariant)
 
     def reconstructActiveFormattingElements(self):
         # Within this algorithm the order of steps described in the
@@ -198,17 +440,15 @@ class TreeBuilder(object):
         formatting elements and the last marker. If it does, return it, else
         return false"""
 
-        for item in self.activeFormattingElements[::-1]:
-            # Check for Marker first because if it's a Marker it doesn't have a
-            # name attribute.
-            if item == Marker:
-                break
-            elif item.name == name:
-                return item
-        return False
+        element = self.activeFormattingElements.lastAfterMarker(name)
+        if element is None:
+            return False
+        return element
 
     def insertRoot(self, name):
         element = self.createElement("html", {})
+        if self.budget is not None:
+            self.budget.checkElement(1, ())
         self.openElements.append(element)
         self.document.appendChild(element)
 
@@ -219,6 +459,8 @@ class TreeBuilder(object):
     def insertComment(self, data, parent=None):
         if parent is None:
             parent = self.openElements[-1]
+        if self.budget is not None:
+            self.budget.checkNode()
         parent.appendChild(self.commentClass(data))
                            
     def createElement(self, name, attributes):
@@ -242,6 +484,8 @@ class TreeBuilder(object):
     insertFromTable = property(_getInsertFromTable, _setInsertFromTable)
         
     def insertElementNormal(self, name, attributes):
+        if self.budget is not None:
+            self.budget.checkElement(len(self.openElements) + 1, attributes)
         element = self.elementClass(name)
         element.attributes = attributes
         self.openElements[-1].appendChild(element)
@@ -257,6 +501,9 @@ class TreeBuilder(object):
         else:
             #We should be in the InTable mode. This means we want to do
             #special magic element rearranging
+            if self.budget is not None:
+                self.budget.checkElement(len(self.openElements) + 1,
+                                         attributes)
             parent, insertBefore = self.getTableMisnestedNodePosition()
             if insertBefore is None:
                 parent.appendChild(element)
@@ -0,0 +1,443 @@
+"""Module for building documents stored as a few parallel arrays, which
+takes a fraction of the memory of a tree of node objects.
+
+Each node is an index into arrays holding its kind, the id of its name,
+its parent, first and last child, next and previous sibling, and where
+its text is in a single buffer for the whole document. Text and comments
+keep their data in the buffer, doctypes their name in the name table;
+attributes, doctype ids and flags are kept in dictionaries for the few
+nodes that have them. -1 stands for no node.
+
+Node objects are only views on a node of a Tree, made when they are asked
+for. The parser keeps the views of the elements it has open; once it is
+done with an element only the entries in the arrays are left. The
+treewalkers.compact walker goes through the arrays without making views.
+"""
+
+from array import array
+from bisect import bisect_right
+
+import _base
+from html5lib.constants import tableInsertModeElements
+
+# Node kinds, the same numbers as the type attribute of simpletree nodes
+DOCUMENT = 1
+DOCUMENT_FRAGMENT = 2
+DOCUMENT_TYPE = 3
+TEXT = 4
+ELEMENT = 5
+COMMENT = 6
+
+class Tree(object):
+    """The arrays for a document and the nodes made while parsing it"""
+    def __init__(self):
+        self.kinds = array("b")
+        self.nameIds = array("i")
+        self.parents = array("i")
+        self.firstChildren = array("i")
+        self.lastChildren = array("i")
+        self.nextSiblings = array("i")
+        self.previousSiblings = array("i")
+        self.textStarts = array("i")
+        self.textEnds = array("i")
+
+        # Names in order of their ids, and the id of each name
+        self.names = [None]
+        self.ids = {None: 0}
+
+        # The text buffer is the chunks, which end at the offsets in
+        # chunkEnds, followed by the pieces in pending; self.length
+        # characters in all. The tree builder joins it into one chunk once
+        # the document is parsed
+        self.chunks = []
+        self.chunkEnds = []
+        self.pending = []
+        self.length = 0
+        # Pieces of text added to nodes whose text was no longer at the end
+        # of the buffer, by node; see addText
+        self.moreText = {}
+
+        self.attributes = {}
+        self.doctypeIds = {}
+        self.flags = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def nameId(self, name):
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+    def newNode(self, kind, name=None, data=None):
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.nameIds.append(self.nameId(name))
+        self.parents.append(-1)
+        self.firstChildren.append(-1)
+        self.lastChildren.append(-1)
+        self.nextSiblings.append(-1)
+        self.previousSiblings.append(-1)
+        self.textStarts.append(self.length)
+        if data:
+            self.pending.append(data)
+            self.length += len(data)
+        self.textEnds.append(self.length)
+        return index
+
+    def getText(self, index):
+        more = self.moreText.get(index)
+        if more is not None:
+            if len(more) > 1:
+                more[:] = [u"".join(more)]
+            return self.getBufferText(index) + more[0]
+        return self.getBufferText(index)
+
+    def getBufferText(self, index):
+        start = self.textStarts[index]
+        end = self.textEnds[index]
+        if self.chunkEnds:
+            joined = self.chunkEnds[-1]
+        else:
+            joined = 0
+        if end > joined:
+            self.chunks.append(u"".join(self.pending))
+            self.chunkEnds.append(self.length)
+            self.pending = []
+        if start == end:
+            return u""
+        i = bisect_right(self.chunkEnds, start)
+        chunkStart = self.chunkEnds[i] - len(self.chunks[i])
+        if end <= self.chunkEnds[i]:
+            return self.chunks[i][start - chunkStart:end - chunkStart]
+        pieces = []
+        while start < end:
+            pieces.append(self.chunks[i][start - chunkStart:end - chunkStart])
+            start = chunkStart = self.chunkEnds[i]
+            i += 1
+        return u"".join(pieces)
+
+    def joinText(self):
+        """Make the text buffer a single string"""
+        for index in sorted(self.moreText):
+            text = self.getText(index)
+            self.textStarts[index] = self.length
+            self.pending.append(text)
+            self.length += len(text)
+            self.textEnds[index] = self.length
+        self.moreText = {}
+        if self.pending or len(self.chunks) > 1:
+            self.chunks = [u"".join(self.chunks + self.pending)]
+            self.chunkEnds = [self.length]
+            self.pending = []
+
+    def addText(self, index, data):
+        """Add data to the end of the text of node index"""
+        more = self.moreText.get(index)
+        if more is not None:
+            more.append(data)
+        elif self.textEnds[index] == self.length:
+            self.pending.append(data)
+            self.length += len(data)
+            self.textEnds[index] = self.length
+        else:
+            # Only the text at the end of the buffer can grow in place.
+            # Moving this text there each time would copy it again for every
+            # piece, e.g. for foster parented text between table cells, so
+            # the pieces are kept aside and moved once by joinText
+            self.moreText[index] = [data]
+
+    def remove(self, index):
+        parent = self.parents[index]
+        if parent == -1:
+            return
+        previous = self.previousSiblings[index]
+        next = self.nextSiblings[index]
+        if previous == -1:
+            self.firstChildren[parent] = next
+        else:
+            self.nextSiblings[previous] = next
+        if next == -1:
+            self.lastChildren[parent] = previous
+        else:
+            self.previousSiblings[next] = previous
+        self.parents[index] = -1
+        self.nextSiblings[index] = -1
+        self.previousSiblings[index] = -1
+
+    def append(self, parent, index):
+        """Make node index the last child of parent. Text is added to text
+        just before it rather than being made a node of its own"""
+        self.remove(index)
+        last = self.lastChildren[parent]
+        if last != -1 and self.kinds[index] == TEXT == self.kinds[last]:
+            self.addText(last, self.getText(index))
+            return
+        if last == -1:
+            self.firstChildren[parent] = index
+        else:
+            self.nextSiblings[last] = index
+        self.previousSiblings[index] = last
+        self.lastChildren[parent] = index
+        self.parents[index] = parent
+
+    def insertBefore(self, parent, index, before):
+        self.remove(index)
+        previous = self.previousSiblings[before]
+        if previous != -1 and self.kinds[index] == TEXT == self.kinds[previous]:
+            self.addText(previous, self.getText(index))
+            return
+        if previous == -1:
+            self.firstChildren[parent] = index
+        else:
+            self.nextSiblings[previous] = index
+        self.previousSiblings[index] = previous
+        self.nextSiblings[index] = before
+        self.previousSiblings[before] = index
+        self.parents[index] = parent
+
+    def insertText(self, parent, data, before=-1):
+        if before == -1:
+            previous = self.lastChildren[parent]
+        else:
+            previous = self.previousSiblings[before]
+        if previous != -1 and self.kinds[previous] == TEXT:
+            self.addText(previous, data)
+        elif before == -1:
+            self.append(parent, self.newNode(TEXT, data=data))
+        else:
+            self.insertBefore(parent, self.newNode(TEXT, data=data), before)
+
+    def children(self, index):
+        child = self.firstChildren[index]
+        while child != -1:
+            yield child
+            child = self.nextSiblings[child]
+
+class Node(object):
+    """A view on node index of tree. The parser sets form on input elements
+    in a form"""
+    __slots__ = ("tree", "index", "name", "form")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+        self.name = tree.names[tree.nameIds[index]]
+
+    def __eq__(self, other):
+        return (isinstance(other, Node) and self.tree is other.tree and
+                self.index == other.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return "<%s>" % (self.name)
+
+    def _getType(self):
+        return self.tree.kinds[self.index]
+
+    type = property(_getType)
+
+    def _getValue(self):
+        if self.tree.kinds[self.index] == TEXT:
+            return self.tree.getText(self.index)
+        return None
+
+    value = property(_getValue)
+
+    def _getData(self):
+        if self.tree.kinds[self.index] == COMMENT:
+            return self.tree.getText(self.index)
+        return None
+
+    data = property(_getData)
+
+    def _getAttributes(self):
+        attributes = self.tree.attributes.get(self.index)
+        if attributes is None:
+            attributes = self.tree.attributes[self.index] = {}
+        return attributes
+
+    attributes = property(_getAttributes)
+
+    def _getPublicId(self):
+        return self.tree.doctypeIds.get(self.index, (None, None))[0]
+
+    publicId = property(_getPublicId)
+
+    def _getSystemId(self):
+        return self.tree.doctypeIds.get(self.index, (None, None))[1]
+
+    systemId = property(_getSystemId)
+
+    def _getFlags(self):
+        flags = self.tree.flags.get(self.index)
+        if flags is None:
+            flags = self.tree.flags[self.index] = []
+        return flags
+
+    _flags = property(_getFlags)
+
+    def _getParent(self):
+        parent = self.tree.parents[self.index]
+        if parent == -1:
+            return None
+        return Node(self.tree, parent)
+
+    parent = property(_getParent)
+
+    def _getChildNodes(self):
+        return [Node(self.tree, child)
+                for child in self.tree.children(self.index)]
+
+    childNodes = property(_getChildNodes)
+
+    def appendChild(self, node):
+        self.tree.append(self.index, node.index)
+
+    def insertText(self, data, insertBefore=None):
+        if insertBefore is None:
+            self.tree.insertText(self.index, data)
+        else:
+            self.tree.insertText(self.index, data, insertBefore.index)
+
+    def insertBefore(self, node, refNode):
+        self.tree.insertBefore(self.index, node.index, refNode.index)
+
+    def removeChild(self, node):
+        self.tree.remove(node.index)
+
+    def reparentChildren(self, newParent):
+        tree = self.tree
+        child = tree.firstChildren[self.index]
+        while child != -1:
+            next = tree.nextSiblings[child]
+            tree.append(newParent.index, child)
+            child = next
+
+    def cloneNode(self):
+        tree = self.tree
+        index = tree.newNode(tree.kinds[self.index], self.name)
+        attributes = tree.attributes.get(self.index)
+        if attributes:
+            tree.attributes[index] = attributes.copy()
+        return Node(tree, index)
+
+    def hasContent(self):
+        """Return true if the node has children or text"""
+        return self.tree.firstChildren[self.index] != -1
+
+class Document(Node):
+    """The document node of a new Tree"""
+    __slots__ = ()
+
+    def __init__(self):
+        tree = Tree()
+        Node.__init__(self, tree, tree.newNode(DOCUMENT))
+
+def testSerializer(node):
+    """Serialize the subtree of node in the same format as simpletree"""
+    tree = node.tree
+    names = tree.names
+    rv = []
+    def serializeNode(index, indent):
+        kind = tree.kinds[index]
+        if kind == DOCUMENT:
+            rv.append("#document")
+        elif kind == DOCUMENT_FRAGMENT:
+            rv.append("#document-fragment")
+        elif kind == DOCUMENT_TYPE:
+            name = names[tree.nameIds[index]]
+            publicId, systemId = tree.doctypeIds[index]
+            if publicId or systemId:
+                rv.append("""|%s<!DOCTYPE %s "%s" "%s">""" % (
+                    " " * indent, name, publicId, systemId))
+            else:
+                rv.append("|%s<!DOCTYPE %s>" % (" " * indent, name))
+        elif kind == TEXT:
+            rv.append("|%s\"%s\"" % (" " * indent, tree.getText(index)))
+        elif kind == ELEMENT:
+            rv.append("|%s<%s>" % (" " * indent, names[tree.nameIds[index]]))
+            for name, value in tree.attributes.get(index, {}).iteritems():
+                rv.append('|%s%s="%s"' % (" " * (indent + 2), name, value))
+        elif kind == COMMENT:
+            rv.append("|%s<!-- %s -->" % (" " * indent, tree.getText(index)))
+        if kind in (DOCUMENT, DOCUMENT_FRAGMENT):
+            indent = 2
+        else:
+            indent += 2
+        for child in tree.children(index):
+            serializeNode(child, indent)
+    serializeNode(node.index, 0)
+    return u"\n".join(rv)
+
+class TreeBuilder(_base.TreeBuilder):
+    documentClass = Document
+
+    def testSerializer(self, node):
+        return testSerializer(node)
+
+    def insertDoctype(self, name, publicId, systemId):
+        tree = self.document.tree
+        index = tree.newNode(DOCUMENT_TYPE, name)
+        tree.doctypeIds[index] = (publicId, systemId)
+        tree.append(self.document.index, index)
+
+    def insertComment(self, data, parent=None):
+        if parent is None:
+            parent = self.openElements[-1]
+        if self.budget is not None:
+            self.budget.checkNode()
+        tree = self.document.tree
+        tree.append(parent.index, tree.newNode(COMMENT, data=data))
+
+    def createElement(self, name, attributes):
+        """Create an element but don't insert it anywhere"""
+        tree = self.document.tree
+        index = tree.newNode(ELEMENT, name)
+        if attributes:
+            tree.attributes[index] = attributes
+        return Node(tree, index)
+
+    def insertElementNormal(self, name, attributes):
+        openElements = self.openElements
+        if self.budget is not None:
+            self.budget.checkElement(len(openElements) + 1, attributes)
+        element = self.createElement(name, attributes)
+        element.tree.append(openElements[-1].index, element.index)
+        openElements.append(element)
+        return element
+
+    def insertElementTable(self, name, attributes):
+        """Create an element and insert it into the tree"""
+        if self.openElements[-1].name not in tableInsertModeElements:
+            return self.insertElementNormal(name, attributes)
+        #We should be in the InTable mode. This means we want to do
+        #special magic element rearranging
+        if self.budget is not None:
+            self.budget.checkElement(len(self.openElements) + 1, attributes)
+        element = self.createElement(name, attributes)
+        parent, insertBefore = self.getTableMisnestedNodePosition()
+        if insertBefore is None:
+            parent.appendChild(element)
+        else:
+            parent.insertBefore(element, insertBefore)
+        self.openElements.append(element)
+        return element
+
+    def getDocument(self):
+        self.document.tree.joinText()
+        return self.document
+
+    def getFragment(self):
+        tree = self.document.tree
+        fragment = Node(tree, tree.newNode(DOCUMENT_FRAGMENT))
+        self.openElements[0].reparentChildren(fragment)
+        tree.joinText()
+        return fragment
@@ -0,0 +1,199 @@
+"""Module for building ElementTree-like trees (ElementTree, cElementTree)
+with as little in between the parser and the native elements as possible.
+
+The trees built are the same as those from the etree module, but where that
+module keeps a Node object for every element, with a list of the children's
+Node objects and properties that look up the tag and attributes, the
+elements here only get a small object with slots while the parser might
+still need them: while they are open or in the list of active formatting
+elements. It does not keep a list of children, so once the parser is done
+with an element only the native element is left. Comments and doctypes are
+never wrapped.
+"""
+
+import new
+
+import _base
+import etree as etree_builders
+from html5lib.constants import tableInsertModeElements
+
+moduleCache = {}
+
+def getETreeModule(ElementTreeImplementation, fullTree=False):
+    name = "_" + ElementTreeImplementation.__name__+"nativebuilder"
+    if name in moduleCache:
+        return moduleCache[name]
+    else:
+        mod = new.module(name)
+        objs = getETreeBuilder(ElementTreeImplementation, fullTree)
+        mod.__dict__.update(objs)
+        moduleCache[name] = mod
+        return mod
+
+def getETreeBuilder(ElementTreeImplementation, fullTree=False):
+    ElementTree = ElementTreeImplementation
+    NativeElement = ElementTree.Element
+    NativeComment = ElementTree.Comment
+    etreeModule = etree_builders.getETreeModule(ElementTree, fullTree)
+
+    class Element(object):
+        """The parser's handle on a native element. name is its tag and
+        attributes its attrib dictionary; parent is the Element it was last
+        inserted into. The parser sets form on input elements in a form"""
+        __slots__ = ("_element", "name", "attributes", "parent", "tree",
+                     "_flags", "form")
+
+        def __init__(self, name, attributes=None, tree=None):
+            if attributes:
+                self._element = NativeElement(name, attributes)
+            else:
+                self._element = NativeElement(name)
+            self.name = name
+            self.attributes = self._element.attrib
+            self.parent = None
+            self.tree = tree
+            self._flags = []
+
+        def __repr__(self):
+            return "<%s>" % (self.name)
+
+        def appendChild(self, node):
+            self._element.append(node._element)
+            node.parent = self
+
+        def insertBefore(self, node, refNode):
+            index = self._element.getchildren().index(refNode._element)
+            self._element.insert(index, node._element)
+            node.parent = self
+
+        def removeChild(self, node):
+            self._element.remove(node._element)
+            node.parent = None
+
+        def insertText(self, data, insertBefore=None):
+            element = self._element
+            if insertBefore is None:
+                index = len(element)
+            else:
+                index = element.getchildren().index(insertBefore._element)
+            if index:
+                #Text after a child goes in the child's tail
+                previous = element[index - 1]
+                if previous.tail:
+                    previous.tail += data
+                else:
+                    previous.tail = data
+            elif element.text:
+                element.text += data
+            else:
+                element.text = data
+
+        def cloneNode(self):
+            return Element(self.name, self.attributes, self.tree)
+
+        def hasContent(self):
+            """Return true if the node has children or text"""
+            return bool(self._element.text or len(self._element))
+
+        def reparentChildren(self, newParent):
+            element = self._element
+            if element.text:
+                newParent.insertText(element.text)
+                element.text = None
+            newParent._element.extend(element.getchildren())
+            del element[:]
+            #The only Elements still around whose parent might be this one
+            #are open ones
+            if self.tree is not None:
+                for node in self.tree.openElements:
+                    if node.parent is self:
+                        node.parent = newParent
+
+    class Document(Element):
+        __slots__ = ()
+
+        def __init__(self):
+            Element.__init__(self, "<DOCUMENT_ROOT>")
+
+    class DocumentFragment(Element):
+        __slots__ = ()
+
+        def __init__(self):
+            Element.__init__(self, "<DOCUMENT_FRAGMENT>")
+
+    def DocumentType(name, publicId, systemId):
+        doctype = NativeElement("<!DOCTYPE>")
+        doctype.text = name
+        if publicId is not None:
+            doctype.set(u"publicId", publicId)
+        if systemId is not None:
+            doctype.set(u"systemId", systemId)
+        return doctype
+
+    testSerializer = etreeModule.testSerializer
+    tostring = etreeModule.tostring
+
+    class TreeBuilder(_base.TreeBuilder):
+        documentClass = Document
+        doctypeClass = staticmethod(DocumentType)
+        elementClass = Element
+        commentClass = staticmethod(NativeComment)
+        fragmentClass = DocumentFragment
+
+        def testSerializer(self, element):
+            return testSerializer(element)
+
+        def insertDoctype(self, name, publicId, systemId):
+            self.document._element.append(
+                DocumentType(name, publicId, systemId))
+
+        def insertComment(self, data, parent=None):
+            if parent is None:
+                parent = self.openElements[-1]
+            if self.budget is not None:
+                self.budget.checkNode()
+            parent._element.append(NativeComment(data))
+
+        def createElement(self, name, attributes):
+            """Create an element but don't insert it anywhere"""
+            return Element(name, attributes, self)
+
+        def insertElementNormal(self, name, attributes):
+            openElements = self.openElements
+            if self.budget is not None:
+                self.budget.checkElement(len(openElements) + 1, attributes)
+            element = Element(name, attributes, self)
+            parent = openElements[-1]
+            parent._element.append(element._element)
+            element.parent = parent
+            openElements.append(element)
+            return element
+
+        def insertElementTable(self, name, attributes):
+            """Create an element and insert it into the tree"""
+            if self.openElements[-1].name not in tableInsertModeElements:
+                return self.insertElementNormal(name, attributes)
+            #We should be in the InTable mode. This means we want to do
+            #special magic element rearranging
+            if self.budget is not None:
+                self.budget.checkElement(len(self.openElements) + 1,
+                                         attributes)
+            element = Element(name, attributes, self)
+            parent, insertBefore = self.getTableMisnestedNodePosition()
+            if insertBefore is None:
+                parent.appendChild(element)
+            else:
+                parent.insertBefore(element, insertBefore)
+            self.openElements.append(element)
+            return element
+
+        def getDocument(self):
+            if fullTree:
+                return self.document._element
+            else:
+                return self.document._element.find("html")
+
+        def getFragment(self):
+            return _base.TreeBuilder.getFragment(self)._element
+
+    return locals()
@@ -0,0 +1,395 @@
+"""Module for parsing documents into a stream of events rather than a tree.
+
+The events are the tokens the tree walkers produce (see treewalkers._base),
+so they can go to the serializer and the filters: StartTag, EndTag,
+EmptyTag, Characters, SpaceCharacters, Comment and Doctype. They come out
+in the order a walker of the finished tree would give them, as soon as the
+parser can no longer change the part of the tree they are for, and the
+nodes are dropped once their events are out. What is kept is the open
+elements and what the parser may still rearrange:
+
+- the contents of an open table, which stay put until it is closed, since
+  misnested content goes in front of the table
+- the contents of the elements opened after an open formatting element
+  that is in the list of active formatting elements, which the adoption
+  agency algorithm may move
+- the head element, until the body or frameset element is inserted, since
+  elements that belong in the head can be put back into it until then
+
+Memory is otherwise bounded by the nesting depth of the document, however
+long it is, apart from the bytes the input stream keeps for a reparse
+while the encoding is only tentative. Those are at most
+HTMLPushInputStream.maxRawDataSize bytes (1MB unless changed), and none
+when the encoding is given. Text may be split over several Characters and
+SpaceCharacters events where a tree would have a single text node.
+
+Differences from the events of a walker of the tree:
+
+- attributes added to the html and body elements by later html and body
+  start tags are not reported when the element has already been started
+- if a meta element changes the encoding after events have been emitted,
+  so that the document is parsed again from the start, a token of type
+  "Reparse" is emitted and the events start again from the beginning of
+  the document. Giving the encoding avoids this. Meta elements after the
+  first HTMLPushInputStream.maxRawDataSize bytes are ignored
+- fragments are not supported
+
+Use parseEvents to get the events as a generator, or a TreeBuilder with a
+handler to have them passed to a callable as they come.
+"""
+
+import _base
+from html5lib.constants import voidElements
+from html5lib.treewalkers._base import TreeWalker
+
+# Node types, as in simpletree
+DOCUMENT = 1
+DOCUMENT_TYPE = 3
+TEXT = 4
+ELEMENT = 5
+COMMENT = 6
+
+class Node(_base.Node):
+    __slots__ = ("name", "parent", "childNodes")
+    type = None
+
+    def __init__(self, name):
+        self.name = name
+        self.parent = None
+        self.childNodes = []
+
+    def appendChild(self, node):
+        childNodes = self.childNodes
+        if (node.type == TEXT and childNodes and
+            childNodes[-1].type == TEXT):
+            childNodes[-1].value += node.value
+        else:
+            childNodes.append(node)
+        node.parent = self
+
+    def insertText(self, data, insertBefore=None):
+        if insertBefore is None:
+            childNodes = self.childNodes
+            if childNodes and childNodes[-1].type == TEXT:
+                childNodes[-1].value += data
+            else:
+                node = TextNode(data)
+                node.parent = self
+                childNodes.append(node)
+        else:
+            self.insertBefore(TextNode(data), insertBefore)
+
+    def insertBefore(self, node, refNode):
+        childNodes = self.childNodes
+        index = childNodes.index(refNode)
+        if (node.type == TEXT and index > 0 and
+            childNodes[index - 1].type == TEXT):
+            childNodes[index - 1].value += node.value
+        else:
+            childNodes.insert(index, node)
+        node.parent = self
+
+    def removeChild(self, node):
+        self.childNodes.remove(node)
+        node.parent = None
+
+class Document(Node):
+    __slots__ = ()
+    type = DOCUMENT
+
+    def __init__(self):
+        Node.__init__(self, None)
+
+class DocumentType(Node):
+    __slots__ = ("publicId", "systemId")
+    type = DOCUMENT_TYPE
+
+    def __init__(self, name, publicId, systemId):
+        Node.__init__(self, name)
+        self.publicId = publicId
+        self.systemId = systemId
+
+class TextNode(Node):
+    __slots__ = ("value",)
+    type = TEXT
+
+    def __init__(self, value):
+        Node.__init__(self, None)
+        self.value = value
+
+class Element(Node):
+    """An element. started is true once its start tag has been emitted, and
+    released once any of its children have been emitted and dropped"""
+    __slots__ = ("attributes", "started", "released", "_flags", "form")
+    type = ELEMENT
+
+    def __init__(self, name):
+        Node.__init__(self, name)
+        self.attributes = {}
+        self.started = False
+        self.released = False
+        self._flags = []
+
+    def cloneNode(self):
+        newNode = Element(self.name)
+        newNode.attributes = self.attributes.copy()
+        return newNode
+
+    def hasContent(self):
+        return bool(self.childNodes) or self.released
+
+    def reparentChildren(self, newParent):
+        for child in self.childNodes:
+            newParent.appendChild(child)
+        self.childNodes = []
+
+class CommentNode(Node):
+    __slots__ = ("data",)
+    type = COMMENT
+
+    def __init__(self, data):
+        Node.__init__(self, None)
+        self.data = data
+
+class TreeBuilder(_base.TreeBuilder):
+    """Tree builder that emits the events of the document as it goes.
+
+    handler - a callable that is given each event as it is emitted. Without
+    one the events are collected in the events list, for the caller to take
+    from time to time
+
+    compactTokens - emit tuples rather than dicts; see html5lib.tokens
+    """
+    documentClass = Document
+    doctypeClass = DocumentType
+    elementClass = Element
+    commentClass = CommentNode
+
+    handler = None
+    compactTokens = False
+
+    def __init__(self, handler=None, compactTokens=None):
+        if handler is not None:
+            self.handler = handler
+        if compactTokens is not None:
+            self.compactTokens = compactTokens
+        self.events = []
+        # Whether any events of the document have been handed out, and
+        # whether all of them have been emitted
+        self.delivered = False
+        self.finished = True
+        # Only the token making methods of the walker are used
+        self.tokens = TreeWalker(None, self.compactTokens)
+        _base.TreeBuilder.__init__(self)
+
+    def reset(self):
+        _base.TreeBuilder.reset(self)
+        # The document and the elements on the way from it to the last
+        # element whose start tag has been emitted
+        self.startedElements = [self.document]
+        if not self.finished:
+            # The parser is starting on the document again
+            self.events = []
+            if self.delivered:
+                if self.compactTokens:
+                    self.emit(("Reparse",))
+                else:
+                    self.emit({"type": "Reparse"})
+        self.delivered = False
+        self.finished = False
+
+    def emit(self, token):
+        if self.handler is not None:
+            self.handler(token)
+            self.delivered = True
+        else:
+            self.events.append(token)
+
+    def takeEvents(self):
+        """Return the events emitted since the last call and forget them"""
+        events = self.events
+        if events:
+            self.events = []
+            self.delivered = True
+        return events
+
+    def insertDoctype(self, name, publicId, systemId):
+        self.flush()
+        _base.TreeBuilder.insertDoctype(self, name, publicId, systemId)
+
+    def insertComment(self, data, parent=None):
+        self.flush()
+        _base.TreeBuilder.insertComment(self, data, parent)
+
+    def insertElementNormal(self, name, attributes):
+        self.flush()
+        return _base.TreeBuilder.insertElementNormal(self, name, attributes)
+
+    def insertElementTable(self, name, attributes):
+        self.flush()
+        return _base.TreeBuilder.insertElementTable(self, name, attributes)
+
+    def insertText(self, data, parent=None):
+        self.flush()
+        _base.TreeBuilder.insertText(self, data, parent)
+
+    def flush(self):
+        """Emit the events of the nodes the parser can no longer change and
+        drop the nodes"""
+        openElements = self.openElements
+        # Worked out when first needed
+        self.openAncestors = None
+        # Nothing can be emitted in the started elements while the one
+        # started after them is open, so the last of them that is open is
+        # the place to start
+        startedElements = self.startedElements
+        while (len(startedElements) > 1 and
+               startedElements[-1] not in openElements):
+            startedElements.pop()
+        node = startedElements[-1]
+        while True:
+            childNodes = node.childNodes
+            while childNodes:
+                child = childNodes[0]
+                if child.type == ELEMENT and not self.isFinal(child, node):
+                    break
+                self.emitNode(child)
+                del childNodes[0]
+                child.parent = None
+                if node.type == ELEMENT:
+                    node.released = True
+            else:
+                return
+            # The first child left is an element that may still change, and
+            # nothing after it can be emitted before it is
+            if not child.started:
+                if child not in openElements or self.isHeld(child):
+                    return
+                self.emitStartTag(child)
+            startedElements.append(child)
+            node = child
+
+    def isFinal(self, element, parent):
+        """Whether the parser can no longer change element and its
+        descendants"""
+        if element in self.openElements:
+            return False
+        if self.openAncestors is None:
+            openAncestors = self.openAncestors = {}
+            for node in self.openElements:
+                node = node.parent
+                while node is not None and id(node) not in openAncestors:
+                    openAncestors[id(node)] = True
+                    node = node.parent
+        if id(element) in self.openAncestors:
+            return False
+        if element is self.headPointer:
+            # Elements can be put back into the head until the body or
+            # frameset element is inserted
+            for sibling in parent.childNodes:
+                if sibling.type == ELEMENT and sibling is not element:
+                    return True
+            return False
+        return True
+
+    def isHeld(self, element):
+        """Whether the open element element may still be moved, or have
+        content put in front of it"""
+        if element.name == "table":
+            return True
+        # Elements opened after an open formatting element may be moved by
+        # the adoption agency algorithm
+        openElements = self.openElements
+        index = openElements.index(element)
+        for entry in self.activeFormattingElements:
+            if (entry is not _base.Marker and
+                -1 != openElements.indexOf(entry) < index):
+                return True
+        return False
+
+    def emitStartTag(self, element):
+        tokens = self.tokens
+        if element.name in voidElements:
+            for token in tokens.emptyTag(element.name, element.attributes,
+                                         bool(element.childNodes)):
+                self.emit(token)
+        else:
+            self.emit(tokens.startTag(element.name, element.attributes))
+        element.started = True
+
+    def emitNode(self, node):
+        """Emit the events for node and the rest of its descendants"""
+        tokens = self.tokens
+        type = node.type
+        if type == TEXT:
+            for token in tokens.text(node.value):
+                self.emit(token)
+        elif type == ELEMENT:
+            if not node.started:
+                self.emitStartTag(node)
+            for child in node.childNodes:
+                self.emitNode(child)
+            node.childNodes = []
+            if node.name not in voidElements:
+                self.emit(tokens.endTag(node.name))
+        elif type == COMMENT:
+            self.emit(tokens.comment(node.data))
+        elif type == DOCUMENT_TYPE:
+            self.emit(tokens.doctype(node.name, node.publicId,
+                                     node.systemId))
+
+    def getDocument(self):
+        """Emit the events for the rest of the document. Returns the
+        Document, which has no children left"""
+        for node in self.document.childNodes:
+            self.emitNode(node)
+        self.document.childNodes = []
+        self.finished = True
+        return self.document
+
+    def getFragment(self):
+        raise NotImplementedError("Fragments can't be parsed into events")
+
+def getTreeBuilder(handler=None, compactTokens=False):
+    """Return a TreeBuilder class whose builders pass their events to
+    handler"""
+    class HandlerTreeBuilder(TreeBuilder):
+        pass
+    HandlerTreeBuilder.handler = staticmethod(handler)
+    HandlerTreeBuilder.compactTokens = compactTokens
+    return HandlerTreeBuilder
+
+def parseEvents(stream, encoding=None, parser=None, readSize=65536):
+    """Parse a document, yielding its events as they come.
+
+    stream - a file-like object, which is read readSize bytes at a time, or
+    a string
+
+    encoding - the encoding of the document, if known. Besides saving
+    the events of a reparse (see the module's documentation) this lets the
+    input stream forget the bytes once they are decoded, which it
+    otherwise keeps while the encoding is only tentative, up to
+    HTMLPushInputStream.maxRawDataSize bytes
+
+    parser - an html5parser.HTMLParser with a tree builder from this module
+    that has no handler, to use for other parser options
+    """
+    if parser is None:
+        from html5lib.html5parser import HTMLParser
+        parser = HTMLParser(tree=TreeBuilder)
+    tree = parser.tree
+    if isinstance(stream, basestring):
+        parser.feed(stream, encoding)
+        for event in tree.takeEvents():
+            yield event
+    else:
+        while True:
+            data = stream.read(readSize)
+            if not data:
+                break
+            parser.feed(data, encoding)
+            for event in tree.takeEvents():
+                yield event
+    parser.close()
+    for event in tree.takeEvents():
+        yield event
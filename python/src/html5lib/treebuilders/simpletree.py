@@ -3,14 +3,27 @@ from html5lib.constants import voidElements
 from xml.sax.saxutils import escape
 
 # Really crappy basic implementation of a DOM-core like thing
+#
+# The nodes use __slots__ to keep the memory each takes down. Nodes that
+# can't have children share an empty tuple as their childNodes, and
+# _flags and Element.attributes are only made when they are asked for
 class Node(_base.Node):
+    __slots__ = ("name", "parent", "childNodes", "_flagList")
     type = -1
+    value = None
+
     def __init__(self, name):
         self.name = name
         self.parent = None
-        self.value = None
         self.childNodes = []
-        self._flags = []
+        self._flagList = None
+
+    def _getFlags(self):
+        if self._flagList is None:
+            self._flagList = []
+        return self._flagList
+
+    _flags = property(_getFlags)
 
     def __iter__(self):
         for node in self.childNodes:
@@ -62,18 +75,14 @@ class Node(_base.Node):
         node.parent = None
 
     def cloneNode(self):
-        newNode = type(self)(self.name)
-        if hasattr(self, 'attributes'):
-            for attr, value in self.attributes.iteritems():
-                newNode.attributes[attr] = value
-        newNode.value = self.value
-        return newNode
+        return type(self)(self.name)
 
     def hasContent(self):
         """Return true if the node has children or text"""
         return bool(self.childNodes)
 
 class Document(Node):
+    __slots__ = ()
     type = 1
     def __init__(self):
         Node.__init__(self, None)
@@ -100,14 +109,17 @@ class Document(Node):
         return tree
 
 class DocumentFragment(Document):
+    __slots__ = ()
     type = 2
     def __unicode__(self):
         return "#document-fragment"
 
 class DocumentType(Node):
+    __slots__ = ("publicId", "systemId")
     type = 3
     def __init__(self, name, publicId, systemId):
         Node.__init__(self, name)
+        self.childNodes = ()
         self.publicId = publicId
         self.systemId = systemId
 
@@ -126,11 +138,16 @@ class DocumentType(Node):
         return '<code class="markup doctype">&lt;!DOCTYPE %s></code>' % self.name
 
 class TextNode(Node):
+    __slots__ = ("value",)
     type = 4
     def __init__(self, value):
         Node.__init__(self, None)
+        self.childNodes = ()
         self.value = value
 
+    def cloneNode(self):
+        return TextNode(self.value)
+
     def __unicode__(self):
         return u"\"%s\"" % self.value
 
@@ -140,17 +157,38 @@ class TextNode(Node):
     hilite = toxml
 
 class Element(Node):
+    """The parser sets form on input elements in a form"""
+    __slots__ = ("_attributes", "form")
     type = 5
     def __init__(self, name):
         Node.__init__(self, name)
-        self.attributes = {}
-        
+        self._attributes = None
+
+    def _getAttributes(self):
+        if self._attributes is None:
+            self._attributes = {}
+        return self._attributes
+
+    def _setAttributes(self, attributes):
+        self._attributes = attributes or None
+
+    attributes = property(_getAttributes, _setAttributes)
+
+    def hasAttributes(self):
+        return bool(self._attributes)
+
+    def cloneNode(self):
+        newNode = Element(self.name)
+        if self._attributes:
+            newNode._attributes = self._attributes.copy()
+        return newNode
+
     def __unicode__(self):
         return u"<%s>" % self.name
 
     def toxml(self):
         result = '<' + self.name
-        if self.attributes:
+        if self._attributes:
             for name,value in self.attributes.iteritems():
                 result += u' %s="%s"' % (name, escape(value,{'"':'&quot;'}))
         if self.childNodes:
@@ -164,7 +202,7 @@ class Element(Node):
     
     def hilite(self):
         result = '&lt;<code class="markup element-name">%s</code>' % self.name
-        if self.attributes:
+        if self._attributes:
             for name, value in self.attributes.iteritems():
                 result += ' <code class="markup attribute-name">%s</code>=<code class="markup attribute-value">"%s"</code>' % (name, escape(value, {'"':'&quot;'}))
         if self.childNodes:
@@ -178,7 +216,7 @@ class Element(Node):
     def printTree(self, indent):
         tree = '\n|%s%s' % (' '*indent, unicode(self))
         indent += 2
-        if self.attributes:
+        if self._attributes:
             for name, value in self.attributes.iteritems():
                 tree += '\n|%s%s="%s"' % (' ' * indent, name, value)
         for child in self.childNodes:
@@ -186,11 +224,16 @@ class Element(Node):
         return tree
 
 class CommentNode(Node):
+    __slots__ = ("data",)
     type = 6
     def __init__(self, data):
         Node.__init__(self, None)
+        self.childNodes = ()
         self.data = data
 
+    def cloneNode(self):
+        return CommentNode(self.data)
+
     def __unicode__(self):
         return "<!-- %s -->" % self.data
     
@@ -206,6 +249,15 @@ class TreeBuilder(_base.TreeBuilder):
     elementClass = Element
     commentClass = CommentNode
     fragmentClass = DocumentFragment
+
+    def reset(self):
+        _base.TreeBuilder.reset(self)
+        # Tag names of the document, so that all the elements with the same
+        # name share one string
+        self.names = {}
+
+    def elementClass(self, name):
+        return Element(self.names.setdefault(name, name))
     
     def testSerializer(self, node):
         return node.printTree()
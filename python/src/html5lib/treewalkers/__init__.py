@@ -14,10 +14,12 @@ def getTreeWalker(treeType, implementation=None, **kwargs):
     """Get a TreeWalker class for various types of tree with built-in support
 
     treeType - the name of the tree type required (case-insensitive). Supported
-               values are "simpletree", "dom", "etree" and "beautifulsoup"
+               values are "simpletree", "compact", "dom", "etree" and
+               "beautifulsoup"
 
                "simpletree" - a built-in DOM-ish tree type with support for some
                               more pythonic idioms.
+                "compact" - the trees of treebuilders.compact
                 "dom" - The xml.dom.minidom DOM implementation
                 "pulldom" - The xml.dom.pulldom event stream
                 "etree" - A generic walker for tree implementations exposing an
@@ -33,7 +35,7 @@ def getTreeWalker(treeType, implementation=None, **kwargs):
 
     treeType = treeType.lower()
     if treeType not in treeWalkerCache:
-        if treeType in ("dom", "pulldom", "simpletree"):
+        if treeType in ("dom", "pulldom", "simpletree", "compact"):
             mod = __import__(treeType, globals())
             treeWalkerCache[treeType] = mod.TreeWalker
         elif treeType == "genshi":
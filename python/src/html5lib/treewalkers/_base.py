@@ -5,13 +5,17 @@ from html5lib.constants import voidElements, spaceCharacters
 spaceCharacters = u"".join(spaceCharacters)
 
 class TreeWalker(object):
-    def __init__(self, tree):
+    def __init__(self, tree, compactTokens=False):
         self.tree = tree
+        # Emit tuples rather than dicts; see html5lib.tokens
+        self.compactTokens = compactTokens
 
     def __iter__(self):
         raise NotImplementedError
 
     def error(self, msg):
+        if self.compactTokens:
+            return ("SerializeError", msg)
         return {"type": "SerializeError", "data": msg}
 
     def normalizeAttrs(self, attrs):
@@ -22,36 +26,49 @@ class TreeWalker(object):
         return [(unicode(name),unicode(value)) for name,value in attrs]
 
     def emptyTag(self, name, attrs, hasChildren=False):
-        yield {"type": "EmptyTag", "name": unicode(name), \
-                "data": self.normalizeAttrs(attrs)}
+        if self.compactTokens:
+            yield ("EmptyTag", unicode(name), self.normalizeAttrs(attrs))
+        else:
+            yield {"type": "EmptyTag", "name": unicode(name), \
+                    "data": self.normalizeAttrs(attrs)}
         if hasChildren:
             yield self.error(_("Void element has children"))
 
     def startTag(self, name, attrs):
+        if self.compactTokens:
+            return ("StartTag", unicode(name), self.normalizeAttrs(attrs))
         return {"type": "StartTag", "name": unicode(name), \
                  "data": self.normalizeAttrs(attrs)}
 
     def endTag(self, name):
+        if self.compactTokens:
+            return ("EndTag", unicode(name), [])
         return {"type": "EndTag", "name": unicode(name), "data": []}
 
     def text(self, data):
         data = unicode(data)
         middle = data.lstrip(spaceCharacters)
         left = data[:len(data)-len(middle)]
-        if left:
-            yield {"type": "SpaceCharacters", "data": left}
         data = middle
         middle = data.rstrip(spaceCharacters)
         right = data[len(middle):]
-        if middle:
-            yield {"type": "Characters", "data": middle}
-        if right:
-            yield {"type": "SpaceCharacters", "data": right}
+        for type, data in (("SpaceCharacters", left), ("Characters", middle),
+                           ("SpaceCharacters", right)):
+            if data:
+                if self.compactTokens:
+                    yield (type, data)
+                else:
+                    yield {"type": type, "data": data}
 
     def comment(self, data):
+        if self.compactTokens:
+            return ("Comment", unicode(data))
         return {"type": "Comment", "data": unicode(data)}
 
     def doctype(self, name, publicId=None, systemId=None, correct=True):
+        if self.compactTokens:
+            return ("Doctype", name is not None and unicode(name) or u"",
+                    publicId, systemId, correct)
         return {"type": "Doctype",
                 "name": name is not None and unicode(name) or u"",
                 "publicId": publicId, "systemId": systemId,
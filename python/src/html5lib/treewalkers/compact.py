@@ -0,0 +1,78 @@
+import gettext
+_ = gettext.gettext
+
+import _base
+
+# The node kinds of treebuilders.compact, which is not imported here
+DOCUMENT = 1
+DOCUMENT_FRAGMENT = 2
+DOCUMENT_TYPE = 3
+TEXT = 4
+ELEMENT = 5
+COMMENT = 6
+
+class TreeWalker(_base.NonRecursiveTreeWalker):
+    """Walker for the trees of treebuilders.compact. The tree given is a
+    node of such a tree; the nodes walked are the indexes into the arrays
+    of its Tree, so no node objects are made on the way"""
+
+    def __init__(self, tree, compactTokens=False):
+        _base.NonRecursiveTreeWalker.__init__(self, tree.index, compactTokens)
+        self.arrays = tree.tree
+        self.arrays.joinText()
+        if self.arrays.chunks:
+            self.buffer = self.arrays.chunks[0]
+        else:
+            self.buffer = u""
+        # The walk can't end by finding the node it started from again, as
+        # equal indexes needn't be the same object, so getNextSibling and
+        # getParentNode stop at it
+        self.root = tree.index
+
+    def getNodeDetails(self, node):
+        arrays = self.arrays
+        kind = arrays.kinds[node]
+        if kind in (DOCUMENT, DOCUMENT_FRAGMENT):
+            return (_base.DOCUMENT,)
+
+        elif kind == DOCUMENT_TYPE:
+            publicId, systemId = arrays.doctypeIds[node]
+            return (_base.DOCTYPE, arrays.names[arrays.nameIds[node]],
+                    publicId, systemId)
+
+        elif kind == TEXT:
+            return (_base.TEXT,
+                    self.buffer[arrays.textStarts[node]:arrays.textEnds[node]])
+
+        elif kind == ELEMENT:
+            return (_base.ELEMENT, arrays.names[arrays.nameIds[node]],
+                    arrays.attributes.get(node, {}).items(),
+                    arrays.firstChildren[node] != -1)
+
+        elif kind == COMMENT:
+            return (_base.COMMENT,
+                    self.buffer[arrays.textStarts[node]:arrays.textEnds[node]])
+
+        else:
+            return _base.UNKNOWN, kind
+
+    def getFirstChild(self, node):
+        child = self.arrays.firstChildren[node]
+        assert child != -1, "Node has no children"
+        return child
+
+    def getNextSibling(self, node):
+        if node == self.root:
+            return None
+        sibling = self.arrays.nextSiblings[node]
+        if sibling == -1:
+            return None
+        return sibling
+
+    def getParentNode(self, node):
+        if node == self.root:
+            return None
+        parent = self.arrays.parents[node]
+        if parent == -1:
+            return None
+        return parent
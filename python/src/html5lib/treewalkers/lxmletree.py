@@ -100,12 +100,12 @@ class FragmentWrapper(object):
 
         
 class TreeWalker(_base.NonRecursiveTreeWalker):
-    def __init__(self, tree):
+    def __init__(self, tree, compactTokens=False):
         if hasattr(tree, "getroot"):
             tree = Root(tree)
         elif isinstance(tree, list):
             tree = FragmentRoot(tree)
-        _base.NonRecursiveTreeWalker.__init__(self, tree)
+        _base.NonRecursiveTreeWalker.__init__(self, tree, compactTokens)
         self.filter = ihatexml.InfosetFilter()
     def getNodeDetails(self, node):
         if isinstance(node, tuple): # Text node
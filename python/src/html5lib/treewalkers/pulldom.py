@@ -16,7 +16,8 @@ class TreeWalker(_base.TreeWalker):
                     ignore_until = None
                 for token in self.tokens(previous, event):
                     yield token
-                    if token["type"] == "EmptyTag":
+                    if (self.compactTokens and token[0] or
+                        token["type"]) == "EmptyTag":
                         ignore_until = previous[1]
             previous = event
         if ignore_until is None or previous[1] is ignore_until:
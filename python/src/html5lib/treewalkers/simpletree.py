@@ -32,8 +32,13 @@ class TreeWalker(_base.NonRecursiveTreeWalker):
             return _base.TEXT, node.value
 
         elif node.type == 5: # Element
-            return _base.ELEMENT, node.name, \
-                node.attributes.items(), node.hasContent()
+            # Asking for the attributes of an element without any would make
+            # it a dictionary to keep
+            if node.hasAttributes():
+                attributes = node.attributes.items()
+            else:
+                attributes = []
+            return _base.ELEMENT, node.name, attributes, node.hasContent()
 
         elif node.type == 6: # CommentNode
             return _base.COMMENT, node.data
@@ -0,0 +1,53 @@
+"""Regression benchmark for the adoption agency algorithm, which the parser
+runs for end tags of misnested formatting elements, and for the other work
+done on the list of active formatting elements.
+
+Each input repeats a misnested pattern n and then 2n times. The time for each
+is printed together with how much it grew; work that is linear in the size of
+the input roughly doubles, quadratic work roughly quadruples. The script fails
+if any input takes longer than the time limit.
+
+Usage: python adoptionagency.py [n [limit in seconds]]
+"""
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from html5lib import html5parser
+
+cases = [
+    ("nested", lambda n: "<b><i>" * n + "x" + "</b></i>" * n),
+    ("blocks", lambda n: "<b>x<div>y" * n + "</b>" * n),
+    ("anchors", lambda n: "<a><p>x" * n + "</a>" * n),
+    ("tables", lambda n: "<b><table><td>x</b>" * n),
+    ("misnested", lambda n: "<b><i><u>x<div>y</b>z</i>" * n),
+    # Text in many open formatting elements, which is checked for elements
+    # to reconstruct
+    ("formatted", lambda n: "<i>" * n + "<span>x</span>" * (5 * n)),
+]
+
+def timeParse(document):
+    start = time.time()
+    html5parser.HTMLParser().parse(document)
+    return time.time() - start
+
+if __name__ == "__main__":
+    n = 1000
+    limit = 10.0
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        limit = float(sys.argv[2])
+    failed = False
+    print "%-10s %10s %10s %7s" % ("input", "n=%d" % n, "n=%d" % (2 * n),
+                                   "growth")
+    for name, makeDocument in cases:
+        small = timeParse(makeDocument(n))
+        large = timeParse(makeDocument(2 * n))
+        print "%-10s %9.3fs %9.3fs %6.1fx" % (name, small, large,
+                                             large / max(small, 1e-6))
+        if large > limit:
+            print "%s took longer than %.1fs" % (name, limit)
+            failed = True
+    if failed:
+        sys.exit(1)
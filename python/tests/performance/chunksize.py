@@ -0,0 +1,49 @@
+"""Time tokenizing and parsing the testdata/sites pages with different input
+chunk sizes, and tokenizing a page made of very long attribute values and
+runs of text, which charsUntil has to read across many chunks.
+
+Usage: python chunksize.py [runs]
+"""
+import sys, os, glob, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from html5lib import html5parser
+from html5lib.tokenizer import HTMLTokenizer
+
+sites = os.path.join(os.path.dirname(__file__), "..", "..", "..", "testdata",
+                     "sites")
+pages = [open(f, "rb").read() for f in glob.glob(os.path.join(sites, "*"))]
+size = sum([len(page) for page in pages])
+
+longRuns = ('<p title="' + "x" * (8 << 20) + '">' + ("y" * 100 + " ") * 80000)
+
+chunkSizes = [1024, 4096, 10240, 65536, 262144, 1 << 20, 1 << 22, "adaptive"]
+
+def tokenize(chunkSize):
+    for page in pages:
+        for token in HTMLTokenizer(page, chunkSize=chunkSize):
+            pass
+
+def tokenizeLongRuns(chunkSize):
+    for token in HTMLTokenizer(longRuns, chunkSize=chunkSize):
+        pass
+
+def parse(chunkSize):
+    for page in pages:
+        html5parser.HTMLParser(chunkSize=chunkSize).parse(page)
+
+if __name__ == "__main__":
+    runs = 3
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    print "%d pages, %d bytes" % (len(pages), size)
+    print "%-10s %18s %18s %18s" % ("chunk", "tokenize", "parse",
+                                     "long runs")
+    for chunkSize in chunkSizes:
+        row = [str(chunkSize)]
+        for function, bytes in ((tokenize, size), (parse, size),
+                                (tokenizeLongRuns, len(longRuns))):
+            t = min(timeit.Timer(lambda: function(chunkSize)).repeat(runs, 1))
+            row.append("%6.3fs %6.0fKB/s" % (t, bytes / t / 1024))
+        print "%-10s %18s %18s %18s" % tuple(row)
@@ -0,0 +1,46 @@
+"""Measure the memory simpletree documents of the testdata/sites pages take
+per node: the sizes of all the objects that can be reached from the
+documents, the text of the pages included, divided by the number of nodes.
+Also times parsing the pages.
+
+Usage: python nodememory.py [runs]
+"""
+import sys, os, glob, timeit, gc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from html5lib import html5parser
+
+sites = os.path.join(os.path.dirname(__file__), "..", "..", "..", "testdata",
+                     "sites")
+pages = [open(f, "rb").read().decode("utf-8", "replace")
+         for f in glob.glob(os.path.join(sites, "*"))]
+
+def parse():
+    return [html5parser.HTMLParser().parse(page) for page in pages]
+
+def size(documents):
+    """The total size of the objects reachable from documents, other than
+    classes and modules"""
+    seen = set()
+    total = 0
+    stack = list(documents)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, type(sys))):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+if __name__ == "__main__":
+    runs = 3
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    documents = parse()
+    nodes = sum([len(list(document)) + 1 for document in documents])
+    total = size(documents)
+    t = min(timeit.Timer(parse).repeat(runs, 1))
+    print "%d nodes  %d bytes  %.1f bytes per node  parse %.3fs" % (
+        nodes, total, float(total) / nodes, t)
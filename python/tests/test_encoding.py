@@ -13,6 +13,23 @@ class Html5EncodingTestCase(unittest.TestCase):
         self.assertEquals(inputstream.codecName("  utf8  "), "utf-8")
         self.assertEquals(inputstream.codecName("ISO_8859--1"), "windows-1252")
 
+    def test_prescanner(self):
+        # EncodingPrescanner must find the same encodings as EncodingParser
+        for filename in html5lib_test_files("encoding"):
+            for test in TestData(filename, "data"):
+                data = test['data'][:512]
+                self.assertEquals(
+                    inputstream.EncodingParser(data).getEncoding(),
+                    inputstream.EncodingPrescanner(data).getEncoding(), data)
+        for data in ['<meta charset="koi8-r', '<meta charset=koi8-r',
+                     '<meta charset=koi8-r>', '<meta a=b charset = "koi8-r">',
+                     "<!--<meta charset=koi8-r>-->", '<meta/charset=koi8-r>',
+                     '<p <meta charset=koi8-r>', '</p <meta charset=koi8-r>',
+                     "<META CONTENT='text/html; charset=KOI8-R'>"]:
+            self.assertEquals(
+                inputstream.EncodingParser(data).getEncoding(),
+                inputstream.EncodingPrescanner(data).getEncoding(), data)
+
 def buildTestSuite():
     for filename in html5lib_test_files("encoding"):
         test_name = os.path.basename(filename).replace('.dat',''). \
@@ -12,6 +12,7 @@ import html5lib
 from html5lib import html5parser, treebuilders, constants
 
 treeTypes = {"simpletree":treebuilders.getTreeBuilder("simpletree"),
+             "compact":treebuilders.getTreeBuilder("compact"),
              "DOM":treebuilders.getTreeBuilder("dom")}
 
 #Try whatever etree implementations are avaliable from a list that are
@@ -35,6 +36,9 @@ except ImportError:
         treeTypes['cElementTree'] = treebuilders.getTreeBuilder("etree", cElementTree, fullTree=True)
     except ImportError:
         pass
+
+if 'cElementTree' in treeTypes:
+    treeTypes['cElementTree_native'] = treebuilders.getTreeBuilder("etree_native", cElementTree, fullTree=True)
     
 try:
     try:
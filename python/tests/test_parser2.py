@@ -1,8 +1,19 @@
 import support
-from html5lib import html5parser
+from html5lib import html5parser, inputstream
 from html5lib.treebuilders import dom
+from html5lib import treewalkers
+from html5lib import treebuilders
+from html5lib.filters import dicttokens
+from html5lib.tabletokenizer import TableDrivenTokenizer
+from html5lib import sanitizer
+from html5lib.budget import ParseBudget
+from html5lib.treebuilders import simpletree
+from html5lib.treebuilders import events
+from html5lib.treebuilders._base import ElementStack, ActiveFormattingElements
+from html5lib.treebuilders._base import Marker
 
 import unittest
+import StringIO
 
 # tests that aren't autogenerated from text files
 class MoreParserTests(unittest.TestCase):
@@ -17,6 +28,417 @@ class MoreParserTests(unittest.TestCase):
     parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
     parser.parse("<pre>\nx\n&gt;\n</pre>")
 
+  def test_compact_tokens(self):
+    # Tuple tokens must build the same tree as dict tokens
+    for input in ("<!DOCTYPE html><p id=a id=b>x &amp; <b>y</p>z",
+                  "<table><tr><td>a<br/><div/>b</table><!-- c -->",
+                  "<svg/><p>&notin; &noti &unknown;"):
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+      expected = parser.tree.testSerializer(parser.parse(input))
+      expectedErrors = parser.errors
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder,
+                                      compactTokens=True)
+      self.assertEquals(expected, parser.tree.testSerializer(parser.parse(input)))
+      self.assertEquals(expectedErrors, parser.errors)
+
+  def test_phase_handler_tables(self):
+    # The tag handler tables are built once per phase class, and a subclass
+    # that overrides a handler gets a table of its own
+    first = html5parser.HTMLParser()
+    second = html5parser.HTMLParser()
+    self.assert_(first.phases["inBody"].startTagHandler is
+                 second.phases["inBody"].startTagHandler)
+    calls = []
+    class InBodyPhase(html5parser.InBodyPhase):
+      def startTagHr(self, name, attributes):
+        calls.append(name)
+        html5parser.InBodyPhase.startTagHr(self, name, attributes)
+    parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+    parser.phases["inBody"] = InBodyPhase(parser, parser.tree)
+    doc = parser.parse("<p>a<hr><p>b")
+    self.assertEquals([u"hr"], calls)
+    self.assertEquals(u"hr", doc.getElementsByTagName("hr")[0].tagName)
+    parser = html5parser.HTMLParser()
+    parser.parse("<p>a<hr><p>b")
+    self.assertEquals([u"hr"], calls)
+
+  def test_parse_many(self):
+    # Reusing a parser must give the same trees and errors as a new parser
+    # for each document
+    inputs = ["<!DOCTYPE html><form><p>x<pre>", "<body>\n<p>y&amp",
+              "<table><tr><td>a<form><input></table>", "<title>t</title>",
+              u"<p>\u2018x\u2019<b><i>y</b>z".encode("utf-8")]
+    for container in (None, "div", "td"):
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+      trees = parser.parseMany(inputs, encoding="utf-8", container=container)
+      for input in inputs:
+        tree = trees.next()
+        fresh = html5parser.HTMLParser(tree=dom.TreeBuilder)
+        if container is None:
+          expected = fresh.parse(input, encoding="utf-8")
+        else:
+          expected = fresh.parseFragment(input, container, encoding="utf-8")
+        self.assertEquals(fresh.tree.testSerializer(expected),
+                          parser.tree.testSerializer(tree))
+        self.assertEquals(fresh.errors, parser.errors)
+        self.assertEquals(fresh.compatMode, parser.compatMode)
+      self.assertRaises(StopIteration, trees.next)
+
+  def test_reparses(self):
+    # A late meta element only makes the parser start again when the text
+    # before it is different in the new encoding
+    comment = "<!--" + "x" * 1000 + "-->"
+    for input, reparses in [
+      (comment + "<meta charset=utf-8><p>\xc3\xa9", 0),
+      ("<title>\xfe</title>" + comment + "<meta charset=iso-8859-2><p>\xfe",
+       1)]:
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+      document = parser.parse(input)
+      self.assertEquals(reparses, parser.reparses)
+      encoding = parser.tokenizer.stream.charEncoding[0]
+      fresh = html5parser.HTMLParser(tree=dom.TreeBuilder)
+      expected = fresh.parse(input, encoding=encoding)
+      self.assertEquals(fresh.tree.testSerializer(expected),
+                        parser.tree.testSerializer(document))
+
+  def test_charset_detector(self):
+    samples = []
+    def detector(sample):
+      samples.append(sample)
+      return "iso-8859-2"
+    parser = html5parser.HTMLParser(tree=dom.TreeBuilder,
+                                    charsetDetector=detector)
+    for input in ("<p>\xfe", "<meta charset=utf-8><p>\xc5\xa3"):
+      document = parser.parse(input)
+      self.assertEquals(u"\u0163", document.getElementsByTagName("p")[0].
+                        firstChild.nodeValue)
+      parser.feed(input)
+      document = parser.close()
+      self.assertEquals(u"\u0163", document.getElementsByTagName("p")[0].
+                        firstChild.nodeValue)
+    self.assertEquals(["<p>\xfe"] * 2, samples)
+    parser.parse("<p>\xfe", useChardet=False)
+    self.assertEquals(2, len(samples))
+
+  def test_parse_budget(self):
+    # Going over a limit stops the parser with the tree built so far, which
+    # is within the limits, and says which limit it was
+    input = "<p a=1 b=2 c=3><b><i><u>x</u></i></b></p><!--c--><table><tr><td>y"
+    for limits, exceeded, elements in [
+      ({}, None, "p b i u table tbody tr td"),
+      ({"maxDepth": 5}, "depth", "p b i"),
+      ({"maxNodes": 4}, "nodes", "p"),
+      ({"maxNodes": 7}, "nodes", "p b i u"),
+      ({"maxAttributes": 2}, "attributes", ""),
+      ({"maxTokens": 5}, "tokens", "p b i u"),
+      ({"maxTime": -1, "checkInterval": 1}, "time", None)]:
+      for compactTokens in (False, True):
+        parser = html5parser.HTMLParser(tree=dom.TreeBuilder,
+                                        compactTokens=compactTokens,
+                                        budget=ParseBudget(**limits))
+        for i in range(2):
+          if i == 0:
+            document = parser.parse(input)
+          else:
+            # The limits apply to each document afresh
+            parser.feed(input)
+            document = parser.close()
+          self.assertEquals(exceeded, parser.budgetExceeded)
+          if elements is None:
+            self.assertEquals([], document.childNodes)
+            continue
+          body = document.getElementsByTagName("body")[0]
+          self.assertEquals(elements.split(), [element.tagName for element in
+                                               body.getElementsByTagName("*")])
+
+  def test_stop_after(self):
+    input = ("<!DOCTYPE html><title>t</title><meta charset=utf-8></head>\n"
+             "<link rel=canonical href=/x><p>" + "text " * 20000)
+    parser = html5parser.HTMLParser()
+    stream = StringIO.StringIO(input)
+    document = parser.parse(stream, stopAfter="afterHead")
+    self.assertTrue(parser.stopped)
+    self.assertTrue(stream.tell() < len(input) / 2)
+    head, body = document.childNodes[1].childNodes[0::2]
+    self.assertEquals([u"title", u"meta", u"link"],
+                      [node.name for node in head.childNodes])
+    self.assertEquals([u"p"], [node.name for node in body.childNodes])
+    self.assertEquals([], body.childNodes[0].childNodes)
+
+    document = parser.parse(input, stopAfter="inHead")
+    self.assertTrue(parser.stopped)
+    self.assertEquals(1, len(document.childNodes[1].childNodes))
+    document = parser.parse("<title>t</title>")
+    self.assertFalse(parser.stopped)
+    self.assertRaises(ValueError, parser.parse, input, stopAfter="inBody")
+
+    # Pieces fed after parsing has stopped are ignored
+    def stop(parser):
+      return parser.tree.formPointer is not None
+    parser = html5parser.HTMLParser()
+    parser.feed("<p>a<form>", encoding="utf-8", stopAfter=stop)
+    self.assertTrue(parser.stopped)
+    parser.feed("</form>b")
+    body = parser.close().childNodes[0].childNodes[1]
+    self.assertEquals([u"p", u"form"], [node.name for node in body.childNodes])
+    self.assertEquals([], body.childNodes[1].childNodes)
+
+  def test_simpletree_nodes(self):
+    # The nodes have no __dict__, elements share their names and only get
+    # attributes and flags when they need them
+    document = html5parser.HTMLParser().parse(
+      "<!DOCTYPE html><p>x<!--y--><p id=z><table> <td>")
+    nodes = [document] + list(document)
+    self.assertEquals([], [node for node in nodes if hasattr(node, "__dict__")])
+    html, p1, p2 = [node for node in nodes
+                    if node.type == 5 and node.name in ("html", "p")]
+    self.assert_(p1.name is p2.name)
+    # The names are only shared within a document
+    parser = html5parser.HTMLParser()
+    parser.parse("<x-made-up>")
+    parser.parse("<p>")
+    self.assertEquals([u"body", u"head", u"html", u"p"],
+                      sorted(parser.tree.names))
+    self.assertEquals(False, p1.hasAttributes())
+    self.assertEquals({u"id": u"z"}, p2.cloneNode().attributes)
+    html.attributes["lang"] = "en"
+    self.assertEquals(True, html.hasAttributes())
+    tables = [node for node in nodes if node._flagList is not None]
+    self.assertEquals([u"table"], [node.name for node in tables])
+
+  def test_simpletree_clone_leaf_nodes(self):
+    text = simpletree.TextNode(u"abc").cloneNode()
+    self.assertEquals((simpletree.TextNode, u"abc"), (text.__class__, text.value))
+    comment = simpletree.CommentNode(u"c").cloneNode()
+    self.assertEquals((simpletree.CommentNode, u"c"),
+                      (comment.__class__, comment.data))
+
+  def test_compact_tree(self):
+    # Views on the nodes of a compact tree look like simpletree nodes, and
+    # the walker can start from any of them
+    input = "<!DOCTYPE html><p id=a>x<b>y</b>z<table>w<tr><td>v<!--c-->"
+    parser = html5parser.HTMLParser(tree=treebuilders.getTreeBuilder("compact"))
+    document = parser.parse(input)
+    expected = html5parser.HTMLParser().parse(input)
+    def check(node, expectedNode):
+      self.assertEquals(expectedNode.type, node.type)
+      self.assertEquals(expectedNode.name, node.name)
+      self.assertEquals(expectedNode.value, node.value)
+      self.assertEquals(getattr(expectedNode, "attributes", {}),
+                        node.attributes)
+      self.assertEquals(len(expectedNode.childNodes), len(node.childNodes))
+      for child, expectedChild in zip(node.childNodes,
+                                      expectedNode.childNodes):
+        self.assertEquals(node, child.parent)
+        check(child, expectedChild)
+    check(document, expected)
+    body = document.childNodes[1].childNodes[1]
+    self.assertEquals(u"body", body.name)
+    TreeWalker = treewalkers.getTreeWalker("compact")
+    self.assertEquals(list(treewalkers.getTreeWalker("simpletree")(expected)),
+                      list(TreeWalker(document)))
+    self.assertEquals([("StartTag", u"p", [(u"id", u"a")]),
+                       ("Characters", u"x"), ("StartTag", u"b", []),
+                       ("Characters", u"y"), ("EndTag", u"b", []),
+                       ("Characters", u"z"), ("EndTag", u"p", [])],
+                      list(TreeWalker(body.childNodes[0], compactTokens=True)))
+
+  def test_compact_tree_text_buffer(self):
+    # Foster parented text alternating with cell text must not be copied to
+    # the end of the buffer for every piece
+    for repeats in (100, 1000):
+      input = "<table><tr>" + "a<td>b</td>" * repeats
+      parser = html5parser.HTMLParser(
+        tree=treebuilders.getTreeBuilder("compact"))
+      document = parser.parse(input)
+      self.assert_(document.tree.length <= 3 * repeats)
+      expected = html5parser.HTMLParser().parse(input)
+      self.assertEquals(
+        list(treewalkers.getTreeWalker("simpletree")(expected)),
+        list(treewalkers.getTreeWalker("compact")(document)))
+
+  def test_compact_treewalker_tokens(self):
+    doc = html5parser.HTMLParser(tree=dom.TreeBuilder).parse(
+      "<!DOCTYPE html><p class=x>a <br> b<!--c-->")
+    TreeWalker = treewalkers.getTreeWalker("dom")
+    expected = list(TreeWalker(doc))
+    compact = list(TreeWalker(doc, compactTokens=True))
+    self.assertEquals([tuple], list(set([t.__class__ for t in compact])))
+    self.assertEquals(expected, list(dicttokens.Filter(compact)))
+
+  def test_events(self):
+    # The events are those of a walk of the tree, with the text possibly
+    # split up, even where the parser rearranges the tree
+    def merged(tokens):
+      result = []
+      for token in tokens:
+        if token[0] == "SpaceCharacters":
+          token = ("Characters",) + token[1:]
+        if token[0] == "Characters" and result and result[-1][0] == "Characters":
+          result[-1] = ("Characters", result[-1][1] + token[1])
+        else:
+          result.append(token)
+      return result
+    TreeWalker = treewalkers.getTreeWalker("simpletree")
+    for input in ("<!DOCTYPE html><title>t</title> <!--c--><script>s</script>x",
+                  "<p>a<b>b<i>c<div>d</b>e</i>f</p>",
+                  "<div><table>a<tr><td>b</td>c</tr></table>d<b>e</div>",
+                  "<a href=x><table><tr><td><a href=y>z</a></table></a><br>"):
+      expected = TreeWalker(html5parser.HTMLParser().parse(input),
+                            compactTokens=True)
+      tokens = []
+      builder = treebuilders.getTreeBuilder("events", handler=tokens.append,
+                                            compactTokens=True)
+      html5parser.HTMLParser(tree=builder).parse(input)
+      self.assertEquals(merged(expected), merged(tokens))
+
+    # The events of the closed elements come out before the end of the
+    # document, and the elements are let go of
+    input = "<ul>" + "<li><a href=x>y</a>" * 100 + "</ul><p>z"
+    stream = StringIO.StringIO(input)
+    positions = []
+    parser = html5parser.HTMLParser(tree=events.TreeBuilder)
+    for token in events.parseEvents(stream, encoding="ascii", parser=parser,
+                                    readSize=64):
+      if token["type"] == "StartTag" and token["name"] == "li":
+        positions.append(stream.tell())
+        ul = parser.tree.openElements[2]
+        if ul.name == "ul":
+          self.assertTrue(len(ul.childNodes) <= 2)
+    self.assertEquals(100, len(positions))
+    self.assertTrue(positions[0] < len(input) / 2)
+
+  def test_feed(self):
+    # Feeding a document in pieces, split anywhere, must give the same tree
+    # as parsing it in one go
+    for input in ("<!DOCTYPE html>\r\n<p title='a&amp;b' id=x>&notin; &noti\r\n"
+                  "&#x41;<br/><!-- c --><script>a<b&amp;</script>",
+                  "<title>&amp;</title><textarea>\r\nx</textarea>\x00\r",
+                  u"<p>\u2018x\u2019</p>".encode("utf-8")):
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+      expected = parser.tree.testSerializer(parser.parse(input, encoding="utf-8"))
+      for size in (1, 2, 3, 5, 8):
+        parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+        for i in range(0, len(input), size):
+          parser.feed(input[i:i + size], encoding="utf-8")
+        self.assertEquals(expected, parser.tree.testSerializer(parser.close()))
+
+  def test_feed_late_meta_charset(self):
+    input = "<title>" + " " * 600 + "</title><meta charset=iso-8859-2><p>\xb1"
+    parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+    expected = parser.tree.testSerializer(
+      parser.parse(input, encoding="iso-8859-2"))
+    parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+    for i in range(0, len(input), 100):
+      parser.feed(input[i:i + 100])
+    self.assertEquals(expected, parser.tree.testSerializer(parser.close()))
+
+  def test_feed_meta_charset_after_raw_data_limit(self):
+    # Once the stream has stopped keeping the bytes fed a meta element is
+    # ignored rather than starting the document again
+    input = "<title>\xb1</title>" + " " * 2000 + "<meta charset=iso-8859-2>"
+    parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+    expected = parser.tree.testSerializer(
+      parser.parse(input, encoding="windows-1252"))
+    maxRawDataSize = inputstream.HTMLPushInputStream.maxRawDataSize
+    inputstream.HTMLPushInputStream.maxRawDataSize = 1024
+    try:
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+      for i in range(0, len(input), 100):
+        parser.feed(input[i:i + 100])
+        self.assert_(parser.pushStream.rawDataSize <= 1024)
+      document = parser.close()
+    finally:
+      inputstream.HTMLPushInputStream.maxRawDataSize = maxRawDataSize
+    self.assertEquals(0, parser.reparses)
+    self.assertEquals(expected, parser.tree.testSerializer(document))
+
+  def test_chunk_size(self):
+    input = ("<p title='" + "a" * 50 + "'>&notin;\r\n") * 20 + "\x00<b>"
+    parser = html5parser.HTMLParser(tree=dom.TreeBuilder)
+    expected = parser.tree.testSerializer(parser.parse(input))
+    # Errors for characters are reported when the chunk with them is read,
+    # so their positions depend on the chunk size
+    errors = sorted([error[1] for error in parser.errors])
+    for chunkSize in (1, 7, "adaptive"):
+      parser = html5parser.HTMLParser(tree=dom.TreeBuilder, chunkSize=chunkSize)
+      self.assertEquals(expected, parser.tree.testSerializer(parser.parse(input)))
+      self.assertEquals(errors, sorted([error[1] for error in parser.errors]))
+
+  def test_element_stack_scope(self):
+    def inScope(stack, target, tableVariant):
+      for node in stack[::-1]:
+        if node.name == target:
+          return True
+        elif node.name == "table" or node.name == "html":
+          return False
+        elif not tableVariant and node.name in ("applet", "button", "caption",
+                                                "marquee", "object", "td", "th"):
+          return False
+      return False
+    stack = ElementStack()
+    nodes = [simpletree.Element(name) for name in
+             ("html", "body", "p", "table", "td", "p", "b", "div", "b")]
+    def check():
+      for name in ("html", "p", "table", "b", "td", "div", "i"):
+        for tableVariant in (False, True):
+          self.assertEquals(inScope(stack, name, tableVariant),
+                            stack.inScope(name, tableVariant))
+    for node in nodes:
+      stack.append(node)
+      check()
+    stack.remove(nodes[4])
+    check()
+    stack.insert(3, nodes[4])
+    check()
+    stack[-1] = simpletree.Element("b")
+    check()
+    stack[2] = simpletree.Element("i")
+    check()
+    del stack[5:7]
+    check()
+    while stack:
+      stack.pop()
+      check()
+
+  def test_active_formatting_elements_index(self):
+    def lastAfterMarker(elements, name):
+      for node in elements[::-1]:
+        if node is Marker:
+          return None
+        elif node.name == name:
+          return node
+      return None
+    elements = ActiveFormattingElements()
+    nodes = [simpletree.Element(name) for name in ("b", "i", "a", "b", "u")]
+    def check():
+      for node in nodes:
+        self.assertEquals(node in elements, node in list(elements))
+        if node in elements:
+          self.assertEquals(elements.index(node), list(elements).index(node))
+      for name in ("a", "b", "i", "u"):
+        self.assert_(lastAfterMarker(elements, name) is
+                     elements.lastAfterMarker(name))
+    for node in nodes[:3]:
+      elements.append(node)
+      check()
+    elements.append(Marker)
+    check()
+    for node in nodes[3:]:
+      elements.append(node)
+      check()
+    elements.remove(nodes[1])
+    check()
+    elements.insert(1, nodes[1])
+    check()
+    clone = nodes[3].cloneNode()
+    elements[elements.index(nodes[3])] = clone
+    nodes.append(clone)
+    check()
+    while elements:
+      elements.pop()
+      check()
+
 def buildTestSuite():
   return unittest.defaultTestLoader.loadTestsFromName(__name__)
 
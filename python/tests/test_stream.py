@@ -1,7 +1,9 @@
 import support
-import unittest, codecs
+import unittest, codecs, os, tempfile
 
-from html5lib.inputstream import HTMLInputStream
+from html5lib.inputstream import HTMLInputStream, HTMLPushInputStream
+from html5lib.inputstream import MappedFile, CharsetDetector
+from html5lib.constants import NeedMoreData, EOF, ReparseException
 
 class HTMLInputStreamTest(unittest.TestCase):
 
@@ -83,6 +85,259 @@ class HTMLInputStreamTest(unittest.TestCase):
         self.assertEquals(stream.char(), u"d")
         self.assertEquals(stream.position(), (2, 1))
 
+    def test_position_chunks(self):
+        size = HTMLInputStream._defaultChunkSize
+        stream = HTMLInputStream("a\n" + "a" * (size - 3) + "\nb")
+        self.assertEquals(stream.charsUntil('b'), "a\n" + "a" * (size - 3) + "\n")
+        self.assertEquals(stream.chunkOffset, 0)
+        self.assertEquals(stream.position(), (3, 0))
+        stream.unget(u"\n")
+        self.assertEquals(stream.position(), (2, size - 3))
+        self.assertEquals(stream.char(), u"\n")
+        self.assertEquals(stream.position(), (3, 0))
+        self.assertEquals(stream.char(), u"b")
+        self.assertEquals(stream.position(), (3, 1))
+
+    def test_chunk_size(self):
+        stream = HTMLInputStream("abc\r\ndef" * 10, chunkSize=4)
+        stream.char()
+        self.assertEquals(stream.chunkSize, 4)
+        self.assertEquals(stream.charsUntil('x'), "bc\ndef" + "abc\ndef" * 9)
+
+    def test_adaptive_chunk_size(self):
+        stream = HTMLInputStream("a" * 100000, chunkSize="adaptive")
+        sizes = []
+        while stream.readChunk():
+            sizes.append(stream.chunkSize)
+        size = HTMLInputStream._defaultChunkSize
+        self.assertEquals(sizes[:3], [size, size * 2, size * 4])
+        self.assertEquals(sum(sizes), 100000)
+
+    def test_unicode(self):
+        source = u"\u2018a\nb"
+        stream = HTMLInputStream(source)
+        self.assertEquals(stream.charEncoding, ("utf-8", "certain"))
+        self.assert_(stream.chunk is source)
+        self.assertEquals(stream.charsUntil('b'), u"\u2018a\n")
+        self.assertEquals(stream.position(), (2, 0))
+        self.assertEquals(stream.char(), u"b")
+        self.assertEquals(stream.char(), EOF)
+
+    def test_unicode_normalize(self):
+        stream = HTMLInputStream(u"a\x00b\r\nc\rd\x01")
+        self.assertEquals(stream.charsUntil('x'), u"a\ufffdb\nc\nd\x01")
+        self.assertEquals(stream.popErrors(),
+                          ["null-character", "invalid-codepoint"])
+        self.assertEquals(stream.errors, [])
+
+    def test_char_errors(self):
+        stream = HTMLInputStream("\x00a\r\n\x00\x0bb\x00")
+        self.assertEquals(stream.charsUntil('x'), u"\ufffda\n\ufffd\x0bb\ufffd")
+        self.assertEquals([(code, list(offsets)) for code, offsets in
+                           stream.errors],
+                          [("null-character", [0, 3, 6]),
+                           ("invalid-codepoint", [4])])
+        self.assertEquals(stream.popErrors(), ["null-character"] * 3 +
+                          ["invalid-codepoint"])
+
+    def test_char_errors_chunks(self):
+        size = HTMLInputStream._defaultChunkSize
+        stream = HTMLInputStream("a" * (size - 1) + "\r\n\x00" +
+                                 u"\U0001FFFE".encode("utf-8"),
+                                 encoding="utf-8")
+        self.assertEquals(len(stream.charsUntil('x')), size + 2)
+        self.assertEquals([(code, list(offsets)) for code, offsets in
+                           stream.errors],
+                          [("null-character", [size]),
+                           ("invalid-codepoint", [size + 1])])
+
+    def test_unicode_empty(self):
+        stream = HTMLInputStream(u"")
+        self.assertEquals(stream.char(), EOF)
+
+    def writeTempFile(self, data):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+        return path
+
+    def test_mapped_file(self):
+        path = self.writeTempFile(codecs.BOM_UTF8 + "a\r\n\xe2\x80\x98b")
+        try:
+            f = open(path, "rb")
+            stream = HTMLInputStream(f)
+            self.assertEquals(stream.charEncoding, ("utf-8", "certain"))
+            self.assertEquals(stream.charsUntil('x'), u"a\n\u2018b")
+            f.close()
+        finally:
+            os.remove(path)
+
+    def test_mapped_fd(self):
+        path = self.writeTempFile(
+            '<meta charset="iso-8859-2">' + "\xb1" * 20000)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            stream = HTMLInputStream(fd)
+            self.assertEquals(stream.charEncoding, ("iso8859-2", "tentative"))
+            self.assertEquals(stream.charsUntil('x'),
+                              u'<meta charset="iso-8859-2">' + u"\u0105" * 20000)
+            os.close(fd)
+        finally:
+            os.remove(path)
+
+    def test_mapped_file_windows(self):
+        data = "".join([chr(i % 251) for i in xrange(200000)])
+        path = self.writeTempFile(data)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            f = MappedFile(fd, len(data))
+            os.close(fd)
+            f.windowSize = f.granularity
+            self.assertEquals(f.read(10), data[:10])
+            self.assertEquals(f.read(f.granularity * 2),
+                              data[10:10 + f.granularity * 2])
+            f.seek(5)
+            self.assertEquals(f.tell(), 5)
+            self.assertEquals(f.read(), data[5:])
+            self.assertEquals(f.read(10), "")
+            f.close()
+        finally:
+            os.remove(path)
+
+    def test_change_encoding(self):
+        # The text read so far is the same in both encodings, so the rest of
+        # the chunk is decoded again rather than going back to the start
+        data = "<!--" + "x" * 600 + "--><meta>" + u"\u2018".encode('utf-8')
+        stream = HTMLInputStream(data, chardet=False)
+        self.assertEquals(stream.charEncoding, ('windows-1252', 'tentative'))
+        self.assertEquals(len(stream.charsUntil(">")), 606)
+        stream.char()
+        stream.changeEncoding("utf-8")
+        self.assertEquals(stream.charEncoding, ('utf-8', 'certain'))
+        self.assertEquals(stream.charsUntil(">"), u"<meta")
+        stream.char()
+        self.assertEquals(stream.char(), u"\u2018")
+        self.assertEquals(stream.char(), EOF)
+
+    def test_change_encoding_reparse(self):
+        data = "\xfe<!--" + "x" * 600 + "--><meta>\xfe"
+        stream = HTMLInputStream(data, chardet=False)
+        stream.charsUntil(">")
+        stream.char()
+        self.assertRaises(ReparseException, stream.changeEncoding,
+                          "iso-8859-2")
+        self.assertEquals(stream.charEncoding, ('iso8859-2', 'certain'))
+        self.assertEquals(stream.char(), u"\u0163")
+
+    def test_charset_detector(self):
+        samples = []
+        class Detector(CharsetDetector):
+            def detect(self, sample):
+                samples.append(sample)
+                return "ISO-8859-2"
+        detector = Detector(sampleSize=100)
+        data = "\xfe" * 1000
+        stream = HTMLInputStream(data, chardet=detector)
+        self.assertEquals(stream.charEncoding, ("iso8859-2", "tentative"))
+        self.assertEquals(stream.char(), u"\u0163")
+        self.assertEquals(samples, ["\xfe" * 100])
+        # Guesses for an origin are only made once
+        for i in range(3):
+            stream = HTMLInputStream(data, chardet=detector.forOrigin("a"))
+            self.assertEquals(stream.charEncoding[0], "iso8859-2")
+        self.assertEquals(len(samples), 2)
+        HTMLInputStream(data, chardet=detector.forOrigin("b"))
+        self.assertEquals(len(samples), 3)
+        # A BOM or a meta element means no guess is needed
+        HTMLInputStream(codecs.BOM_UTF8 + data, chardet=detector)
+        HTMLInputStream("<meta charset=utf-8>" + data, chardet=detector)
+        self.assertEquals(len(samples), 3)
+
+    def test_charset_detector_ascii(self):
+        # An ASCII guess from the start of the document is no guess at all
+        class Detector(CharsetDetector):
+            def detect(self, sample):
+                return "ascii"
+        data = "<script>" + "x" * 100 + "</script>caf\xc3\xa9"
+        stream = HTMLInputStream(data, chardet=Detector(sampleSize=100))
+        self.assertEquals(stream.charEncoding,
+                          ("windows-1252", "tentative"))
+        self.assertEquals(stream.charsUntil("\x00"),
+                          data.decode("windows-1252"))
+
+    def test_empty_file(self):
+        path = self.writeTempFile("")
+        try:
+            f = open(path, "rb")
+            stream = HTMLInputStream(f)
+            self.assertEquals(stream.char(), EOF)
+            f.close()
+        finally:
+            os.remove(path)
+
+class HTMLPushInputStreamTest(unittest.TestCase):
+
+    def test_need_more_data(self):
+        stream = HTMLPushInputStream(encoding='utf-8')
+        stream.feed("ab")
+        stream.mark()
+        self.assertEquals(stream.charsUntil('b'), u"a")
+        self.assertEquals(stream.char(), u"b")
+        self.assertRaises(NeedMoreData, stream.char)
+        stream.rewind()
+        self.assertEquals(stream.position(), (1, 0))
+        stream.feed("c")
+        self.assertRaises(NeedMoreData, stream.charsUntil, 'x')
+        stream.rewind()
+        stream.close()
+        self.assertEquals(stream.charsUntil('x'), u"abc")
+        self.assertEquals(stream.position(), (1, 3))
+        self.assertEquals(stream.char(), EOF)
+
+    def test_split_crlf(self):
+        stream = HTMLPushInputStream(encoding='utf-8')
+        stream.feed("a\r")
+        stream.feed("\nb\r")
+        stream.feed("\r\n")
+        stream.close()
+        self.assertEquals(stream.charsUntil('x'), u"a\nb\n\n")
+        self.assertEquals(stream.position(), (4, 0))
+
+    def test_split_utf8(self):
+        stream = HTMLPushInputStream(encoding='utf-8')
+        for byte in u"\u2018a".encode('utf-8'):
+            stream.feed(byte)
+        stream.close()
+        self.assertEquals(stream.charsUntil('x'), u"\u2018a")
+
+    def test_detect_encoding(self):
+        stream = HTMLPushInputStream()
+        stream.feed(codecs.BOM_UTF8)
+        stream.feed(u"\u2018".encode('utf-8'))
+        self.assertRaises(NeedMoreData, stream.char)
+        stream.close()
+        self.assertEquals(stream.charEncoding, ('utf-8', 'certain'))
+        self.assertEquals(stream.char(), u"\u2018")
+
+    def test_text_run(self):
+        stream = HTMLPushInputStream()
+        stream.feed(u"ab cd ef")
+        self.assertEquals(stream.textRun('<'), u"ab cd ")
+        self.assertEquals(stream.position(), (1, 6))
+        stream.feed(u"g<")
+        self.assertEquals(stream.textRun('<'), u"efg")
+
+    def test_raw_data_limit(self):
+        stream = HTMLPushInputStream(maxRawDataSize=1024)
+        stream.feed("a" * 1000)
+        self.assertEquals(stream.charEncoding[1], 'tentative')
+        self.assertEquals(stream.rawDataSize, 1000)
+        stream.feed("a" * 1000)
+        self.assertEquals(stream.charEncoding[1], 'certain')
+        self.assertEquals(stream.rawDataSize, 0)
+        stream.feed("a" * 1000)
+        self.assertEquals(stream.rawDataSize, 0)
+
 def buildTestSuite():
     return unittest.defaultTestLoader.loadTestsFromName(__name__)
 
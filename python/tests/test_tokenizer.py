@@ -7,11 +7,32 @@ import warnings
 from support import simplejson, html5lib_test_files
 
 from html5lib.tokenizer import HTMLTokenizer
+from html5lib.tabletokenizer import TableDrivenTokenizer
+from html5lib.tokens import dictToken
 from html5lib import constants
 
+class CompactTokenizer(HTMLTokenizer):
+    """Tokenizer in compact mode, with its tuple tokens turned back into dicts
+    for the test parser"""
+    def __init__(self, *args, **kwargs):
+        kwargs["compactTokens"] = True
+        HTMLTokenizer.__init__(self, *args, **kwargs)
+
+    def __iter__(self):
+        for token in HTMLTokenizer.__iter__(self):
+            assert token.__class__ is tuple
+            yield dictToken(token)
+
+#Tokenizer implementations to run the tests against; these must all produce
+#the same token stream
+tokenizerTypes = {"": HTMLTokenizer,
+                  "_table": TableDrivenTokenizer,
+                  "_compact": CompactTokenizer}
+
 class TokenizerTestParser(object):
-    def __init__(self, contentModelFlag, lastStartTag=None):
-        self.tokenizer = HTMLTokenizer
+    def __init__(self, contentModelFlag, lastStartTag=None,
+                 tokenizer=HTMLTokenizer):
+        self.tokenizer = tokenizer
         self._contentModelFlag = constants.contentModelFlags[contentModelFlag]
         self._lastStartTag = lastStartTag
 
@@ -104,7 +125,7 @@ def tokensMatch(expectedTokens, receivedTokens, ignoreErrorOrder):
 
 
 class TestCase(unittest.TestCase):
-    def runTokenizerTest(self, test):
+    def runTokenizerTest(self, test, tokenizer=HTMLTokenizer):
         #XXX - move this out into the setup function
         #concatenate all consecutive character tokens into a single token
         output = concatenateCharacterTokens(test['output'])
@@ -114,7 +135,7 @@ class TestCase(unittest.TestCase):
         stdout = sys.stdout
         sys.stdout = outBuffer
         parser = TokenizerTestParser(test['contentModelFlag'], 
-                                     test['lastStartTag'])
+                                     test['lastStartTag'], tokenizer)
         tokens = parser.parse(test['input'])
         tokens = concatenateCharacterTokens(tokens)
         tokens = normalizeTokens(tokens)
@@ -146,11 +167,13 @@ def buildTestSuite():
                     test["contentModelFlags"] = ["PCDATA"]
                 for contentModelFlag in test["contentModelFlags"]:
                     test["contentModelFlag"] = contentModelFlag
-                    def testFunc(self, test=test):
-                        self.runTokenizerTest(test)
-                    testFunc.__doc__ = "\t".join([testName, 
-                                                  test['description']])
-                    setattr(TestCase, 'test_%s_%d' % (testName, index), testFunc)
+                    for suffix, tokenizer in tokenizerTypes.iteritems():
+                        def testFunc(self, test=test, tokenizer=tokenizer):
+                            self.runTokenizerTest(test, tokenizer)
+                        testFunc.__doc__ = "\t".join([testName, 
+                                                      test['description']])
+                        setattr(TestCase, 'test_%s_%d%s' % (testName, index,
+                                                            suffix), testFunc)
     return unittest.TestLoader().loadTestsFromTestCase(TestCase)
 
 def main():
@@ -42,6 +42,8 @@ def PullDOMAdapter(node):
 treeTypes = {
 "simpletree":  {"builder": treebuilders.getTreeBuilder("simpletree"),
                 "walker":  treewalkers.getTreeWalker("simpletree")},
+"compact":     {"builder": treebuilders.getTreeBuilder("compact"),
+                "walker":  treewalkers.getTreeWalker("compact")},
 "DOM":         {"builder": treebuilders.getTreeBuilder("dom"),
                 "walker":  treewalkers.getTreeWalker("dom")},
 "PullDOM":     {"builder": treebuilders.getTreeBuilder("dom"),